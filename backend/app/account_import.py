@@ -0,0 +1,293 @@
+"""
+Streaming bulk import of warming accounts.
+
+Rows are parsed incrementally from CSV (email,password) or plain text
+(email:password) and processed in chunks: one IN query per chunk finds
+existing emails, Outlook tokens are fetched in parallel (oauth2_service),
+and the chunk is written with a single INSERT ... ON CONFLICT DO NOTHING and
+committed. Memory use is bounded by the chunk size, not the file size.
+
+Imports run as RQ jobs (tasks.import_accounts_task). The API and the worker
+run in separate containers, so the API stores the upload zlib-compressed in
+Redis (store_upload) and the job streams it back (iter_upload_lines).
+"""
+
+import codecs
+import csv
+import os
+import uuid
+import zlib
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Optional
+
+import redis
+from sqlalchemy.orm import Session
+
+from .email_service import PROVIDER_SETTINGS
+from .models import AuthTypeEnum, ProviderEnum, WarmingAccount
+from .oauth2_service import detect_provider, fetch_outlook_tokens
+
+IMPORT_CHUNK = int(os.environ.get("IMPORT_CHUNK", "1000"))
+# Per-line error messages kept in the result; all failures are still counted
+IMPORT_MAX_ERRORS = int(os.environ.get("IMPORT_MAX_ERRORS", "1000"))
+# Uploads not picked up by a worker within this time are dropped
+IMPORT_UPLOAD_TTL = int(os.environ.get("IMPORT_UPLOAD_TTL", str(24 * 3600)))
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+UPLOAD_KEY_PREFIX = "warming:import"
+_READ_SIZE = 1 << 20
+
+redis_conn = redis.from_url(REDIS_URL)
+
+
+class ImportRow:
+    __slots__ = ("label", "email", "password", "error")
+
+    def __init__(self, label: str, email: str = "", password: Optional[str] = None, error: Optional[str] = None):
+        self.label = label
+        self.email = email
+        self.password = password
+        self.error = error
+
+
+# ── Parsers ──────────────────────────────────────────────────────────────────
+
+def iter_csv_rows(lines: Iterable[str]) -> Iterator[ImportRow]:
+    """Rows of a CSV with an email and optional password column."""
+    for i, row in enumerate(csv.DictReader(lines)):
+        label = f"Zeile {i+2}"
+        email = (row.get("email") or "").strip()
+        if not email:
+            yield ImportRow(label, error=f"{label}: Email fehlt")
+            continue
+        yield ImportRow(label, email, (row.get("password") or "").strip() or None)
+
+
+def iter_text_rows(lines: Iterable[str]) -> Iterator[ImportRow]:
+    """Rows of email:password lines; empty lines and # comments are skipped."""
+    for i, raw_line in enumerate(lines):
+        label = f"Zeile {i+1}"
+        line = raw_line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        if ":" not in line:
+            yield ImportRow(label, error=f"{label}: Format ungültig, erwartet email:password")
+            continue
+
+        email, password = line.split(":", 1)
+        email = email.strip()
+        if not email or "@" not in email:
+            yield ImportRow(label, error=f"{label}: Ungültige Email")
+            continue
+        yield ImportRow(label, email, password.strip() or None)
+
+
+# ── Upload storage ───────────────────────────────────────────────────────────
+
+def store_upload(chunks: Iterable[bytes]) -> str:
+    """Compress chunks into a Redis key chunk by chunk. Returns the key."""
+    key = f"{UPLOAD_KEY_PREFIX}:{uuid.uuid4().hex}"
+    compressor = zlib.compressobj()
+    redis_conn.set(key, b"", ex=IMPORT_UPLOAD_TTL)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            redis_conn.append(key, data)
+    redis_conn.append(key, compressor.flush())
+    return key
+
+
+def iter_file_chunks(fileobj) -> Iterator[bytes]:
+    while True:
+        chunk = fileobj.read(_READ_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_upload_lines(key: str, encoding: str = "utf-8") -> Iterator[str]:
+    """Decompress and decode a stored upload, yielding lines with their endings."""
+    size = redis_conn.strlen(key)
+    if not size and not redis_conn.exists(key):
+        raise ValueError("Upload nicht gefunden oder abgelaufen")
+
+    decompressor = zlib.decompressobj()
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    pending = ""
+    for start in range(0, size, _READ_SIZE):
+        data = redis_conn.getrange(key, start, min(start + _READ_SIZE, size) - 1)
+        pending += decoder.decode(decompressor.decompress(data))
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(decompressor.flush(), final=True)
+    if pending:
+        yield pending
+
+
+def delete_upload(key: str) -> None:
+    redis_conn.delete(key)
+
+
+# ── Importer ─────────────────────────────────────────────────────────────────
+
+def _account_values(row: ImportRow, auto_oauth2: bool) -> dict:
+    """Column values for a new account, with provider autodetection and defaults."""
+    provider_val = detect_provider(row.email)
+
+    if provider_val == "gmail":
+        auth_type_val = "app_password"
+    elif provider_val == "outlook" and auto_oauth2:
+        auth_type_val = "oauth2"
+    else:
+        auth_type_val = "password"
+
+    defaults = PROVIDER_SETTINGS.get(provider_val, {})
+    return {
+        "email": row.email,
+        "password": row.password,
+        "provider": ProviderEnum(provider_val),
+        "auth_type": AuthTypeEnum(auth_type_val),
+        "smtp_host": defaults.get("smtp_host", ""),
+        "smtp_port": defaults.get("smtp_port", 587),
+        "imap_host": defaults.get("imap_host", ""),
+        "imap_port": defaults.get("imap_port", 993),
+        "oauth2_access_token": None,
+        "oauth2_refresh_token": None,
+        "oauth2_token_expiry": None,
+        "active": True,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def _insert_ignoring_duplicates(db: Session, values: list[dict]) -> set[str]:
+    """Bulk INSERT ... ON CONFLICT (email) DO NOTHING. Returns the emails inserted."""
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    stmt = (
+        insert(WarmingAccount)
+        .values(values)
+        .on_conflict_do_nothing(index_elements=["email"])
+        .returning(WarmingAccount.email)
+    )
+    return set(db.execute(stmt).scalars())
+
+
+class AccountImporter:
+    """
+    Feed rows with add(); chunks are written as they fill up. finish() writes
+    the rest and returns the summary:
+    {"processed", "created", "failed", "oauth2_tokens_fetched", "errors"}.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        auto_oauth2: bool,
+        chunk_size: int = IMPORT_CHUNK,
+        on_progress: Optional[Callable[[dict], None]] = None,
+    ):
+        self.db = db
+        self.auto_oauth2 = auto_oauth2
+        self.chunk_size = chunk_size
+        self.on_progress = on_progress
+        self.chunk: list[ImportRow] = []
+        self.summary = {"processed": 0, "created": 0, "failed": 0, "oauth2_tokens_fetched": 0, "errors": []}
+
+    def _error(self, message: str) -> None:
+        self.summary["failed"] += 1
+        if len(self.summary["errors"]) < IMPORT_MAX_ERRORS:
+            self.summary["errors"].append(message)
+
+    def add(self, row: ImportRow) -> None:
+        self.summary["processed"] += 1
+        if row.error:
+            self._error(row.error)
+            return
+        self.chunk.append(row)
+        if len(self.chunk) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        chunk, self.chunk = self.chunk, []
+        if chunk:
+            self._write_chunk(chunk)
+        if self.on_progress:
+            self.on_progress({k: v for k, v in self.summary.items() if k != "errors"})
+
+    def _write_chunk(self, chunk: list[ImportRow]) -> None:
+        existing = {
+            email for (email,) in self.db.query(WarmingAccount.email).filter(
+                WarmingAccount.email.in_({row.email for row in chunk})
+            )
+        }
+
+        values: list[dict] = []
+        rows: list[ImportRow] = []
+        seen: set[str] = set()
+        for row in chunk:
+            if row.email in existing or row.email in seen:
+                self._error(f"{row.label}: {row.email} existiert bereits")
+                continue
+            seen.add(row.email)
+            try:
+                values.append(_account_values(row, self.auto_oauth2))
+            except Exception as e:
+                self._error(f"{row.label}: {e}")
+                continue
+            rows.append(row)
+
+        # Outlook: trade the password for OAuth2 tokens, in parallel
+        if self.auto_oauth2:
+            wanted = [
+                (i, v["email"], v["password"])
+                for i, v in enumerate(values)
+                if v["provider"] == ProviderEnum.outlook and v["password"]
+            ]
+            failed: set[int] = set()
+            for i, tok, error in fetch_outlook_tokens(wanted):
+                if error:
+                    failed.add(i)
+                    self._error(f"{rows[i].label}: OAuth2 für {rows[i].email} fehlgeschlagen – {error}")
+                else:
+                    values[i].update(
+                        oauth2_access_token=tok["access_token"],
+                        oauth2_refresh_token=tok["refresh_token"],
+                        oauth2_token_expiry=tok["token_expiry"],
+                        auth_type=AuthTypeEnum.oauth2,
+                        password=None,
+                    )
+            self.summary["oauth2_tokens_fetched"] += len(wanted) - len(failed)
+            rows = [row for i, row in enumerate(rows) if i not in failed]
+            values = [v for i, v in enumerate(values) if i not in failed]
+
+        if not values:
+            return
+        inserted = _insert_ignoring_duplicates(self.db, values)
+        self.db.commit()
+        self.summary["created"] += len(inserted)
+        for row in rows:
+            if row.email not in inserted:
+                # Created concurrently since the IN query
+                self._error(f"{row.label}: {row.email} existiert bereits")
+
+    def finish(self) -> dict:
+        self.flush()
+        return self.summary
+
+
+def import_accounts(
+    db: Session,
+    rows: Iterable[ImportRow],
+    auto_oauth2: bool,
+    on_progress: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """Import parsed rows chunk by chunk. See AccountImporter for the summary."""
+    importer = AccountImporter(db, auto_oauth2, on_progress=on_progress)
+    for row in rows:
+        importer.add(row)
+    return importer.finish()
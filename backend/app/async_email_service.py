@@ -0,0 +1,366 @@
+"""
+asyncio transport for SMTP/IMAP, built on asyncio streams and ssl.
+
+Async counterparts of send_email, reply_to_email, check_inbox_for_message,
+sync_mailbox, find_message and mark_as_read in email_service, so one process can keep
+hundreds of provider conversations in flight (see async_worker.py).
+Message building, header parsing and OAuth2 handling are shared with
+email_service; only the wire protocol differs.
+"""
+
+import asyncio
+import base64
+import random
+import re
+import socket
+import ssl
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from .async_imap import AsyncImapClient, ImapError
+from .email_service import (
+    _FETCH_CHUNK,
+    _FETCH_HEADERS,
+    _MESSAGE_FIELDS,
+    HEADER_SEARCH_FALLBACK_LIMIT,
+    REPLY_BODIES,
+    WARMING_BODIES,
+    WARMING_SUBJECTS,
+    _build_message,
+    _build_xoauth2_string,
+    _header_search_unsupported,
+    _imap_quote,
+    _no_header_search,
+    _parse_header_fetch,
+    _reply_subject,
+    get_valid_access_token,
+)
+from .rate_limiter import connection_lease, release
+
+_EOL_RE = re.compile(rb"\r\n|\n|\r(?!\n)")
+_DOT_RE = re.compile(rb"(?m)^\.")
+
+
+class SmtpError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+# ── SMTP client ──────────────────────────────────────────────────────────────
+
+class AsyncSmtpClient:
+    """
+    Minimal async SMTP client. Port 465 uses implicit TLS, anything else
+    upgrades with STARTTLS (mirrors email_service._get_smtp).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 587,
+        timeout: float = 30.0,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        use_ssl: bool = True,
+    ):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.ssl_context = (ssl_context or ssl.create_default_context()) if use_ssl else None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.features: dict[str, str] = {}
+
+    async def _read_reply(self) -> tuple[int, str]:
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            if not line:
+                raise SmtpError(421, f"Connection to {self.host} closed")
+            lines.append(line[4:].rstrip(b"\r\n").decode(errors="replace"))
+            if line[3:4] != b"-":
+                return int(line[:3]), "\n".join(lines)
+
+    async def command(self, line: str, expect: tuple = (250,)) -> tuple[int, str]:
+        self.writer.write(line.encode() + b"\r\n")
+        await self.writer.drain()
+        code, message = await self._read_reply()
+        if code not in expect:
+            raise SmtpError(code, message)
+        return code, message
+
+    async def ehlo(self) -> None:
+        _, message = await self.command(f"EHLO {socket.getfqdn()}")
+        self.features = {}
+        for feature in message.split("\n")[1:]:
+            name, _, params = feature.partition(" ")
+            self.features[name.upper()] = params
+
+    async def connect(self) -> None:
+        implicit_tls = self.port == 465 and self.ssl_context is not None
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host, self.port,
+                ssl=self.ssl_context if implicit_tls else None,
+                server_hostname=self.host if implicit_tls else None,
+            ),
+            self.timeout,
+        )
+        code, message = await self._read_reply()
+        if code != 220:
+            raise SmtpError(code, message)
+        await self.ehlo()
+        if self.ssl_context is not None and not implicit_tls:
+            await self.command("STARTTLS", expect=(220,))
+            await self.writer.start_tls(self.ssl_context, server_hostname=self.host)
+            await self.ehlo()
+
+    async def login(self, user: str, password: str) -> None:
+        methods = self.features.get("AUTH", "").upper().split()
+        if "PLAIN" in methods or not methods:
+            token = base64.b64encode(f"\0{user}\0{password}".encode()).decode()
+            await self.command(f"AUTH PLAIN {token}", expect=(235,))
+        else:
+            await self.command("AUTH LOGIN", expect=(334,))
+            await self.command(base64.b64encode(user.encode()).decode(), expect=(334,))
+            await self.command(base64.b64encode(password.encode()).decode(), expect=(235,))
+
+    async def authenticate_xoauth2(self, xoauth2: str) -> None:
+        code, message = await self.command(f"AUTH XOAUTH2 {xoauth2}", expect=(235, 334))
+        if code == 334:
+            # Error challenge: acknowledge it to get the final failure reply
+            code, message = await self.command("", expect=(235,))
+
+    async def sendmail(self, from_addr: str, to_addrs: list[str], data: bytes) -> None:
+        await self.command(f"MAIL FROM:<{from_addr}>")
+        for addr in to_addrs:
+            await self.command(f"RCPT TO:<{addr}>", expect=(250, 251))
+        await self.command("DATA", expect=(354,))
+        data = _DOT_RE.sub(b"..", _EOL_RE.sub(b"\r\n", data))
+        if not data.endswith(b"\r\n"):
+            data += b"\r\n"
+        self.writer.write(data + b".\r\n")
+        await self.writer.drain()
+        code, message = await self._read_reply()
+        if code != 250:
+            raise SmtpError(code, message)
+
+    async def quit(self) -> None:
+        try:
+            await self.command("QUIT", expect=(221,))
+        except Exception:
+            pass
+        finally:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+
+
+async def _xoauth2_for(account) -> str:
+    # Token refresh is blocking HTTP; keep it off the event loop
+    token = await asyncio.to_thread(get_valid_access_token, account)
+    return _build_xoauth2_string(account.email, token)
+
+
+@asynccontextmanager
+async def _connection(host: str):
+    """Hold a rate_limiter connection lease for host (raises RateLimited at the limit)."""
+    lease = await asyncio.to_thread(connection_lease, host)
+    try:
+        yield
+    finally:
+        await asyncio.to_thread(release, lease)
+
+
+@asynccontextmanager
+async def smtp_session(account):
+    """Open an authenticated async SMTP session for an account."""
+    async with _connection(account.smtp_host):
+        client = AsyncSmtpClient(account.smtp_host, account.smtp_port)
+        await client.connect()
+        try:
+            if account.auth_type == "oauth2":
+                await client.authenticate_xoauth2(await _xoauth2_for(account))
+            else:
+                await client.login(account.email, account.password or "")
+            yield client
+        finally:
+            await client.quit()
+
+
+# ── IMAP session ─────────────────────────────────────────────────────────────
+
+@asynccontextmanager
+async def imap_session(account):
+    """Open an authenticated async IMAP session with INBOX selected."""
+    async with _connection(account.imap_host):
+        client = AsyncImapClient(account.imap_host, account.imap_port)
+        await client.connect()
+        try:
+            if account.auth_type == "oauth2":
+                await client.authenticate_xoauth2(await _xoauth2_for(account))
+            else:
+                await client.login(account.email, account.password or "")
+            await client.select("INBOX")
+            yield client
+        finally:
+            await client.logout()
+
+
+@asynccontextmanager
+async def _imap_or_session(account, imap: Optional[AsyncImapClient]):
+    if imap is not None:
+        yield imap
+    else:
+        async with imap_session(account) as client:
+            yield client
+
+
+# ── Core email operations ────────────────────────────────────────────────────
+
+async def _deliver(account, msg) -> None:
+    async with smtp_session(account) as smtp:
+        await smtp.sendmail(account.email, [msg.to], msg.data)
+
+
+async def send_email(account, to_email: str, subject: str, body: str) -> str:
+    """Send email via SMTP. Returns message-id."""
+    msg = _build_message(account, to_email, subject, body)
+    await _deliver(account, msg)
+    return msg.message_id
+
+
+async def send_random_warming_email(account, to_email: str) -> tuple[str, str]:
+    """Send a random warming email. Returns (subject, message_id)."""
+    subject = random.choice(WARMING_SUBJECTS)
+    body = random.choice(WARMING_BODIES)
+    message_id = await send_email(account, to_email, subject, body)
+    return subject, message_id
+
+
+async def reply_to_email(account, original_subject: str, original_message_id: str, to_email: str) -> str:
+    """Send a reply to an email. Returns new message-id."""
+    body = random.choice(REPLY_BODIES)
+    msg = _build_message(
+        account, to_email, _reply_subject(original_subject), body, in_reply_to=original_message_id,
+    )
+    await _deliver(account, msg)
+    return msg.message_id
+
+
+async def check_inbox_for_message(
+    account,
+    search_criteria: str = "UNSEEN",
+    imap: Optional[AsyncImapClient] = None,
+    limit: int = 20,
+) -> list[dict]:
+    """Check IMAP inbox for messages matching criteria. Returns message dicts keyed by UID."""
+    try:
+        async with _imap_or_session(account, imap) as client:
+            uids = (await client.uid_search(search_criteria))[-limit:]
+            if not uids:
+                return []
+            data = await client.uid_fetch(",".join(str(u) for u in uids), _FETCH_HEADERS)
+            return _parse_header_fetch(data)
+    except Exception as e:
+        raise RuntimeError(f"IMAP error for {account.email}: {e}")
+
+
+async def sync_mailbox(
+    account,
+    cursor,
+    search_criteria: str = "UNSEEN",
+    imap: Optional[AsyncImapClient] = None,
+    limit: int = 200,
+) -> list[dict]:
+    """Async email_service.sync_mailbox: headers of messages above the cursor, advancing it in place."""
+    try:
+        async with _imap_or_session(account, imap) as client:
+            status = await client.select("INBOX", condstore=True)
+            uidvalidity = status["uidvalidity"]
+            uidnext = status["uidnext"]
+            modseq = status["highestmodseq"]
+
+            if cursor.uidvalidity is None or cursor.uidvalidity != uidvalidity:
+                uids = (await client.uid_search(search_criteria))[-limit:]
+                cursor.uidvalidity = uidvalidity
+                cursor.last_uid = 0
+            elif modseq is not None and modseq == cursor.highest_modseq:
+                return []
+            elif uidnext is not None and uidnext - 1 <= (cursor.last_uid or 0):
+                cursor.highest_modseq = modseq
+                return []
+            else:
+                last_uid = cursor.last_uid or 0
+                # "n:*" always matches the highest UID, even when it is below n
+                uids = [u for u in await client.uid_search(f"UID {last_uid + 1}:*", search_criteria) if u > last_uid]
+
+            messages = []
+            for i in range(0, len(uids), _FETCH_CHUNK):
+                chunk = ",".join(str(u) for u in uids[i:i + _FETCH_CHUNK])
+                messages.extend(_parse_header_fetch(await client.uid_fetch(chunk, _FETCH_HEADERS)))
+
+            highest = max(uids + [cursor.last_uid or 0])
+            if uidnext is not None:
+                highest = max(highest, uidnext - 1)
+            cursor.last_uid = highest
+            cursor.highest_modseq = modseq
+            return messages
+    except Exception as e:
+        raise RuntimeError(f"IMAP error for {account.email}: {e}")
+
+
+async def find_message(
+    account,
+    header: str,
+    value: str,
+    imap: Optional[AsyncImapClient] = None,
+) -> Optional[dict]:
+    """Async find_message: UID SEARCH HEADER with a bounded UNSEEN scan as fallback."""
+    field = _MESSAGE_FIELDS[header.lower()]
+    async with _imap_or_session(account, imap) as client:
+        if account.imap_host not in _no_header_search:
+            try:
+                uids = await client.uid_search("HEADER", header, _imap_quote(value))
+            except ImapError as e:
+                if e.status is None:
+                    raise
+                if _header_search_unsupported(e.status, str(e)):
+                    _no_header_search.add(account.imap_host)
+            else:
+                if not uids:
+                    return None
+                messages = _parse_header_fetch(await client.uid_fetch(str(uids[-1]), _FETCH_HEADERS))
+                return messages[-1] if messages else None
+
+        messages = await check_inbox_for_message(
+            account, "UNSEEN", imap=client, limit=HEADER_SEARCH_FALLBACK_LIMIT,
+        )
+    for msg in reversed(messages):
+        if value in msg.get(field, ""):
+            return msg
+    return None
+
+
+async def mark_as_read(account, uid: str, imap: Optional[AsyncImapClient] = None) -> None:
+    """Mark an email as read via IMAP. uid is an IMAP UID."""
+    async with _imap_or_session(account, imap) as client:
+        await client.uid_store(uid, "+FLAGS", "(\\Seen)")
+
+
+# ── Task runner ──────────────────────────────────────────────────────────────
+
+async def run_concurrently(coros, limit: int = 200) -> list:
+    """
+    Run coroutines with at most `limit` in flight. Returns results in input
+    order; a failed coroutine yields its exception instead of a result.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _bounded(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(_bounded(c) for c in coros), return_exceptions=True)
@@ -0,0 +1,221 @@
+"""
+Minimal asyncio IMAP4rev1 client built on asyncio streams and ssl.
+Covers what the IDLE listener and the async transport need:
+LOGIN / AUTHENTICATE XOAUTH2, CAPABILITY, SELECT, UID SEARCH / FETCH / STORE,
+NOOP, IDLE and LOGOUT. Responses are returned in imaplib's shape so the
+parsers in email_service can be shared.
+"""
+
+import asyncio
+import re
+import ssl
+from typing import Optional
+
+_LITERAL_RE = re.compile(rb"\{(\d+)\}\r\n$")
+_CODE_RE = re.compile(rb"\[(UIDVALIDITY|UIDNEXT|HIGHESTMODSEQ) (\d+)\]")
+_EXISTS_RE = re.compile(rb"^\* (\d+) EXISTS")
+
+
+class ImapError(Exception):
+    """NO/BAD response (status) or protocol error (status None)."""
+
+    def __init__(self, message: str, status: Optional[str] = None):
+        super().__init__(message)
+        self.status = status
+
+
+def _quote(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class AsyncImapClient:
+    def __init__(
+        self,
+        host: str,
+        port: int = 993,
+        timeout: float = 30.0,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        use_ssl: bool = True,
+    ):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.ssl_context = (ssl_context or ssl.create_default_context()) if use_ssl else None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.capabilities: set[str] = set()
+        self.status: dict = {}
+        self._tag = 0
+
+    # ── Wire protocol ────────────────────────────────────────────────────────
+
+    async def _read_response(self, timeout: Optional[float] = None) -> tuple[list[bytes], list[bytes]]:
+        """
+        Read one server response. Returns (segments, literals): the line text
+        split around each {n} literal, and the literal payloads themselves.
+        """
+        segments: list[bytes] = []
+        literals: list[bytes] = []
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), timeout or self.timeout)
+            if not line:
+                raise ImapError(f"Connection to {self.host} closed")
+            match = _LITERAL_RE.search(line)
+            if not match:
+                segments.append(line.rstrip(b"\r\n"))
+                return segments, literals
+            segments.append(line[:match.end()].rstrip(b"\r\n"))
+            literals.append(
+                await asyncio.wait_for(self.reader.readexactly(int(match.group(1))), self.timeout)
+            )
+
+    def _next_tag(self) -> bytes:
+        self._tag += 1
+        return b"A%04d" % self._tag
+
+    async def _send(self, data: bytes) -> None:
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def command(self, *args: str, continuation: Optional[bytes] = None) -> list[tuple[list[bytes], list[bytes]]]:
+        """Run a tagged command and return its untagged responses. Raises ImapError unless OK."""
+        tag = self._next_tag()
+        await self._send(tag + b" " + " ".join(args).encode() + b"\r\n")
+        untagged = []
+        while True:
+            segments, literals = await self._read_response()
+            first = segments[0]
+            if first.startswith(b"+"):
+                # Continuation request: send the payload once, then an empty
+                # line to abort (e.g. an XOAUTH2 error challenge).
+                await self._send((continuation or b"") + b"\r\n")
+                continuation = None
+                continue
+            if first.startswith(tag + b" "):
+                status = first[len(tag) + 1:].split(b" ", 1)[0].upper()
+                if status != b"OK":
+                    raise ImapError(f"{args[0]} failed: {first.decode(errors='replace')}", status.decode())
+                untagged.append((segments, literals))
+                return untagged
+            untagged.append((segments, literals))
+
+    # ── Session ──────────────────────────────────────────────────────────────
+
+    async def connect(self) -> None:
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host, self.port,
+                ssl=self.ssl_context,
+                server_hostname=self.host if self.ssl_context else None,
+            ),
+            self.timeout,
+        )
+        segments, _ = await self._read_response()
+        if not (segments[0].startswith(b"* OK") or segments[0].startswith(b"* PREAUTH")):
+            raise ImapError(f"Unexpected greeting: {segments[0].decode(errors='replace')}")
+
+    async def login(self, user: str, password: str) -> None:
+        await self.command("LOGIN", _quote(user), _quote(password))
+        await self.capability()
+
+    async def authenticate_xoauth2(self, xoauth2: str) -> None:
+        """xoauth2 is the base64 string from email_service._build_xoauth2_string."""
+        await self.command("AUTHENTICATE", "XOAUTH2", continuation=xoauth2.encode())
+        await self.capability()
+
+    async def capability(self) -> set[str]:
+        for segments, _ in await self.command("CAPABILITY"):
+            if segments[0].upper().startswith(b"* CAPABILITY "):
+                self.capabilities = set(segments[0][13:].decode().upper().split())
+        return self.capabilities
+
+    async def select(self, mailbox: str = "INBOX", condstore: bool = False) -> dict:
+        """Select mailbox and return uidvalidity, uidnext, highestmodseq and exists."""
+        args = [mailbox, "(CONDSTORE)"] if condstore and "CONDSTORE" in self.capabilities else [mailbox]
+        status = {"uidvalidity": None, "uidnext": None, "highestmodseq": None, "exists": None}
+        for segments, _ in await self.command("SELECT", *args):
+            line = segments[0]
+            code = _CODE_RE.search(line)
+            if code:
+                status[code.group(1).decode().lower()] = int(code.group(2))
+            exists = _EXISTS_RE.match(line)
+            if exists:
+                status["exists"] = int(exists.group(1))
+        self.status = status
+        return status
+
+    async def uid_search(self, *criteria: str) -> list[int]:
+        uids: list[int] = []
+        for segments, _ in await self.command("UID", "SEARCH", *criteria):
+            if segments[0].upper().startswith(b"* SEARCH"):
+                uids.extend(int(u) for u in segments[0][8:].split())
+        return uids
+
+    async def uid_fetch(self, message_set: str, items: str) -> list:
+        """UID FETCH, returning data shaped like imaplib's (meta, literal) tuples."""
+        data: list = []
+        for segments, literals in await self.command("UID", "FETCH", message_set, items):
+            if not segments[0].startswith(b"* ") or b"FETCH" not in segments[0]:
+                continue
+            if not literals:
+                data.append(segments[0])
+                continue
+            for meta, literal in zip(segments, literals):
+                data.append((meta, literal))
+            data.append(segments[-1])
+        return data
+
+    async def uid_store(self, message_set: str, command: str, flags: str) -> None:
+        await self.command("UID", "STORE", message_set, command, flags)
+
+    async def noop(self) -> None:
+        await self.command("NOOP")
+
+    async def idle(self, timeout: float) -> list[bytes]:
+        """
+        Enter IDLE until the server pushes an untagged update or timeout
+        expires, then send DONE. Returns the untagged lines received.
+        """
+        tag = self._next_tag()
+        await self._send(tag + b" IDLE\r\n")
+        events: list[bytes] = []
+        while True:
+            segments, _ = await self._read_response()
+            if segments[0].startswith(b"+"):
+                break
+            if segments[0].startswith(tag + b" "):
+                raise ImapError(f"IDLE rejected: {segments[0].decode(errors='replace')}")
+            events.append(segments[0])
+
+        if not events:
+            try:
+                segments, _ = await self._read_response(timeout)
+                events.append(segments[0])
+            except asyncio.TimeoutError:
+                pass
+
+        await self._send(b"DONE\r\n")
+        while True:
+            segments, _ = await self._read_response()
+            if segments[0].startswith(tag + b" "):
+                if b" OK" not in segments[0][:len(tag) + 4].upper():
+                    raise ImapError(f"IDLE failed: {segments[0].decode(errors='replace')}")
+                return events
+            events.append(segments[0])
+
+    async def logout(self) -> None:
+        try:
+            await self.command("LOGOUT")
+        except Exception:
+            pass
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+            self.writer = None
@@ -0,0 +1,415 @@
+"""
+asyncio worker for the conversation tasks.
+Run with: python -m app.async_worker
+
+Runs send_warming_email, check_domain_inbox and check_warming_account_inbox
+on the async transport (async_email_service), with up to
+ASYNC_WORKER_CONCURRENCY conversations in flight per process, instead of
+one blocking conversation per RQ worker. Tasks are routed here by
+tasks.enqueue_warming_task when ASYNC_WORKER=1. What the tasks log and
+schedule next is shared with the RQ tasks (conversation.py).
+
+A payload is moved (BLMOVE) from the ready list into this worker's
+processing list and removed from there only once its task has finished,
+so a crash, deploy or SIGTERM does not lose it: on SIGTERM the worker lets
+running tasks finish for ASYNC_SHUTDOWN_GRACE seconds and puts the rest
+back; the processing list of a worker that died is put back by the next
+worker to start or by any live worker once its heartbeat is stale. A
+payload can therefore run twice, never zero times.
+
+Delayed payloads, retries included, wait on the release wheel
+(release_scheduler.schedule_async) and are pushed to the ready list when
+due by the scheduler's release_due.
+
+Failed inbox checks are retried ASYNC_TASK_RETRIES times with backoff; a
+failed send is not, since the message may have gone out. Payloads that
+fail for good are kept in ASYNC_FAILED_KEY with their error.
+
+Queue layout in Redis (see tasks.py):
+  ASYNC_READY_KEY               list of JSON payloads ready to run
+  warming:async:processing:<id> payloads taken by worker <id>
+  warming:async:workers         sorted set of worker ids scored by heartbeat
+  warming:async:failed          failed payloads with error, newest first
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import time
+from datetime import datetime
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from . import async_email_service as aes
+from .rate_limiter import RateLimited, imap_limits, release, smtp_limits
+from .release_scheduler import schedule_async
+from .tasks import ASYNC_READY_KEY, ASYNC_SCHEDULED_KEY, REDIS_URL, enqueue_warming_task
+
+ASYNC_WORKER_CONCURRENCY = int(os.environ.get("ASYNC_WORKER_CONCURRENCY", "200"))
+# hostname:pid stays the same when a container restarts (pid 1), so the
+# restarted worker picks up its own processing list at once
+ASYNC_WORKER_ID = os.environ.get("ASYNC_WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+ASYNC_WORKER_HEARTBEAT = int(os.environ.get("ASYNC_WORKER_HEARTBEAT", "30"))
+ASYNC_SHUTDOWN_GRACE = int(os.environ.get("ASYNC_SHUTDOWN_GRACE", "25"))
+ASYNC_TASK_RETRIES = int(os.environ.get("ASYNC_TASK_RETRIES", "2"))
+ASYNC_RETRY_DELAY = int(os.environ.get("ASYNC_RETRY_DELAY", "300"))
+ASYNC_FAILED_KEEP = int(os.environ.get("ASYNC_FAILED_KEEP", "10000"))
+
+PROCESSING_PREFIX = "warming:async:processing"
+WORKERS_KEY = "warming:async:workers"
+ASYNC_FAILED_KEY = "warming:async:failed"
+
+# Tasks that are safe to run again after a failure
+RETRY_TASKS = {"check_domain_inbox", "check_warming_account_inbox"}
+
+logger = logging.getLogger(__name__)
+
+
+
+# ── Database side (runs in worker threads) ──────────────────────────────────
+
+def _load(*keys) -> list:
+    """Load rows by (model, id) and detach them so the event loop can read them."""
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        rows = [db.get(model, row_id) for model, row_id in keys]
+        for row in rows:
+            if row is not None:
+                db.expunge(row)
+        return rows
+    finally:
+        db.close()
+
+
+def _with_db(func, *args, merge=None):
+    """
+    Call a conversation helper with a fresh session. merge is a detached
+    account whose changes (a refreshed OAuth2 token) are saved along.
+    """
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if merge is not None:
+            db.merge(merge)
+        return func(db, *args)
+    finally:
+        db.close()
+
+
+async def _reschedule(task_name: str, args: tuple, error: RateLimited) -> None:
+    await asyncio.to_thread(
+        enqueue_warming_task, task_name, *args,
+        delay_seconds=int(error.retry_after) + random.randint(1, 30),
+    )
+
+
+async def _take_slot(task_name: str, args: tuple, limits: tuple):
+    """Async tasks._take_slot: a rate_limiter lease, or None after rescheduling."""
+    from .rate_limiter import acquire
+
+    try:
+        return await asyncio.to_thread(acquire, *limits)
+    except RateLimited as e:
+        await _reschedule(task_name, args, e)
+        return None
+
+
+# ── Async task implementations (mirror tasks.py) ────────────────────────────
+
+async def send_warming_email(warming_account_id: int, domain_email_id: int, campaign_id: int):
+    from .conversation import record_send_error, record_sent, schedule_domain_check
+    from .models import DomainEmail, WarmingAccount
+
+    try:
+        account, domain_email = await asyncio.to_thread(
+            _load, (WarmingAccount, warming_account_id), (DomainEmail, domain_email_id),
+        )
+        if not account or not domain_email:
+            return {"error": "Account or domain email not found"}
+
+        lease = await _take_slot(
+            "send_warming_email", (warming_account_id, domain_email_id, campaign_id), smtp_limits(account),
+        )
+        if lease is None:
+            return {"status": "rescheduled"}
+        try:
+            subject, message_id = await aes.send_random_warming_email(account, domain_email.email)
+        finally:
+            await asyncio.to_thread(release, lease)
+
+        log_id = await asyncio.to_thread(
+            _with_db, record_sent, campaign_id, warming_account_id, domain_email_id, subject, message_id,
+            merge=account,
+        )
+        await asyncio.to_thread(
+            schedule_domain_check, domain_email_id, warming_account_id, campaign_id, log_id, message_id,
+        )
+        return {"status": "sent", "log_id": log_id, "subject": subject}
+
+    except RateLimited as e:
+        # No free connection to the provider (rate_limiter.connection_lease); nothing was sent
+        await _reschedule("send_warming_email", (warming_account_id, domain_email_id, campaign_id), e)
+        return {"status": "rescheduled"}
+    except Exception as e:
+        await asyncio.to_thread(
+            _with_db, record_send_error, campaign_id, warming_account_id, domain_email_id, str(e),
+        )
+        raise
+
+
+async def check_domain_inbox(
+    domain_email_id: int, warming_account_id: int, campaign_id: int, log_id: int, attempt: int = 0,
+):
+    from .conversation import record_check_error, record_replied, retry_not_found, schedule_warming_check
+    from .models import DomainEmail, WarmingAccount, WarmingLog
+    from .reply_index import locate_message_async
+
+    args = (domain_email_id, warming_account_id, campaign_id, log_id)
+    try:
+        domain_email, account, log = await asyncio.to_thread(
+            _load, (DomainEmail, domain_email_id), (WarmingAccount, warming_account_id), (WarmingLog, log_id),
+        )
+        if not domain_email or not account or not log:
+            return {"error": "Not found"}
+        if not log.message_id:
+            return {"error": "Log has no message id", "log_id": log_id}
+        if log.replied_at:
+            return {"status": "already_replied", "log_id": log_id}
+
+        lease = await _take_slot("check_domain_inbox", args + (attempt,), imap_limits(domain_email))
+        if lease is None:
+            return {"status": "rescheduled", "log_id": log_id}
+        try:
+            async with aes.imap_session(domain_email) as imap:
+                target = await locate_message_async(domain_email, log.message_id, imap)
+                if target:
+                    await aes.mark_as_read(domain_email, target["uid"], imap=imap)
+            if not target:
+                retried = await asyncio.to_thread(retry_not_found, "check_domain_inbox", args, attempt)
+                return {"status": "not_found", "log_id": log_id, "retried": retried}
+
+            opened_at = datetime.utcnow()
+            reply_msg_id = await aes.reply_to_email(
+                domain_email, target["subject"], target["message_id"], account.email,
+            )
+        finally:
+            await asyncio.to_thread(release, lease)
+
+        await asyncio.to_thread(_with_db, record_replied, log_id, opened_at, merge=domain_email)
+        await asyncio.to_thread(
+            schedule_warming_check,
+            warming_account_id, domain_email_id, campaign_id, log_id, reply_msg_id, target["subject"],
+        )
+        return {"status": "replied", "log_id": log_id}
+
+    except RateLimited as e:
+        await _reschedule("check_domain_inbox", args + (attempt,), e)
+        return {"status": "rescheduled", "log_id": log_id}
+    except Exception as e:
+        await asyncio.to_thread(_with_db, record_check_error, log_id, str(e))
+        raise
+
+
+async def check_warming_account_inbox(
+    warming_account_id: int,
+    domain_email_id: int,
+    campaign_id: int,
+    log_id: int,
+    expected_message_id: str,
+    original_subject: str,
+    attempt: int = 0,
+):
+    from .conversation import record_check_error, record_completed, retry_not_found
+    from .models import DomainEmail, WarmingAccount, WarmingLog
+    from .reply_index import locate_message_async
+
+    args = (warming_account_id, domain_email_id, campaign_id, log_id, expected_message_id, original_subject)
+    try:
+        account, domain_email, log = await asyncio.to_thread(
+            _load, (WarmingAccount, warming_account_id), (DomainEmail, domain_email_id), (WarmingLog, log_id),
+        )
+        if not account or not domain_email or not log:
+            return {"error": "Not found"}
+
+        lease = await _take_slot("check_warming_account_inbox", args + (attempt,), imap_limits(account))
+        if lease is None:
+            return {"status": "rescheduled", "log_id": log_id}
+        try:
+            async with aes.imap_session(account) as imap:
+                target = await locate_message_async(account, expected_message_id, imap)
+                if target:
+                    await aes.mark_as_read(account, target["uid"], imap=imap)
+            if not target:
+                retried = await asyncio.to_thread(retry_not_found, "check_warming_account_inbox", args, attempt)
+                return {"status": "not_found", "log_id": log_id, "retried": retried}
+
+            await aes.reply_to_email(account, target["subject"], target["message_id"], domain_email.email)
+        finally:
+            await asyncio.to_thread(release, lease)
+
+        await asyncio.to_thread(_with_db, record_completed, log_id, merge=account)
+        return {"status": "completed", "log_id": log_id}
+
+    except RateLimited as e:
+        await _reschedule("check_warming_account_inbox", args + (attempt,), e)
+        return {"status": "rescheduled", "log_id": log_id}
+    except Exception as e:
+        await asyncio.to_thread(_with_db, record_check_error, log_id, str(e))
+        raise
+
+
+ASYNC_TASKS = {
+    "send_warming_email": send_warming_email,
+    "check_domain_inbox": check_domain_inbox,
+    "check_warming_account_inbox": check_warming_account_inbox,
+}
+
+
+# ── Runner ──────────────────────────────────────────────────────────────────
+
+def _processing_key(worker_id: str) -> str:
+    return f"{PROCESSING_PREFIX}:{worker_id}"
+
+
+async def _finish(conn, processing: str, raw: bytes, payload: dict, error: str) -> None:
+    """Drop a failed payload from the processing list, retrying or recording it."""
+    attempt = payload.get("attempt", 0)
+    async with conn.pipeline(transaction=True) as pipe:
+        if payload.get("task") in RETRY_TASKS and attempt < ASYNC_TASK_RETRIES:
+            retry = {**payload, "attempt": attempt + 1}
+            schedule_async(retry, time.time() + ASYNC_RETRY_DELAY * 2 ** attempt, pipeline=pipe)
+        else:
+            failed = {**payload, "error": error, "failed_at": datetime.utcnow().isoformat()}
+            pipe.lpush(ASYNC_FAILED_KEY, json.dumps(failed))
+            pipe.ltrim(ASYNC_FAILED_KEY, 0, ASYNC_FAILED_KEEP - 1)
+        pipe.lrem(processing, 1, raw)
+        await pipe.execute()
+
+
+async def _run_payload(conn, processing: str, raw: bytes) -> None:
+    try:
+        payload = json.loads(raw)
+        func = ASYNC_TASKS[payload["task"]]
+        label = f"{payload['task']}{tuple(payload['args'])}"
+    except (ValueError, KeyError) as e:
+        logger.error(f"Unreadable payload {raw[:200]!r}: {e}")
+        await _finish(conn, processing, raw, {"raw": raw.decode(errors="replace")}, f"unreadable payload: {e}")
+        return
+
+    try:
+        result = await func(*payload["args"])
+    except Exception as e:
+        logger.error(f"{label} failed (attempt {payload.get('attempt', 0) + 1}): {e}")
+        await _finish(conn, processing, raw, payload, str(e))
+        return
+    # A cancelled task (shutdown) stays in the processing list and is put back
+    logger.info(f"{label}: {result}")
+    await conn.lrem(processing, 1, raw)
+
+
+async def _requeue(conn, worker_id: str) -> int:
+    """Put a worker's unfinished payloads back at the head of the ready list and unregister it."""
+    processing = _processing_key(worker_id)
+    moved = 0
+    while await conn.lmove(processing, ASYNC_READY_KEY, "RIGHT", "LEFT") is not None:
+        moved += 1
+    await conn.zrem(WORKERS_KEY, worker_id)
+    return moved
+
+
+async def _sweep(conn) -> None:
+    """Requeue the payloads of workers whose heartbeat stopped."""
+    cutoff = time.time() - 3 * ASYNC_WORKER_HEARTBEAT
+    for worker_id in await conn.zrangebyscore(WORKERS_KEY, "-inf", cutoff):
+        worker_id = worker_id.decode()
+        if worker_id == ASYNC_WORKER_ID:
+            continue
+        moved = await _requeue(conn, worker_id)
+        if moved:
+            logger.warning(f"Requeued {moved} payload(s) of stopped worker {worker_id}")
+
+
+async def _heartbeats(conn) -> None:
+    while True:
+        await asyncio.sleep(ASYNC_WORKER_HEARTBEAT)
+        try:
+            await conn.zadd(WORKERS_KEY, {ASYNC_WORKER_ID: time.time()})
+            await _sweep(conn)
+        except RedisError as e:
+            logger.warning(f"Worker heartbeat failed: {e}")
+
+
+async def _migrate_scheduled(conn) -> None:
+    """Move payloads left in the old scheduled set (ASYNC_SCHEDULED_KEY) to the release wheel."""
+    while batch := await conn.zrange(ASYNC_SCHEDULED_KEY, 0, 999, withscores=True):
+        async with conn.pipeline(transaction=True) as pipe:
+            for raw, due in batch:
+                try:
+                    schedule_async(json.loads(raw), due, pipeline=pipe)
+                except ValueError:
+                    logger.error(f"Dropping scheduled payload {raw[:200]!r}")
+                pipe.zrem(ASYNC_SCHEDULED_KEY, raw)
+            await pipe.execute()
+
+
+async def run_worker(concurrency: int = ASYNC_WORKER_CONCURRENCY) -> None:
+    """Pull payloads from Redis and run them with at most `concurrency` in flight, until SIGTERM/SIGINT."""
+    conn = aioredis.from_url(REDIS_URL)
+    processing = _processing_key(ASYNC_WORKER_ID)
+    slots = asyncio.Semaphore(concurrency)
+    running: set[asyncio.Task] = set()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    # Payloads left over from this worker's previous run, then other dead workers'
+    moved = await _requeue(conn, ASYNC_WORKER_ID)
+    if moved:
+        logger.warning(f"Requeued {moved} payload(s) left from the previous run")
+    await conn.zadd(WORKERS_KEY, {ASYNC_WORKER_ID: time.time()})
+    await _sweep(conn)
+    await _migrate_scheduled(conn)
+    heartbeats = asyncio.create_task(_heartbeats(conn))
+
+    while not stopping.is_set():
+        await slots.acquire()
+        if stopping.is_set():
+            slots.release()
+            break
+        raw = await conn.blmove(ASYNC_READY_KEY, processing, 1, "LEFT", "RIGHT")
+        if raw is None:
+            slots.release()
+            continue
+
+        task = asyncio.create_task(_run_payload(conn, processing, raw))
+        running.add(task)
+        task.add_done_callback(running.discard)
+        task.add_done_callback(lambda _: slots.release())
+
+    logger.info(f"Stopping: waiting up to {ASYNC_SHUTDOWN_GRACE}s for {len(running)} running task(s)")
+    if running:
+        _, unfinished = await asyncio.wait(running, timeout=ASYNC_SHUTDOWN_GRACE)
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+    heartbeats.cancel()
+    moved = await _requeue(conn, ASYNC_WORKER_ID)
+    if moved:
+        logger.warning(f"Requeued {moved} unfinished payload(s)")
+    await conn.aclose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Starting async worker {ASYNC_WORKER_ID} (concurrency={ASYNC_WORKER_CONCURRENCY})...")
+    asyncio.run(run_worker())
@@ -0,0 +1,289 @@
+"""
+Bulk SMTP/IMAP login tests for warming accounts.
+
+SMTP and IMAP checks of all accounts run in one thread pool, with at most
+CONNECTION_TEST_PER_HOST logins in flight against any provider host: checks
+wait in a queue per host and are only submitted while their host has room,
+so no pool thread sits blocked behind a slow provider. Every login also
+takes the provider slots the warming tasks take (rate_limiter): a host
+token and connection lease, then the account's token and lease. A host at
+its limit is paused until the limiter's retry hint, a busy account only
+delays its own check.
+
+Results are stored in account_health and yielded as each account
+completes; POST /accounts/bulk-test runs this as an RQ job
+(tasks.bulk_connection_test_task) with progress in the job's meta and
+every result appended to a Redis list as it completes (publish_result),
+which GET /accounts/bulk-test/{job_id}/results streams. Accounts that
+passed within CONNECTION_TEST_MAX_AGE minutes are not tested again unless
+forced.
+
+Environment:
+  CONNECTION_TEST_CONCURRENCY     total logins in flight
+  CONNECTION_TEST_PER_HOST        default cap per provider host
+  CONNECTION_TEST_HOST_LIMITS     "host=n,..." per-host overrides, e.g. "imap.gmail.com=4"
+  CONNECTION_TEST_MAX_AGE         minutes a passing result stays valid
+"""
+
+import heapq
+import itertools
+import json
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, Optional
+
+import redis
+
+CONNECTION_TEST_CONCURRENCY = int(os.environ.get("CONNECTION_TEST_CONCURRENCY", "32"))
+CONNECTION_TEST_PER_HOST = int(os.environ.get("CONNECTION_TEST_PER_HOST", "8"))
+CONNECTION_TEST_HOST_LIMITS = os.environ.get("CONNECTION_TEST_HOST_LIMITS", "")
+CONNECTION_TEST_MAX_AGE = int(os.environ.get("CONNECTION_TEST_MAX_AGE", "360"))
+_COMMIT_EVERY = 50
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+RESULTS_KEY_PREFIX = "warming:bulk-test"
+RESULTS_TTL = 24 * 3600  # as the job's result_ttl
+
+redis_conn = redis.from_url(REDIS_URL)
+
+HOST_LIMITS = {
+    host.strip().lower(): int(limit)
+    for host, _, limit in (item.partition("=") for item in CONNECTION_TEST_HOST_LIMITS.split(",") if item.strip())
+}
+
+
+def _result(account_id: int, email: str, health, cached: bool = False, deactivated: bool = False) -> dict:
+    return {
+        "id": account_id,
+        "email": email,
+        "smtp": health.smtp_ok,
+        "imap": health.imap_ok,
+        "smtp_error": health.smtp_error,
+        "imap_error": health.imap_error,
+        "tested_at": health.tested_at.isoformat(),
+        "cached": cached,
+        "deactivated": deactivated,
+    }
+
+
+# ── Published results ────────────────────────────────────────────────────────
+
+def _results_key(job_id: str) -> str:
+    return f"{RESULTS_KEY_PREFIX}:{job_id}:results"
+
+
+def publish_result(job_id: str, result: dict) -> None:
+    """Append one account's result to the job's result list."""
+    pipe = redis_conn.pipeline()
+    pipe.rpush(_results_key(job_id), json.dumps(result))
+    pipe.expire(_results_key(job_id), RESULTS_TTL)
+    pipe.execute()
+
+
+def read_results(job_id: str, start: int = 0) -> list[dict]:
+    """The job's results from index start on, in completion order."""
+    return [json.loads(raw) for raw in redis_conn.lrange(_results_key(job_id), start, -1)]
+
+
+# ── Provider limits ──────────────────────────────────────────────────────────
+
+class _HostBusy(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Host busy, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def _take_limits(host: str, email: str) -> list:
+    """
+    rate_limiter leases for one login: the host's token and a connection
+    lease, then the account's token and lease. Raises _HostBusy if the host
+    is at its limit, RateLimited if only the account is.
+    """
+    from .rate_limiter import RateLimited, acquire, connection_lease, release
+
+    leases = []
+    try:
+        try:
+            leases.append(acquire(hosts=[host]))
+            leases.append(connection_lease(host))
+        except RateLimited as e:
+            raise _HostBusy(e.retry_after)
+        leases.append(acquire(accounts=[email]))
+    except Exception:
+        for lease in leases:
+            release(lease)
+        raise
+    return leases
+
+
+def _run_check(check, account, leases: list) -> Optional[str]:
+    from .rate_limiter import release
+
+    try:
+        return check(account)
+    finally:
+        for lease in leases:
+            release(lease)
+
+
+# ── Bulk test ────────────────────────────────────────────────────────────────
+
+def run_connection_tests(
+    account_ids: Optional[list[int]] = None,
+    force: bool = False,
+    deactivate: bool = False,
+    on_progress: Optional[Callable[[dict], None]] = None,
+) -> Iterator[dict]:
+    """
+    Test the given accounts (default: all active ones) and yield one result
+    dict per account as its SMTP and IMAP checks complete. deactivate=True
+    sets active=False on accounts where either check failed. on_progress
+    gets {"total", "done", "ok", "deactivated"} whenever results are committed.
+    """
+    from .database import SessionLocal
+    from .email_service import check_imap, check_smtp
+    from .models import AccountHealth, WarmingAccount
+    from .rate_limiter import RateLimited
+
+    db = SessionLocal()
+    try:
+        query = db.query(WarmingAccount)
+        if account_ids:
+            query = query.filter(WarmingAccount.id.in_(account_ids))
+        else:
+            query = query.filter(WarmingAccount.active == True)
+        accounts = query.all()
+        health = {
+            row.warming_account_id: row
+            for row in db.query(AccountHealth).filter(
+                AccountHealth.warming_account_id.in_([a.id for a in accounts])
+            )
+        }
+
+        progress = {"total": len(accounts), "done": 0, "ok": 0, "deactivated": 0}
+
+        def _committed() -> None:
+            db.commit()
+            if on_progress is not None:
+                on_progress(dict(progress))
+
+        fresh_after = datetime.utcnow() - timedelta(minutes=CONNECTION_TEST_MAX_AGE)
+        to_test = []
+        for account in accounts:
+            row = health.get(account.id)
+            if not force and row and row.smtp_ok and row.imap_ok and row.tested_at > fresh_after:
+                progress["done"] += 1
+                progress["ok"] += 1
+                yield _result(account.id, account.email, row, cached=True)
+            else:
+                to_test.append(account)
+        # Worker threads get detached copies; token refreshes write through on their own
+        for account in to_test:
+            db.expunge(account)
+
+        queues: dict[str, deque] = defaultdict(deque)
+        for account in to_test:
+            queues[(account.smtp_host or "").lower()].append((check_smtp, "smtp", account))
+            queues[(account.imap_host or "").lower()].append((check_imap, "imap", account))
+        in_flight: dict[str, int] = defaultdict(int)
+        paused: dict[str, float] = {}  # host -> when its rate limit frees up (monotonic)
+        delayed: list = []  # heap of (ready at, seq, host, check) for busy accounts
+        seq = itertools.count()
+        futures = {}
+        pool = ThreadPoolExecutor(max_workers=max(1, CONNECTION_TEST_CONCURRENCY))
+
+        def _submit_ready() -> None:
+            """Submit queued checks while their host, its rate limit and the pool have room."""
+            now = time.monotonic()
+            while delayed and delayed[0][0] <= now:
+                _, _, host, item = heapq.heappop(delayed)
+                queues[host].appendleft(item)
+            for host, queue in list(queues.items()):
+                limit = HOST_LIMITS.get(host, CONNECTION_TEST_PER_HOST)
+                while (queue and in_flight[host] < limit and len(futures) < CONNECTION_TEST_CONCURRENCY
+                       and paused.get(host, 0) <= now):
+                    check, kind, account = item = queue.popleft()
+                    try:
+                        leases = _take_limits(host, account.email)
+                    except _HostBusy as e:
+                        queue.appendleft(item)
+                        paused[host] = now + e.retry_after
+                    except RateLimited as e:
+                        heapq.heappush(delayed, (now + e.retry_after, next(seq), host, item))
+                    else:
+                        futures[pool.submit(_run_check, check, account, leases)] = (account, kind, host)
+                        in_flight[host] += 1
+                if not queue:
+                    del queues[host]
+
+        def _next_wakeup() -> Optional[float]:
+            """Seconds until a paused host or delayed check is due, None if none waits."""
+            now = time.monotonic()
+            due = [until for host, until in paused.items() if until > now and host in queues]
+            if delayed:
+                due.append(delayed[0][0])
+            return max(0.1, min(due) - now) if due else None
+
+        try:
+            partial: dict[int, dict] = defaultdict(dict)
+            _submit_ready()
+            while futures or queues or delayed:
+                if not futures:
+                    time.sleep(_next_wakeup() or 0.1)
+                    _submit_ready()
+                    continue
+                finished, _ = wait(futures, timeout=_next_wakeup(), return_when=FIRST_COMPLETED)
+                completed = []
+                for future in finished:
+                    account, kind, host = futures.pop(future)
+                    in_flight[host] -= 1
+                    partial[account.id][kind] = future.result()
+                    if len(partial[account.id]) == 2:
+                        completed.append((account, partial.pop(account.id)))
+                _submit_ready()
+
+                for account, errors in completed:
+                    row = health.get(account.id)
+                    if row is None:
+                        row = health[account.id] = AccountHealth(warming_account_id=account.id)
+                        db.add(row)
+                    row.smtp_ok = errors["smtp"] is None
+                    row.imap_ok = errors["imap"] is None
+                    row.smtp_error = errors["smtp"]
+                    row.imap_error = errors["imap"]
+                    row.tested_at = datetime.utcnow()
+
+                    deactivated = False
+                    if deactivate and not (row.smtp_ok and row.imap_ok) and account.active:
+                        db.query(WarmingAccount).filter(WarmingAccount.id == account.id).update(
+                            {"active": False}, synchronize_session=False
+                        )
+                        deactivated = True
+
+                    progress["done"] += 1
+                    progress["ok"] += int(row.smtp_ok and row.imap_ok)
+                    progress["deactivated"] += int(deactivated)
+                    if progress["done"] % _COMMIT_EVERY == 0:
+                        _committed()
+                    yield _result(account.id, account.email, row, deactivated=deactivated)
+            _committed()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    finally:
+        db.close()
+
+
+def record_test(account, results: dict) -> None:
+    """Store a single test_connection result (POST /accounts/{id}/test) in account_health."""
+    from .models import AccountHealth
+
+    if account.health is None:
+        account.health = AccountHealth()
+    account.health.smtp_ok = results["smtp"]
+    account.health.imap_ok = results["imap"]
+    account.health.smtp_error = results["smtp_error"]
+    account.health.imap_error = results["imap_error"]
+    account.health.tested_at = datetime.utcnow()
@@ -0,0 +1,182 @@
+"""
+Database and follow-up steps of a warming conversation, shared by the RQ
+tasks (tasks.py) and the asyncio worker (async_worker.py).
+
+Both workers only differ in how they talk to the mail servers; what they
+log and which check they schedule next is done here. Each helper takes an
+open session and commits its own change.
+"""
+
+import os
+import random
+from datetime import datetime
+
+import redis
+
+from .imap_listener import _reply_delay, listener_covers
+
+# A check that misses its message looks again, NOT_FOUND_RETRY_DELAY * 2**n seconds later
+NOT_FOUND_RETRIES = int(os.environ.get("NOT_FOUND_RETRIES", "4"))
+NOT_FOUND_RETRY_DELAY = int(os.environ.get("NOT_FOUND_RETRY_DELAY", "600"))
+
+
+# ── Warming logs ─────────────────────────────────────────────────────────────
+
+def record_sent(db, campaign_id: int, warming_account_id: int, domain_email_id: int,
+                subject: str, message_id: str) -> int:
+    """Log a sent warming email. Returns the WarmingLog id."""
+    from .models import LogStatusEnum, WarmingLog
+
+    log = WarmingLog(
+        campaign_id=campaign_id,
+        warming_account_id=warming_account_id,
+        domain_email_id=domain_email_id,
+        subject=subject,
+        message_id=message_id,
+        status=LogStatusEnum.sent,
+        sent_at=datetime.utcnow(),
+    )
+    db.add(log)
+    db.commit()
+    return log.id
+
+
+def record_send_error(db, campaign_id: int, warming_account_id: int, domain_email_id: int, error: str) -> None:
+    """Log a failed send. Never raises, so the original error reaches the worker."""
+    from .models import LogStatusEnum, WarmingLog
+
+    db.rollback()
+    try:
+        db.add(WarmingLog(
+            campaign_id=campaign_id,
+            warming_account_id=warming_account_id,
+            domain_email_id=domain_email_id,
+            status=LogStatusEnum.error,
+            error_message=error,
+        ))
+        db.commit()
+    except Exception:
+        db.rollback()
+
+
+def record_check_error(db, log_id: int, error: str) -> None:
+    """Mark the log of a failed inbox check as error. Never raises."""
+    from .models import LogStatusEnum, WarmingLog
+
+    db.rollback()
+    try:
+        log = db.get(WarmingLog, log_id)
+        if log:
+            log.status = LogStatusEnum.error
+            log.error_message = error
+            db.commit()
+    except Exception:
+        db.rollback()
+
+
+def record_replied(db, log_id: int, opened_at: datetime) -> None:
+    """The domain email opened the message and replied."""
+    from .models import LogStatusEnum, WarmingLog
+
+    log = db.get(WarmingLog, log_id)
+    if log:
+        log.received_at = opened_at
+        log.opened_at = opened_at
+        log.replied_at = datetime.utcnow()
+        log.status = LogStatusEnum.replied
+    db.commit()
+
+
+def record_completed(db, log_id: int) -> None:
+    """The warming account answered the reply; the conversation loop is closed."""
+    from .models import LogStatusEnum, WarmingLog
+
+    log = db.get(WarmingLog, log_id)
+    if log:
+        log.status = LogStatusEnum.replied
+    db.commit()
+
+
+# ── Follow-up checks ─────────────────────────────────────────────────────────
+
+def _check_delay(kind: str, owner_id: int, message_id: str, low: int, high: int):
+    """
+    Delay of the check for message_id in a mailbox, or None if the IDLE
+    listener dispatches it on arrival.
+
+    The listener matches an arrival against the committed logs. One it
+    synced before the caller committed its log matched nothing; it waits in
+    the reply index, and the check is scheduled here with the listener's
+    reply delay instead of being lost.
+    """
+    from .reply_index import is_indexed
+
+    if not listener_covers(kind, owner_id):
+        return random.randint(low, high)
+    try:
+        if is_indexed(kind, owner_id, message_id):
+            return _reply_delay()
+    except redis.RedisError:
+        return random.randint(low, high)
+    return None
+
+
+def schedule_domain_check(domain_email_id: int, warming_account_id: int, campaign_id: int, log_id: int,
+                          message_id: str) -> None:
+    """
+    Check the domain inbox for the sent message in 5–30 min, unless the
+    IDLE listener watches this mailbox and dispatches the check on arrival.
+    """
+    from .tasks import enqueue_warming_task
+
+    delay = _check_delay("domain", domain_email_id, message_id, 5 * 60, 30 * 60)
+    if delay is None:
+        return
+    enqueue_warming_task(
+        "check_domain_inbox",
+        domain_email_id,
+        warming_account_id,
+        campaign_id,
+        log_id,
+        delay_seconds=delay,
+    )
+
+
+def schedule_warming_check(warming_account_id: int, domain_email_id: int, campaign_id: int, log_id: int,
+                           reply_message_id: str, subject: str) -> None:
+    """Check the warming account inbox for the reply in 10–60 min, unless the listener watches it."""
+    from .tasks import enqueue_warming_task
+
+    delay = _check_delay("warming", warming_account_id, reply_message_id, 10 * 60, 60 * 60)
+    if delay is None:
+        return
+    enqueue_warming_task(
+        "check_warming_account_inbox",
+        warming_account_id,
+        domain_email_id,
+        campaign_id,
+        log_id,
+        reply_message_id,
+        subject,
+        delay_seconds=delay,
+    )
+
+
+def retry_not_found(task_name: str, args: tuple, attempt: int) -> bool:
+    """
+    Run an inbox check again later when it did not find its message, which
+    may simply not have arrived yet. args are the task's arguments without
+    attempt, the number of retries so far. False once NOT_FOUND_RETRIES are
+    used up.
+    """
+    from .tasks import enqueue_warming_task
+
+    if attempt >= NOT_FOUND_RETRIES:
+        return False
+    enqueue_warming_task(
+        task_name,
+        *args,
+        attempt + 1,
+        delay_seconds=NOT_FOUND_RETRY_DELAY * 2 ** attempt + random.randint(0, 60),
+    )
+    return True
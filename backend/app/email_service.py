@@ -6,15 +6,23 @@ Supports password auth, app passwords, and OAuth2 (Gmail & Outlook).
 import base64
 import email as email_lib
 import imaplib
+import os
 import random
+import re
 import smtplib
+import sys
+import threading
 import time
+from contextlib import contextmanager
 from datetime import datetime
+from email.parser import BytesHeaderParser
+from email.policy import compat32
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import Optional
+from functools import lru_cache
+from typing import NamedTuple, Optional
 
-import requests
+from . import http_client
 
 # ── Provider defaults ────────────────────────────────────────────────────────
 
@@ -54,7 +62,7 @@ MICROSOFT_TOKEN_URL = "https://login.microsoftonline.com/common/oauth2/v2.0/toke
 
 
 def _refresh_google_token(refresh_token: str, client_id: str, client_secret: str) -> dict:
-    resp = requests.post(GOOGLE_TOKEN_URL, data={
+    resp = http_client.post(GOOGLE_TOKEN_URL, data={
         "grant_type": "refresh_token",
         "refresh_token": refresh_token,
         "client_id": client_id,
@@ -65,7 +73,7 @@ def _refresh_google_token(refresh_token: str, client_id: str, client_secret: str
 
 
 def _refresh_microsoft_token(refresh_token: str, client_id: str, client_secret: str) -> dict:
-    resp = requests.post(MICROSOFT_TOKEN_URL, data={
+    resp = http_client.post(MICROSOFT_TOKEN_URL, data={
         "grant_type": "refresh_token",
         "refresh_token": refresh_token,
         "client_id": client_id,
@@ -77,35 +85,42 @@ def _refresh_microsoft_token(refresh_token: str, client_id: str, client_secret:
     return resp.json()
 
 
-def get_valid_access_token(account) -> str:
-    """Return a valid access token, refreshing if needed. Updates DB object in place."""
-    if account.oauth2_token_expiry and account.oauth2_token_expiry > datetime.utcnow():
-        return account.oauth2_access_token
-
+def _refresh_oauth2_token(account) -> dict:
+    """Call the provider's token endpoint with account's refresh token."""
     if not account.oauth2_refresh_token:
         raise ValueError(f"No refresh token for account {account.email}")
 
     if account.provider == "gmail":
-        data = _refresh_google_token(
+        return _refresh_google_token(
             account.oauth2_refresh_token,
             account.oauth2_client_id,
             account.oauth2_client_secret,
         )
-    elif account.provider == "outlook":
-        data = _refresh_microsoft_token(
+    if account.provider == "outlook" and not account.oauth2_client_id:
+        # ROPC-imported accounts use the app from OUTLOOK_CLIENT_ID
+        from .oauth2_service import refresh_outlook_token
+
+        return refresh_outlook_token(account.oauth2_refresh_token)
+    if account.provider == "outlook":
+        return _refresh_microsoft_token(
             account.oauth2_refresh_token,
             account.oauth2_client_id,
             account.oauth2_client_secret,
         )
-    else:
-        raise ValueError(f"OAuth2 not supported for provider {account.provider}")
+    raise ValueError(f"OAuth2 not supported for provider {account.provider}")
 
-    from datetime import timedelta
-    account.oauth2_access_token = data["access_token"]
-    account.oauth2_token_expiry = datetime.utcnow() + timedelta(seconds=data.get("expires_in", 3600) - 60)
-    if "refresh_token" in data:
-        account.oauth2_refresh_token = data["refresh_token"]
-    return account.oauth2_access_token
+
+def get_valid_access_token(account) -> str:
+    """
+    Return a valid access token, refreshing if needed. Updates DB object in place.
+    Tokens are shared fleet-wide and refreshed single-flight (token_cache).
+    """
+    if account.oauth2_token_expiry and account.oauth2_token_expiry > datetime.utcnow():
+        return account.oauth2_access_token
+
+    from .token_cache import get_shared_token
+
+    return get_shared_token(account, _refresh_oauth2_token)
 
 
 def _build_xoauth2_string(email: str, access_token: str) -> str:
@@ -136,6 +151,275 @@ def _get_smtp(account) -> smtplib.SMTP:
     return smtp
 
 
+# ── Session pooling ──────────────────────────────────────────────────────────
+#
+# Authenticating costs several round trips (TCP, TLS, EHLO, AUTH) and providers
+# throttle on login count, so workers keep authenticated sessions per account
+# and reuse them across tasks. The pool is per process; see worker.py.
+
+SMTP_POOL_IDLE_TIMEOUT = float(os.environ.get("SMTP_POOL_IDLE_TIMEOUT", "120"))
+SMTP_POOL_MAX_MESSAGES = int(os.environ.get("SMTP_POOL_MAX_MESSAGES", "50"))
+SMTP_POOL_MAX_IDLE_PER_ACCOUNT = int(os.environ.get("SMTP_POOL_MAX_IDLE_PER_ACCOUNT", "2"))
+SMTP_POOL_MAX_SESSIONS = int(os.environ.get("SMTP_POOL_MAX_SESSIONS", "200"))
+SMTP_POOL_CHECK_AFTER = float(os.environ.get("SMTP_POOL_CHECK_AFTER", "15"))
+
+
+class _PooledSession:
+    __slots__ = ("key", "conn", "created_at", "last_used", "uses", "lease")
+
+    def __init__(self, key, conn):
+        self.key = key
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+        self.lease = None
+
+
+class SessionPool:
+    """
+    Keyed pool of authenticated connections.
+
+    connect(account) opens a new session, check(conn) is a cheap liveness probe
+    run on sessions idle longer than check_after (or on every reuse with
+    session(..., verify=True)), recover(conn) resets a session
+    after a failed operation and close(conn) tears it down. Sessions are evicted
+    when idle longer than idle_timeout, after max_uses operations, or when the
+    pool holds more than max_sessions idle sessions (least recently used first).
+
+    With lease_host(account) given, a session holds a rate_limiter
+    connection lease for that host while it is borrowed, so the host's
+    concurrency limit bounds the connections in use across all pools.
+    Idle sessions give their lease back: they would otherwise keep the
+    host's leases for the whole idle timeout, and only the owning process
+    could free them. Borrowing raises RateLimited when the host is at
+    its limit.
+    """
+
+    def __init__(
+        self,
+        connect,
+        check,
+        recover,
+        close,
+        idle_timeout: float,
+        max_uses: Optional[int] = None,
+        max_idle_per_key: int = 2,
+        max_sessions: int = 200,
+        check_after: float = 15.0,
+        lease_host=None,
+    ):
+        self._connect = connect
+        self._check = check
+        self._recover = recover
+        self._close = close
+        self.idle_timeout = idle_timeout
+        self.max_uses = max_uses
+        self.max_idle_per_key = max_idle_per_key
+        self.max_sessions = max_sessions
+        self.check_after = check_after
+        self._lease_host = lease_host
+        self._idle: dict[tuple, list[_PooledSession]] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _ensure_process(self) -> None:
+        # Sockets inherited across fork() belong to the parent; never reuse them.
+        if self._pid != os.getpid():
+            self._idle = {}
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+    @staticmethod
+    def _release_lease(entry: _PooledSession) -> None:
+        if entry.lease is None:
+            return
+        from .rate_limiter import release
+
+        try:
+            release(entry.lease)
+        except Exception:
+            pass  # expires after RATE_LIMIT_LEASE_TTL
+        entry.lease = None
+
+    def _discard(self, entry: _PooledSession) -> None:
+        try:
+            self._close(entry.conn)
+        except Exception:
+            pass
+        self._release_lease(entry)
+
+    def _take_idle(self, key) -> Optional[_PooledSession]:
+        with self._lock:
+            stack = self._idle.get(key)
+            if not stack:
+                return None
+            entry = stack.pop()
+            if not stack:
+                del self._idle[key]
+            return entry
+
+    def _checkout(self, key, account, verify: bool = False) -> _PooledSession:
+        self._ensure_process()
+        lease = None
+        if self._lease_host is not None:
+            from .rate_limiter import connection_lease
+
+            lease = connection_lease(self._lease_host(account))
+        try:
+            entry = self._reuse(key, verify) or _PooledSession(key, self._connect(account))
+        except Exception:
+            if lease is not None:
+                from .rate_limiter import release
+
+                release(lease)
+            raise
+        entry.lease = lease
+        return entry
+
+    def _reuse(self, key, verify: bool) -> Optional[_PooledSession]:
+        """A live idle session for key, or None."""
+        while True:
+            entry = self._take_idle(key)
+            if entry is None:
+                return None
+            idle_for = time.monotonic() - entry.last_used
+            if idle_for > self.idle_timeout:
+                self._discard(entry)
+                continue
+            if verify or idle_for > self.check_after:
+                try:
+                    if not self._check(entry.conn):
+                        raise ConnectionError("health check failed")
+                except Exception:
+                    self._discard(entry)
+                    continue
+            return entry
+
+    def _checkin(self, entry: _PooledSession) -> None:
+        entry.last_used = time.monotonic()
+        self._release_lease(entry)
+        if self.max_uses is not None and entry.uses >= self.max_uses:
+            self._discard(entry)
+            return
+
+        evicted = []
+        with self._lock:
+            stack = self._idle.setdefault(entry.key, [])
+            if len(stack) >= self.max_idle_per_key:
+                evicted.append(entry)
+            else:
+                stack.append(entry)
+                evicted.extend(self._evict_locked())
+        for stale in evicted:
+            self._discard(stale)
+
+    def _evict_locked(self) -> list[_PooledSession]:
+        """Drop expired sessions and trim the pool to max_sessions (LRU first)."""
+        now = time.monotonic()
+        evicted = []
+        remaining = []
+        for key in list(self._idle):
+            keep = []
+            for entry in self._idle[key]:
+                if now - entry.last_used > self.idle_timeout:
+                    evicted.append(entry)
+                else:
+                    keep.append(entry)
+            if keep:
+                self._idle[key] = keep
+                remaining.extend(keep)
+            else:
+                del self._idle[key]
+
+        overflow = len(remaining) - self.max_sessions
+        if overflow > 0:
+            for entry in sorted(remaining, key=lambda e: e.last_used)[:overflow]:
+                self._idle[entry.key].remove(entry)
+                if not self._idle[entry.key]:
+                    del self._idle[entry.key]
+                evicted.append(entry)
+        return evicted
+
+    @contextmanager
+    def session(self, key, account, verify: bool = False):
+        """
+        Borrow an authenticated session for key, returning it to the pool
+        afterwards. verify=True probes a reused session even if it was idle
+        only briefly, so a dropped one is replaced before it is used.
+        """
+        entry = self._checkout(key, account, verify)
+        try:
+            yield entry.conn
+        except Exception:
+            entry.uses += 1
+            try:
+                healthy = self._recover(entry.conn)
+            except Exception:
+                healthy = False
+            if healthy:
+                self._checkin(entry)
+            else:
+                self._discard(entry)
+            raise
+        else:
+            entry.uses += 1
+            self._checkin(entry)
+
+    def close_all(self) -> None:
+        self._ensure_process()
+        with self._lock:
+            entries = [e for stack in self._idle.values() for e in stack]
+            self._idle = {}
+        for entry in entries:
+            self._discard(entry)
+
+
+def _smtp_ok(smtp: smtplib.SMTP) -> bool:
+    return smtp.noop()[0] == 250
+
+
+def _smtp_reset(smtp: smtplib.SMTP) -> bool:
+    return smtp.rset()[0] == 250
+
+
+def _smtp_close(smtp: smtplib.SMTP) -> None:
+    try:
+        smtp.quit()
+    except Exception:
+        smtp.close()
+
+
+smtp_pool = SessionPool(
+    connect=_get_smtp,
+    check=_smtp_ok,
+    recover=_smtp_reset,
+    close=_smtp_close,
+    idle_timeout=SMTP_POOL_IDLE_TIMEOUT,
+    max_uses=SMTP_POOL_MAX_MESSAGES,
+    max_idle_per_key=SMTP_POOL_MAX_IDLE_PER_ACCOUNT,
+    max_sessions=SMTP_POOL_MAX_SESSIONS,
+    check_after=SMTP_POOL_CHECK_AFTER,
+    lease_host=lambda account: account.smtp_host,
+)
+
+
+def smtp_session(account, verify: bool = False):
+    """Borrow a pooled, authenticated SMTP session for an account."""
+    return smtp_pool.session((account.email, account.smtp_host, account.smtp_port), account, verify)
+
+
+def _deliver(account, msg: "OutgoingMessage") -> None:
+    """
+    Send msg over a pooled session. A reused session is probed with NOOP
+    before MAIL FROM and replaced if the server dropped it. A disconnect
+    during the transaction is raised, not retried: the server may already
+    have accepted the message, and a resend would deliver it twice.
+    """
+    with smtp_session(account, verify=True) as smtp:
+        smtp.sendmail(account.email, [msg.to], msg.data)
+
+
 # ── IMAP helpers ─────────────────────────────────────────────────────────────
 
 def _get_imap(account) -> imaplib.IMAP4_SSL:
@@ -151,6 +435,108 @@ def _get_imap(account) -> imaplib.IMAP4_SSL:
     return imap
 
 
+IMAP_POOL_IDLE_TIMEOUT = float(os.environ.get("IMAP_POOL_IDLE_TIMEOUT", "300"))
+IMAP_POOL_MAX_SESSIONS = int(os.environ.get("IMAP_POOL_MAX_SESSIONS", "200"))
+IMAP_POOL_CHECK_AFTER = float(os.environ.get("IMAP_POOL_CHECK_AFTER", "15"))
+
+
+class ImapSession:
+    """
+    One authenticated IMAP connection. A task can search, fetch and flag
+    over the same session instead of logging in for every operation.
+    """
+
+    def __init__(self, imap: imaplib.IMAP4_SSL):
+        self.imap = imap
+        self.selected: Optional[str] = None
+        self.status: dict = {}
+        self._capabilities: Optional[set[str]] = None
+
+    @property
+    def capabilities(self) -> set[str]:
+        """Post-authentication capabilities (imaplib only knows the pre-auth list)."""
+        if self._capabilities is None:
+            typ, data = self.imap.capability()
+            if typ == "OK" and data and data[0]:
+                self.imap.capabilities = tuple(data[0].decode().upper().split())
+            self._capabilities = set(self.imap.capabilities)
+        return self._capabilities
+
+    def _response_int(self, name: str) -> Optional[int]:
+        data = self.imap.untagged_responses.get(name)
+        try:
+            return int(data[-1])
+        except (TypeError, ValueError, IndexError):
+            return None
+
+    def select(self, mailbox: str = "INBOX", refresh: bool = True, condstore: bool = False) -> dict:
+        """
+        Select mailbox. refresh=False skips the round trip if it is already selected.
+        condstore=True asks for HIGHESTMODSEQ if the server supports CONDSTORE.
+        Returns the mailbox status (uidvalidity, uidnext, highestmodseq; None if not sent).
+        """
+        if not refresh and self.selected == mailbox:
+            return self.status
+        if condstore and "CONDSTORE" in self.capabilities:
+            typ, data = self.imap.select(f"{mailbox} (CONDSTORE)")
+        else:
+            typ, data = self.imap.select(mailbox)
+        if typ != "OK":
+            raise RuntimeError(f"SELECT {mailbox} failed: {data}")
+        self.selected = mailbox
+        self.status = {
+            "uidvalidity": self._response_int("UIDVALIDITY"),
+            "uidnext": self._response_int("UIDNEXT"),
+            "highestmodseq": self._response_int("HIGHESTMODSEQ"),
+        }
+        return self.status
+
+    def noop(self) -> bool:
+        return self.imap.noop()[0] == "OK"
+
+    def logout(self) -> None:
+        try:
+            self.imap.logout()
+        except Exception:
+            pass
+
+
+def _open_imap_session(account) -> ImapSession:
+    return ImapSession(_get_imap(account))
+
+
+imap_pool = SessionPool(
+    connect=_open_imap_session,
+    check=ImapSession.noop,
+    recover=ImapSession.noop,
+    close=ImapSession.logout,
+    idle_timeout=IMAP_POOL_IDLE_TIMEOUT,
+    max_idle_per_key=1,
+    max_sessions=IMAP_POOL_MAX_SESSIONS,
+    check_after=IMAP_POOL_CHECK_AFTER,
+    lease_host=lambda account: account.imap_host,
+)
+
+
+@contextmanager
+def imap_session(account):
+    """
+    Borrow an authenticated IMAP session for an account's mailbox.
+    Sessions are cached per mailbox and expire after IMAP_POOL_IDLE_TIMEOUT.
+    """
+    with imap_pool.session((account.email, account.imap_host, account.imap_port), account) as session:
+        yield session
+
+
+@contextmanager
+def _imap_or_session(account, imap: Optional[ImapSession]):
+    if imap is not None:
+        yield imap
+    else:
+        with imap_session(account) as session:
+            yield session
+
+
 # ── Core email operations ─────────────────────────────────────────────────────
 
 WARMING_SUBJECTS = [
@@ -182,19 +568,74 @@ REPLY_BODIES = [
 ]
 
 
-def send_email(account, to_email: str, subject: str, body: str) -> str:
-    """Send email via SMTP. Returns message-id."""
-    msg = MIMEMultipart("alternative")
-    msg["From"] = account.email
-    msg["To"] = to_email
+class OutgoingMessage(NamedTuple):
+    message_id: str
+    to: str
+    data: bytes
+
+
+# Stands in for the multipart boundary in cached templates
+_BOUNDARY_PLACEHOLDER = "=_warming_boundary_="
+
+
+@lru_cache(maxsize=512)
+def _message_template(subject: str, body: str) -> bytes:
+    """
+    Subject, MIME headers and encoded body for a subject/body pair, serialized
+    once. Subjects and bodies come from the fixed lists above, so the cache
+    stays small. The boundary is a placeholder: _build_message puts in a
+    fresh one per message, since a repeated boundary is a bulk-mail
+    fingerprint, and prepends the per-message headers.
+    """
+    msg = MIMEMultipart("alternative", boundary=_BOUNDARY_PLACEHOLDER)
     msg["Subject"] = subject
-    msg["Message-ID"] = email_lib.utils.make_msgid(domain=account.email.split("@")[1])
     msg.attach(MIMEText(body, "plain", "utf-8"))
+    return msg.as_bytes(policy=compat32.clone(linesep="\r\n"))
+
+
+def _boundary() -> bytes:
+    # Same shape as the boundaries the email package generates
+    return ("=" * 15 + f"{random.randrange(sys.maxsize):019d}" + "==").encode()
+
+
+def _unfold(value) -> str:
+    """A header value on one line: folding and surrounding whitespace removed."""
+    return " ".join(str(value).split())
 
-    with _get_smtp(account) as smtp:
-        smtp.send_message(msg)
 
-    return msg["Message-ID"]
+def _header(name: str, value: str) -> bytes:
+    # Unfolded, a value can't carry a line break into the next header
+    return f"{name}: {_unfold(value)}\r\n".encode()
+
+
+def _build_message(
+    account,
+    to_email: str,
+    subject: str,
+    body: str,
+    in_reply_to: Optional[str] = None,
+) -> OutgoingMessage:
+    """Splice the per-message headers and a fresh boundary onto the cached template for subject/body."""
+    message_id = email_lib.utils.make_msgid(domain=account.email.split("@")[1])
+    headers = _header("From", account.email) + _header("To", to_email)
+    if in_reply_to:
+        headers += _header("In-Reply-To", in_reply_to) + _header("References", in_reply_to)
+    headers += _header("Message-ID", message_id)
+    body_bytes = _message_template(subject, body).replace(_BOUNDARY_PLACEHOLDER.encode(), _boundary())
+    return OutgoingMessage(message_id, to_email, headers + body_bytes)
+
+
+def _reply_subject(original_subject: str) -> str:
+    return f"Re: {original_subject}" if not original_subject.startswith("Re:") else original_subject
+
+
+def send_email(account, to_email: str, subject: str, body: str) -> str:
+    """Send email via SMTP. Returns message-id."""
+    msg = _build_message(account, to_email, subject, body)
+
+    _deliver(account, msg)
+
+    return msg.message_id
 
 
 def send_random_warming_email(account, to_email: str) -> tuple[str, str]:
@@ -207,75 +648,264 @@ def send_random_warming_email(account, to_email: str) -> tuple[str, str]:
 
 def reply_to_email(account, original_subject: str, original_message_id: str, to_email: str) -> str:
     """Send a reply to an email. Returns new message-id."""
-    subject = f"Re: {original_subject}" if not original_subject.startswith("Re:") else original_subject
+    subject = _reply_subject(original_subject)
     body = random.choice(REPLY_BODIES)
 
-    msg = MIMEMultipart("alternative")
-    msg["From"] = account.email
-    msg["To"] = to_email
-    msg["Subject"] = subject
-    msg["In-Reply-To"] = original_message_id
-    msg["References"] = original_message_id
-    msg["Message-ID"] = email_lib.utils.make_msgid(domain=account.email.split("@")[1])
-    msg.attach(MIMEText(body, "plain", "utf-8"))
+    msg = _build_message(account, to_email, subject, body, in_reply_to=original_message_id)
+
+    _deliver(account, msg)
 
-    with _get_smtp(account) as smtp:
-        smtp.send_message(msg)
+    return msg.message_id
 
-    return msg["Message-ID"]
 
+# Only the headers the reply pipeline needs; BODY.PEEK leaves \Seen untouched.
+HEADER_FIELDS = ("SUBJECT", "FROM", "MESSAGE-ID", "IN-REPLY-TO")
+_FETCH_HEADERS = f"(UID BODY.PEEK[HEADER.FIELDS ({' '.join(HEADER_FIELDS)})])"
+_UID_RE = re.compile(rb"UID (\d+)")
+_header_parser = BytesHeaderParser()
 
-def check_inbox_for_message(account, search_criteria: str = "UNSEEN") -> list[dict]:
-    """Check IMAP inbox for messages matching criteria. Returns list of message dicts."""
+
+def _parse_header_fetch(data: list) -> list[dict]:
+    """Parse a UID FETCH response for _FETCH_HEADERS into message dicts, sorted by UID."""
     messages = []
+    pending = None  # headers whose UID arrives after the literal
+    for item in data:
+        if isinstance(item, tuple):
+            meta, raw = item
+            headers = _header_parser.parsebytes(raw)
+            match = _UID_RE.search(meta)
+            if match:
+                messages.append((int(match.group(1)), headers))
+                pending = None
+            else:
+                pending = headers
+        elif pending is not None and item:
+            match = _UID_RE.search(item)
+            if match:
+                messages.append((int(match.group(1)), pending))
+            pending = None
+
+    messages.sort(key=lambda m: m[0])
+    # Values are unfolded: a folded Message-ID ("\r\n <id@host>") compares
+    # and is quoted back in In-Reply-To like the plain one
+    return [
+        {
+            "uid": str(uid),
+            "subject": _unfold(headers.get("Subject", "")),
+            "from": _unfold(headers.get("From", "")),
+            "message_id": _unfold(headers.get("Message-ID", "")),
+            "in_reply_to": _unfold(headers.get("In-Reply-To", "")),
+        }
+        for uid, headers in messages
+    ]
+
+
+def fetch_headers(session: ImapSession, uids: list[str]) -> list[dict]:
+    """Fetch reply-matching headers for uids with a single pipelined UID FETCH."""
+    if not uids:
+        return []
+    typ, data = session.imap.uid("FETCH", ",".join(uids), _FETCH_HEADERS)
+    if typ != "OK":
+        raise RuntimeError(f"UID FETCH failed: {data}")
+    return _parse_header_fetch(data)
+
+
+def check_inbox_for_message(
+    account,
+    search_criteria: str = "UNSEEN",
+    imap: Optional[ImapSession] = None,
+    limit: int = 20,
+    cursor=None,
+) -> list[dict]:
+    """
+    Check IMAP inbox for messages matching criteria. Returns list of message dicts
+    keyed by UID. Messages are not marked as seen.
+    Pass imap to run over an already borrowed session (see imap_session), and
+    cursor to only look at messages that arrived since the last check (see sync_mailbox).
+    """
+    if cursor is not None:
+        return sync_mailbox(account, cursor, search_criteria, imap=imap)
     try:
-        imap = _get_imap(account)
-        imap.select("INBOX")
-
-        _, data = imap.search(None, search_criteria)
-        msg_ids = data[0].split() if data[0] else []
-
-        for num in msg_ids[-20:]:  # limit to last 20 unseen
-            _, msg_data = imap.fetch(num, "(RFC822)")
-            raw = msg_data[0][1]
-            parsed = email_lib.message_from_bytes(raw)
-            messages.append({
-                "uid": num.decode(),
-                "subject": parsed.get("Subject", ""),
-                "from": parsed.get("From", ""),
-                "message_id": parsed.get("Message-ID", ""),
-                "in_reply_to": parsed.get("In-Reply-To", ""),
-            })
+        with _imap_or_session(account, imap) as session:
+            session.select("INBOX")
 
-        imap.logout()
+            typ, data = session.imap.uid("SEARCH", None, search_criteria)
+            if typ != "OK":
+                raise RuntimeError(f"UID SEARCH failed: {data}")
+            uids = data[0].decode().split() if data and data[0] else []
+
+            return fetch_headers(session, uids[-limit:])  # limit to the newest matches
     except Exception as e:
         raise RuntimeError(f"IMAP error for {account.email}: {e}")
 
-    return messages
 
+# UIDs per UID FETCH command when draining a large backlog.
+_FETCH_CHUNK = 500
 
-def mark_as_read(account, uid: str) -> None:
-    """Mark an email as read via IMAP."""
-    imap = _get_imap(account)
-    imap.select("INBOX")
-    imap.store(uid, "+FLAGS", "\\Seen")
-    imap.logout()
 
+def sync_mailbox(
+    account,
+    cursor,
+    search_criteria: str = "UNSEEN",
+    imap: Optional[ImapSession] = None,
+    limit: int = 200,
+) -> list[dict]:
+    """
+    Incremental inbox check. cursor carries uidvalidity, last_uid and
+    highest_modseq (see models.MailboxCursor) and is advanced in place; the
+    caller persists it.
 
-def test_connection(account) -> dict:
-    """Test SMTP and IMAP connectivity. Returns status dict."""
-    results = {"smtp": False, "imap": False, "smtp_error": None, "imap_error": None}
+    Only UIDs above last_uid are searched. If UIDNEXT or, with CONDSTORE,
+    HIGHESTMODSEQ show the mailbox is unchanged, no search is sent at all.
+    When UIDVALIDITY changes (or on first sync) the cursor restarts from the
+    newest `limit` messages matching search_criteria.
+    """
+    try:
+        with _imap_or_session(account, imap) as session:
+            status = session.select("INBOX", condstore=True)
+            uidvalidity = status["uidvalidity"]
+            uidnext = status["uidnext"]
+            modseq = status["highestmodseq"]
+
+            if cursor.uidvalidity is None or cursor.uidvalidity != uidvalidity:
+                typ, data = session.imap.uid("SEARCH", None, search_criteria)
+                if typ != "OK":
+                    raise RuntimeError(f"UID SEARCH failed: {data}")
+                uids = data[0].decode().split() if data and data[0] else []
+                uids = uids[-limit:]
+                cursor.uidvalidity = uidvalidity
+                cursor.last_uid = 0
+            elif modseq is not None and modseq == cursor.highest_modseq:
+                return []
+            elif uidnext is not None and uidnext - 1 <= (cursor.last_uid or 0):
+                cursor.highest_modseq = modseq
+                return []
+            else:
+                typ, data = session.imap.uid(
+                    "SEARCH", None, f"UID {(cursor.last_uid or 0) + 1}:*", search_criteria,
+                )
+                if typ != "OK":
+                    raise RuntimeError(f"UID SEARCH failed: {data}")
+                # "n:*" always matches the highest UID, even when it is below n
+                uids = [
+                    u for u in (data[0].decode().split() if data and data[0] else [])
+                    if int(u) > (cursor.last_uid or 0)
+                ]
+
+            messages = []
+            for i in range(0, len(uids), _FETCH_CHUNK):
+                messages.extend(fetch_headers(session, uids[i:i + _FETCH_CHUNK]))
+
+            highest = max([int(u) for u in uids] + [cursor.last_uid or 0])
+            if uidnext is not None:
+                highest = max(highest, uidnext - 1)
+            cursor.last_uid = highest
+            cursor.highest_modseq = modseq
+            return messages
+    except Exception as e:
+        raise RuntimeError(f"IMAP error for {account.email}: {e}")
+
+
+# Bounded scan used only for servers that reject SEARCH HEADER.
+HEADER_SEARCH_FALLBACK_LIMIT = int(os.environ.get("HEADER_SEARCH_FALLBACK_LIMIT", "50"))
+
+_MESSAGE_FIELDS = {"message-id": "message_id", "in-reply-to": "in_reply_to"}
+
+# IMAP hosts that can't SEARCH HEADER (see _header_search_unsupported); skip straight to the scan.
+_no_header_search: set[str] = set()
+
+# NO replies that reject the search itself rather than failing for the moment
+_UNSUPPORTED_RE = re.compile(r"unsupported|not supported|not implemented|unknown search", re.IGNORECASE)
+
+
+def _header_search_unsupported(status: str, reply: str) -> bool:
+    """
+    True if a failed SEARCH HEADER means the host lacks it: a BAD reply or a
+    NO naming the search unsupported. Other NO replies (server busy,
+    mailbox locked) are transient and only this check falls back to the scan.
+    """
+    return status.upper() == "BAD" or bool(_UNSUPPORTED_RE.search(reply))
+
+
+def _imap_quote(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def find_message(
+    account,
+    header: str,
+    value: str,
+    imap: Optional[ImapSession] = None,
+) -> Optional[dict]:
+    """
+    Locate the newest message whose header (Message-ID or In-Reply-To) contains
+    value using UID SEARCH HEADER, so exactly one round trip finds the target.
+    Falls back to a bounded scan of recent UNSEEN messages when the server does
+    not support header search. Returns a message dict or None.
+    """
+    field = _MESSAGE_FIELDS[header.lower()]
+    with _imap_or_session(account, imap) as session:
+        if account.imap_host not in _no_header_search:
+            session.select("INBOX")
+            try:
+                typ, data = session.imap.uid("SEARCH", None, "HEADER", header, _imap_quote(value))
+            except imaplib.IMAP4.abort:
+                raise
+            except imaplib.IMAP4.error as e:
+                # imaplib raises on BAD
+                typ, data = "BAD", [str(e).encode()]
+            if typ == "OK":
+                uids = data[0].decode().split() if data and data[0] else []
+                if not uids:
+                    return None
+                messages = fetch_headers(session, uids[-1:])
+                return messages[-1] if messages else None
+            reply = b" ".join(d for d in data if isinstance(d, bytes)).decode(errors="replace")
+            if _header_search_unsupported(typ, reply):
+                _no_header_search.add(account.imap_host)
+
+        messages = check_inbox_for_message(
+            account, "UNSEEN", imap=session, limit=HEADER_SEARCH_FALLBACK_LIMIT,
+        )
+    for msg in reversed(messages):
+        if value in msg.get(field, ""):
+            return msg
+    return None
+
+
+def mark_as_read(account, uid: str, imap: Optional[ImapSession] = None) -> None:
+    """Mark an email as read via IMAP. uid is an IMAP UID, not a sequence number."""
+    with _imap_or_session(account, imap) as session:
+        session.select("INBOX", refresh=False)
+        session.imap.uid("STORE", uid, "+FLAGS", "(\\Seen)")
+
+
+def check_smtp(account) -> Optional[str]:
+    """Log in over SMTP on a fresh connection. Returns the error, or None if it worked."""
     try:
         with _get_smtp(account):
-            results["smtp"] = True
+            return None
     except Exception as e:
-        results["smtp_error"] = str(e)
+        return str(e)
 
+
+def check_imap(account) -> Optional[str]:
+    """Log in over IMAP on a fresh connection. Returns the error, or None if it worked."""
     try:
         imap = _get_imap(account)
         imap.logout()
-        results["imap"] = True
+        return None
     except Exception as e:
-        results["imap_error"] = str(e)
+        return str(e)
+
 
-    return results
+def test_connection(account) -> dict:
+    """Test SMTP and IMAP connectivity. Returns status dict."""
+    smtp_error = check_smtp(account)
+    imap_error = check_imap(account)
+    return {
+        "smtp": smtp_error is None,
+        "imap": imap_error is None,
+        "smtp_error": smtp_error,
+        "imap_error": imap_error,
+    }
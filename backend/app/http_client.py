@@ -0,0 +1,148 @@
+"""
+Shared HTTP client for outbound API calls (OAuth2 token endpoints).
+
+One requests.Session per process keeps TLS connections to
+login.microsoftonline.com / oauth2.googleapis.com alive across calls and
+threads. Connection failures and 429/5xx responses are retried with
+jittered exponential backoff (honouring Retry-After), and every request is
+timed per host; see stats(). Each process also publishes its stats to Redis,
+where cluster_stats() sums them for the API (GET /stats/http): the token
+calls happen in the workers, not in the API process.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+import redis
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "32"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", "0.5"))
+HTTP_BACKOFF_JITTER = float(os.environ.get("HTTP_BACKOFF_JITTER", "0.5"))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "15"))
+# Requests slower than this are logged at WARNING
+HTTP_SLOW_MS = float(os.environ.get("HTTP_SLOW_MS", "2000"))
+# Published stats are dropped this long after the last request of any process
+HTTP_STATS_TTL = int(os.environ.get("HTTP_STATS_TTL", str(24 * 3600)))
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+
+STATS_KEY = "warming:http:stats"
+
+logger = logging.getLogger(__name__)
+
+redis_conn = redis.from_url(REDIS_URL)
+
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_stats: dict[str, dict] = {}
+
+
+def _build_session() -> requests.Session:
+    retry = Retry(
+        total=HTTP_RETRIES,
+        connect=HTTP_RETRIES,
+        # A token request may have been processed before the read failed;
+        # don't resend it (a refresh token could be rotated twice)
+        read=0,
+        status=HTTP_RETRIES,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=None,  # token endpoints are POST
+        backoff_factor=HTTP_BACKOFF,
+        backoff_jitter=HTTP_BACKOFF_JITTER,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """The process-wide session (recreated after fork, like email_service's pools)."""
+    global _session, _session_pid
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = _build_session()
+            _session_pid = os.getpid()
+        return _session
+
+
+def _record(host: str, elapsed_ms: float, failed: bool) -> None:
+    with _lock:
+        entry = _stats.setdefault(host, {"requests": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        entry["requests"] += 1
+        entry["errors"] += int(failed)
+        entry["total_ms"] += elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """session.request with the default timeout, retries and timing."""
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    host = urlsplit(url).hostname or url
+    start = time.perf_counter()
+    failed = True
+    try:
+        resp = get_session().request(method, url, **kwargs)
+        failed = resp.status_code >= 500 or resp.status_code == 429
+        return resp
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        _record(host, elapsed_ms, failed)
+        _publish()
+        if elapsed_ms >= HTTP_SLOW_MS:
+            logger.warning(f"{method} {host} took {elapsed_ms:.0f}ms")
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def stats() -> dict[str, dict]:
+    """Per-host request counts, errors and latency (ms) since process start."""
+    with _lock:
+        return {
+            host: {**entry, "avg_ms": entry["total_ms"] / entry["requests"]}
+            for host, entry in _stats.items()
+        }
+
+
+def _publish() -> None:
+    """Write this process's stats() to Redis for cluster_stats()."""
+    try:
+        pipe = redis_conn.pipeline()
+        pipe.hset(STATS_KEY, f"{socket.gethostname()}:{os.getpid()}", json.dumps(stats()))
+        pipe.expire(STATS_KEY, HTTP_STATS_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.debug(f"Publishing HTTP stats failed: {e}")
+
+
+def cluster_stats() -> dict:
+    """stats() summed over every process that published within HTTP_STATS_TTL."""
+    snapshots = redis_conn.hgetall(STATS_KEY)
+    hosts: dict[str, dict] = {}
+    for snapshot in snapshots.values():
+        for host, entry in json.loads(snapshot).items():
+            total = hosts.setdefault(host, {"requests": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            total["requests"] += entry["requests"]
+            total["errors"] += entry["errors"]
+            total["total_ms"] += entry["total_ms"]
+            total["max_ms"] = max(total["max_ms"], entry["max_ms"])
+    for total in hosts.values():
+        total["avg_ms"] = round(total["total_ms"] / total["requests"], 1)
+        total["total_ms"] = round(total["total_ms"], 1)
+        total["max_ms"] = round(total["max_ms"], 1)
+    return {"processes": len(snapshots), "hosts": hosts}
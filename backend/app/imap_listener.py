@@ -0,0 +1,395 @@
+"""
+IMAP IDLE push listener.
+Run with: python -m app.imap_listener
+
+Holds one IDLE connection per mailbox, multiplexed on a single asyncio loop,
+and feeds new arrivals into the reply pipeline in tasks.py within seconds.
+Every mailbox with a live session is heartbeated into a Redis sorted set;
+only those (see listener_covers) skip the delayed check_domain_inbox /
+check_warming_account_inbox polling jobs, unless the message was synced
+before its log was committed (conversation._check_delay). Mailboxes beyond
+IMAP_LISTENER_MAX_SESSIONS, or all of them while the listener is down,
+keep being polled. Every IDLE session holds a rate_limiter connection lease
+for its host; a mailbox whose host is at its limit is polled until a
+reconnect gets a lease.
+
+Environment:
+  IMAP_LISTENER_SCOPE          "domain", "warming" or "all" (empty = disabled)
+  IMAP_LISTENER_SHARD          "i/n" – watch only mailboxes with id % n == i
+  IMAP_LISTENER_MAX_SESSIONS   max mailboxes watched by this process
+  IMAP_LISTENER_CONNECT_LIMIT  concurrent logins (avoids login storms)
+  IMAP_LISTENER_REPLY_DELAY    "min-max" seconds before the reply task runs
+  IMAP_LISTENER_POLL_INTERVAL  seconds between checks on servers without IDLE
+  IMAP_LISTENER_HEARTBEAT      seconds between heartbeats of the watched mailboxes
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+
+import redis
+
+IMAP_LISTENER_SCOPE = os.environ.get("IMAP_LISTENER_SCOPE", "").strip().lower()
+IMAP_LISTENER_SHARD = os.environ.get("IMAP_LISTENER_SHARD", "0/1")
+IMAP_LISTENER_MAX_SESSIONS = int(os.environ.get("IMAP_LISTENER_MAX_SESSIONS", "2000"))
+IMAP_LISTENER_CONNECT_LIMIT = int(os.environ.get("IMAP_LISTENER_CONNECT_LIMIT", "20"))
+IMAP_LISTENER_REPLY_DELAY = os.environ.get("IMAP_LISTENER_REPLY_DELAY", "60-300")
+# RFC 2177: re-issue IDLE before the server's 30 min inactivity timeout
+IMAP_IDLE_REFRESH = float(os.environ.get("IMAP_IDLE_REFRESH", str(25 * 60)))
+IMAP_LISTENER_RELOAD = float(os.environ.get("IMAP_LISTENER_RELOAD", "300"))
+IMAP_LISTENER_POLL_INTERVAL = float(os.environ.get("IMAP_LISTENER_POLL_INTERVAL", "60"))
+IMAP_LISTENER_HEARTBEAT = float(os.environ.get("IMAP_LISTENER_HEARTBEAT", "60"))
+IMAP_LISTENER_INITIAL_SCAN = 200
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+# "kind:id" of every mailbox with a live session, scored by its last heartbeat
+WATCHED_KEY = "warming:listener:watched"
+
+logger = logging.getLogger(__name__)
+
+redis_conn = redis.from_url(REDIS_URL)
+
+# Mailboxes of this process with a live session, as "kind:id"
+_connected: set[str] = set()
+# rate_limiter connection lease of each open session, renewed by _heartbeat
+_leases: dict = {}
+
+
+def _in_scope(kind: str) -> bool:
+    return IMAP_LISTENER_SCOPE in (kind, "all")
+
+
+def listener_covers(kind: str, owner_id: int) -> bool:
+    """
+    True if a running listener holds a session on this mailbox ("domain" or
+    "warming" kind), i.e. its heartbeat is recent. Otherwise the caller
+    schedules the delayed polling check.
+    """
+    if not _in_scope(kind):
+        return False
+    try:
+        seen = redis_conn.zscore(WATCHED_KEY, f"{kind}:{owner_id}")
+    except redis.RedisError:
+        return False
+    return seen is not None and seen >= time.time() - 3 * IMAP_LISTENER_HEARTBEAT
+
+
+def _reply_delay() -> int:
+    low, _, high = IMAP_LISTENER_REPLY_DELAY.partition("-")
+    low = int(low or 0)
+    return random.randint(low, int(high or low))
+
+
+# ── Database side (runs in worker threads) ──────────────────────────────────
+
+def _owner_model(kind: str):
+    from .models import DomainEmail, WarmingAccount
+
+    return DomainEmail if kind == "domain" else WarmingAccount
+
+
+def _load_mailboxes() -> list[tuple[str, int]]:
+    """Mailboxes this process should watch, as (kind, id)."""
+    from .database import SessionLocal
+    from .models import DomainEmail, WarmingAccount
+
+    shard, _, shards = IMAP_LISTENER_SHARD.partition("/")
+    shard, shards = int(shard), int(shards or 1)
+
+    db = SessionLocal()
+    try:
+        keys = []
+        if _in_scope("domain"):
+            keys += [("domain", row.id) for row in db.query(DomainEmail.id).all()]
+        if _in_scope("warming"):
+            keys += [
+                ("warming", row.id)
+                for row in db.query(WarmingAccount.id).filter(WarmingAccount.active == True).all()
+            ]
+        keys = [k for k in keys if k[1] % shards == shard]
+        if len(keys) > IMAP_LISTENER_MAX_SESSIONS:
+            logger.warning(
+                f"{len(keys)} mailboxes in scope, watching {IMAP_LISTENER_MAX_SESSIONS} "
+                f"(IMAP_LISTENER_MAX_SESSIONS); the rest are polled"
+            )
+        return keys[:IMAP_LISTENER_MAX_SESSIONS]
+    finally:
+        db.close()
+
+
+def _connection_params(kind: str, owner_id: int):
+    """Login parameters for a mailbox, refreshing its OAuth2 token if needed."""
+    from .database import SessionLocal
+    from .email_service import _build_xoauth2_string, get_valid_access_token
+
+    db = SessionLocal()
+    try:
+        owner = db.get(_owner_model(kind), owner_id)
+        if owner is None:
+            return None
+        params = {
+            "email": owner.email,
+            "host": owner.imap_host,
+            "port": owner.imap_port,
+            "password": owner.password,
+            "xoauth2": None,
+        }
+        if owner.auth_type == "oauth2":
+            token = get_valid_access_token(owner)
+            db.commit()
+            params["xoauth2"] = _build_xoauth2_string(owner.email, token)
+        return params
+    finally:
+        db.close()
+
+
+def _load_cursor(kind: str, owner_id: int) -> dict:
+    from .database import SessionLocal
+    from .models import MailboxCursor
+
+    column = MailboxCursor.domain_email_id if kind == "domain" else MailboxCursor.warming_account_id
+    db = SessionLocal()
+    try:
+        cursor = db.query(MailboxCursor).filter(column == owner_id).first()
+        if cursor is None:
+            return {"uidvalidity": None, "last_uid": 0}
+        return {"uidvalidity": cursor.uidvalidity, "last_uid": cursor.last_uid or 0}
+    finally:
+        db.close()
+
+
+def _record_arrivals(kind: str, owner_id: int, uidvalidity, last_uid: int, messages: list[dict]) -> int:
+    """Advance the mailbox cursor and hand matching messages to the reply pipeline."""
+    from .database import SessionLocal
+    from .models import LogStatusEnum, WarmingLog
+    from .reply_index import index_arrivals
+    from .tasks import enqueue_warming_task
+    from .warming_engine import get_mailbox_cursor
+
+    db = SessionLocal()
+    try:
+        owner = db.get(_owner_model(kind), owner_id)
+        if owner is None:
+            return 0
+        cursor = get_mailbox_cursor(db, owner)
+        cursor.uidvalidity = uidvalidity
+        cursor.last_uid = last_uid
+        # The dispatched checks look their message up here (reply_index).
+        # Indexed before the logs are matched: an arrival whose log is
+        # committed after this query is found there by conversation._check_delay.
+        index_arrivals(kind, owner_id, uidvalidity, messages)
+
+        dispatched = 0
+        for msg in messages:
+            if kind == "domain":
+                # A warming email arrived: its Message-ID is on the log
+                if not msg["message_id"]:
+                    continue
+                log = db.query(WarmingLog).filter(
+                    WarmingLog.domain_email_id == owner_id,
+                    WarmingLog.message_id == msg["message_id"],
+                    WarmingLog.status == LogStatusEnum.sent,
+                ).first()
+                if log:
+                    enqueue_warming_task(
+                        "check_domain_inbox",
+                        log.domain_email_id,
+                        log.warming_account_id,
+                        log.campaign_id,
+                        log.id,
+                        delay_seconds=_reply_delay(),
+                    )
+                    dispatched += 1
+            else:
+                # The domain's reply arrived: it answers the log's original message
+                if not msg["in_reply_to"]:
+                    continue
+                log = db.query(WarmingLog).filter(
+                    WarmingLog.warming_account_id == owner_id,
+                    WarmingLog.message_id == msg["in_reply_to"],
+                    WarmingLog.status == LogStatusEnum.replied,
+                ).first()
+                if log:
+                    enqueue_warming_task(
+                        "check_warming_account_inbox",
+                        log.warming_account_id,
+                        log.domain_email_id,
+                        log.campaign_id,
+                        log.id,
+                        msg["message_id"],
+                        msg["subject"],
+                        delay_seconds=_reply_delay(),
+                    )
+                    dispatched += 1
+
+        db.commit()
+        return dispatched
+    finally:
+        db.close()
+
+
+# ── IMAP side ───────────────────────────────────────────────────────────────
+
+async def _sync(client, kind: str, owner_id: int, status: dict) -> None:
+    """Fetch headers of messages that arrived since the stored cursor and dispatch them."""
+    from .email_service import _FETCH_CHUNK, _FETCH_HEADERS, _parse_header_fetch
+
+    cursor = await asyncio.to_thread(_load_cursor, kind, owner_id)
+    uidvalidity = client.status.get("uidvalidity")
+    if cursor["uidvalidity"] != uidvalidity:
+        uids = (await client.uid_search("UNSEEN"))[-IMAP_LISTENER_INITIAL_SCAN:]
+        last_uid = 0
+    else:
+        last_uid = cursor["last_uid"]
+        uids = [u for u in await client.uid_search(f"UID {last_uid + 1}:*", "UNSEEN") if u > last_uid]
+
+    messages = []
+    for i in range(0, len(uids), _FETCH_CHUNK):
+        chunk = ",".join(str(u) for u in uids[i:i + _FETCH_CHUNK])
+        messages.extend(_parse_header_fetch(await client.uid_fetch(chunk, _FETCH_HEADERS)))
+
+    last_uid = max(uids + [last_uid])
+    if status.get("uidnext"):
+        last_uid = max(last_uid, status["uidnext"] - 1)
+    if messages or last_uid != cursor["last_uid"] or uidvalidity != cursor["uidvalidity"]:
+        dispatched = await asyncio.to_thread(
+            _record_arrivals, kind, owner_id, uidvalidity, last_uid, messages,
+        )
+        if dispatched:
+            logger.info(f"{kind}:{owner_id}: {dispatched} arrival(s) dispatched")
+
+
+def _set_watched(key: str, live: bool) -> None:
+    """Add a mailbox to (or drop it from) the watched set without waiting for the heartbeat."""
+    if live:
+        _connected.add(key)
+    else:
+        _connected.discard(key)
+    try:
+        if live:
+            redis_conn.zadd(WATCHED_KEY, {key: time.time()})
+        else:
+            redis_conn.zrem(WATCHED_KEY, key)
+    except redis.RedisError as e:
+        logger.warning(f"Updating {WATCHED_KEY} failed: {e}")
+
+
+def _take_lease(key: str, host: str) -> None:
+    """Count the session against host's connection limit (raises RateLimited at the limit)."""
+    from .rate_limiter import connection_lease
+
+    _leases[key] = connection_lease(host)
+
+
+def _drop_lease(key: str) -> None:
+    from .rate_limiter import release
+
+    lease = _leases.pop(key, None)
+    if lease is None:
+        return
+    try:
+        release(lease)
+    except redis.RedisError:
+        pass  # expires after RATE_LIMIT_LEASE_TTL
+
+
+def _heartbeat() -> None:
+    from .rate_limiter import renew
+
+    for lease in list(_leases.values()):
+        renew(lease)
+    now = time.time()
+    pipe = redis_conn.pipeline()
+    if _connected:
+        pipe.zadd(WATCHED_KEY, {key: now for key in _connected})
+    # Entries of listeners that stopped without cleaning up
+    pipe.zremrangebyscore(WATCHED_KEY, "-inf", now - 3 * IMAP_LISTENER_HEARTBEAT)
+    pipe.execute()
+
+
+async def watch_mailbox(kind: str, owner_id: int, connect_limit: asyncio.Semaphore) -> None:
+    """Keep an IDLE session open on one mailbox, reconnecting with backoff."""
+    from .async_imap import AsyncImapClient
+
+    key = f"{kind}:{owner_id}"
+    backoff = 5.0
+    while True:
+        client = None
+        try:
+            async with connect_limit:
+                params = await asyncio.to_thread(_connection_params, kind, owner_id)
+                if params is None:
+                    return
+                # IDLE sessions count against the host's limit like the workers' connections
+                await asyncio.to_thread(_take_lease, key, params["host"])
+                client = AsyncImapClient(params["host"], params["port"])
+                await client.connect()
+                if params["xoauth2"]:
+                    await client.authenticate_xoauth2(params["xoauth2"])
+                else:
+                    await client.login(params["email"], params["password"] or "")
+                status = await client.select("INBOX")
+
+            await _sync(client, kind, owner_id, status)
+            await asyncio.to_thread(_set_watched, key, True)
+            backoff = 5.0
+            while True:
+                if "IDLE" in client.capabilities:
+                    events = await client.idle(IMAP_IDLE_REFRESH)
+                    if any(b"EXISTS" in e for e in events):
+                        await _sync(client, kind, owner_id, {})
+                else:
+                    # No push support: poll the cursor over the open session instead
+                    await asyncio.sleep(IMAP_LISTENER_POLL_INTERVAL)
+                    await _sync(client, kind, owner_id, {})
+        except asyncio.CancelledError:
+            _set_watched(key, False)
+            if client is not None:
+                await client.logout()
+            _drop_lease(key)
+            raise
+        except Exception as e:
+            await asyncio.to_thread(_set_watched, key, False)
+            logger.warning(f"{kind}:{owner_id}: {e}; reconnecting in {backoff:.0f}s")
+            if client is not None:
+                await client.close()
+            await asyncio.to_thread(_drop_lease, key)
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.5))
+            backoff = min(backoff * 2, 300.0)
+
+
+async def _heartbeats() -> None:
+    while True:
+        try:
+            await asyncio.to_thread(_heartbeat)
+        except redis.RedisError as e:
+            logger.warning(f"Heartbeat failed: {e}")
+        await asyncio.sleep(IMAP_LISTENER_HEARTBEAT)
+
+
+async def run_listener() -> None:
+    """Watch the configured mailboxes, picking up added/removed ones every IMAP_LISTENER_RELOAD s."""
+    connect_limit = asyncio.Semaphore(IMAP_LISTENER_CONNECT_LIMIT)
+    watchers: dict[tuple[str, int], asyncio.Task] = {}
+    heartbeats = asyncio.create_task(_heartbeats())  # referenced so it isn't garbage-collected
+    while True:
+        wanted = set(await asyncio.to_thread(_load_mailboxes))
+        for key in set(watchers) - wanted:
+            watchers.pop(key).cancel()
+        for key, task in list(watchers.items()):
+            if task.done():
+                del watchers[key]
+        for key in wanted - set(watchers):
+            watchers[key] = asyncio.create_task(watch_mailbox(*key, connect_limit))
+        logger.info(f"Watching {len(watchers)} mailbox(es)")
+        await asyncio.sleep(IMAP_LISTENER_RELOAD)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if not IMAP_LISTENER_SCOPE:
+        raise SystemExit("IMAP_LISTENER_SCOPE is not set (domain, warming or all)")
+    logger.info(f"Starting IMAP IDLE listener (scope={IMAP_LISTENER_SCOPE}, shard={IMAP_LISTENER_SHARD})...")
+    asyncio.run(run_listener())
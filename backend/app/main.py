@@ -1,18 +1,22 @@
-import csv
-import io
+import json
 import os
+import time
 from datetime import datetime
 from typing import List, Optional
 
 from fastapi import Depends, FastAPI, Header, HTTPException, UploadFile, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 
+from .account_import import iter_file_chunks, store_upload
+from .connection_tests import record_test
 from .database import Base, engine, get_db
 from .email_service import PROVIDER_SETTINGS, test_connection
-from .oauth2_service import detect_provider, get_outlook_token_ropc
+from .oauth2_service import apply_outlook_tokens, get_outlook_token_ropc
 from .models import (
+    AccountHealth,
     AuthTypeEnum,
     CampaignStatusEnum,
     Domain,
@@ -23,8 +27,10 @@ from .models import (
     WarmingCampaign,
     WarmingLog,
 )
+from .reputation_monitor import latest_snapshots, snapshot_history
 from .reputation_service import check_domain_reputation
 from .schemas import (
+    AccountHealthOut,
     AccountTextImportRequest,
     CampaignCreate,
     CampaignOut,
@@ -36,11 +42,14 @@ from .schemas import (
     DomainOut,
     DomainReputation,
     LoginRequest,
+    ReputationLatest,
+    ReputationSnapshotOut,
     WarmingAccountCreate,
     WarmingAccountOut,
     WarmingAccountUpdate,
     WarmingLogOut,
 )
+from .token_cache import invalidate as invalidate_token
 
 Base.metadata.create_all(bind=engine)
 
@@ -160,53 +169,6 @@ def _apply_provider_defaults(data: WarmingAccountCreate) -> WarmingAccountCreate
     return data
 
 
-def _create_account_from_credentials(
-    db: Session,
-    email: str,
-    password: Optional[str],
-    auto_oauth2: bool,
-    line_label: str,
-) -> tuple[Optional[WarmingAccount], bool, Optional[str]]:
-    """Create warming account from email/password with provider autodetection."""
-    provider_val = detect_provider(email)
-
-    if provider_val == "gmail":
-        auth_type_val = "app_password"
-    elif provider_val == "outlook" and auto_oauth2:
-        auth_type_val = "oauth2"
-    else:
-        auth_type_val = "password"
-
-    data = WarmingAccountCreate(
-        email=email,
-        password=password,
-        provider=ProviderEnum(provider_val),
-        auth_type=AuthTypeEnum(auth_type_val),
-    )
-    data = _apply_provider_defaults(data)
-
-    existing = db.query(WarmingAccount).filter(WarmingAccount.email == data.email).first()
-    if existing:
-        return None, False, f"{line_label}: {email} existiert bereits"
-
-    account = WarmingAccount(**data.model_dump())
-    oauth2_ok = False
-
-    if auto_oauth2 and provider_val == "outlook" and password:
-        try:
-            tok = get_outlook_token_ropc(email, password)
-            account.oauth2_access_token = tok["access_token"]
-            account.oauth2_refresh_token = tok["refresh_token"]
-            account.oauth2_token_expiry = tok["token_expiry"]
-            account.auth_type = AuthTypeEnum.oauth2
-            account.password = None
-            oauth2_ok = True
-        except Exception as e:
-            return None, False, f"{line_label}: OAuth2 für {email} fehlgeschlagen – {e}"
-
-    return account, oauth2_ok, None
-
-
 @app.get("/accounts", response_model=List[WarmingAccountOut], dependencies=[Depends(verify_token)])
 def list_accounts(
     provider: Optional[str] = None,
@@ -234,21 +196,24 @@ def create_account(data: WarmingAccountCreate, db: Session = Depends(get_db)):
     return account
 
 
+def _enqueue_import(upload_key: str, fmt: str, auto_oauth2: bool) -> dict:
+    from .tasks import enqueue_warming_task
+
+    job = enqueue_warming_task(
+        "import_accounts", upload_key, fmt, auto_oauth2, job_timeout=4 * 3600, result_ttl=24 * 3600,
+    )
+    return {"job_id": job.id, "status": job.get_status()}
+
+
 @app.post("/accounts/import", dependencies=[Depends(verify_token)])
-async def import_accounts_csv(
-    file: UploadFile,
-    auto_oauth2: bool = True,
-    db: Session = Depends(get_db),
-):
+def import_accounts_csv(file: UploadFile, auto_oauth2: bool = True):
     """
     Smart CSV import.
 
     Minimal CSV (only 2 columns needed):
         email,password
 
-    Optional columns:
-        provider   → auto-detected from email domain if omitted
-        auth_type  → auto-set based on provider if omitted
+    Provider and SMTP/IMAP settings are auto-detected from the email domain.
 
     auto_oauth2=true: automatically fetch Outlook OAuth2 tokens during import
     (requires OUTLOOK_CLIENT_ID in .env)
@@ -256,95 +221,26 @@ async def import_accounts_csv(
     Gmail: password MUST be an App Password (16 chars, spaces optional)
     Outlook: if auto_oauth2=true, password is used to fetch token then discarded
     Firstmail: standard password, works directly
-    """
-    content = await file.read()
-    reader = csv.DictReader(io.StringIO(content.decode("utf-8-sig")))
-    created = 0
-    oauth2_ok = 0
-    errors = []
-
-    for i, row in enumerate(reader):
-        try:
-            email = row.get("email", "").strip()
-            if not email:
-                errors.append(f"Zeile {i+2}: Email fehlt")
-                continue
-
-            password = row.get("password", "").strip() or None
-            account, got_oauth2, err = _create_account_from_credentials(
-                db=db,
-                email=email,
-                password=password,
-                auto_oauth2=auto_oauth2,
-                line_label=f"Zeile {i+2}",
-            )
-            if err:
-                errors.append(err)
-                continue
-
-            db.add(account)
-            created += 1
-            if got_oauth2:
-                oauth2_ok += 1
-        except Exception as e:
-            errors.append(f"Zeile {i+2}: {e}")
 
-    db.commit()
-    return {"created": created, "oauth2_tokens_fetched": oauth2_ok, "errors": errors}
+    Runs as a background job; poll GET /jobs/{job_id} for progress and the
+    result (created, oauth2_tokens_fetched, errors).
+    """
+    upload_key = store_upload(iter_file_chunks(file.file))
+    return _enqueue_import(upload_key, "csv", auto_oauth2)
 
 
 @app.post("/accounts/import-text", dependencies=[Depends(verify_token)])
-def import_accounts_text(
-    data: AccountTextImportRequest,
-    auto_oauth2: bool = True,
-    db: Session = Depends(get_db),
-):
+def import_accounts_text(data: AccountTextImportRequest, auto_oauth2: bool = True):
     """
     Import accounts from plain text lines in format:
         email:password
 
     Empty lines and lines starting with # are ignored.
     Provider + SMTP/IMAP are auto-detected from email domain.
+    Runs as a background job like /accounts/import.
     """
-    created = 0
-    oauth2_ok = 0
-    errors = []
-
-    for i, raw_line in enumerate(data.lines.splitlines()):
-        line = raw_line.strip()
-        if not line or line.startswith("#"):
-            continue
-
-        if ":" not in line:
-            errors.append(f"Zeile {i+1}: Format ungültig, erwartet email:password")
-            continue
-
-        email, password = line.split(":", 1)
-        email = email.strip()
-        password = password.strip() or None
-
-        if not email or "@" not in email:
-            errors.append(f"Zeile {i+1}: Ungültige Email")
-            continue
-
-        account, got_oauth2, err = _create_account_from_credentials(
-            db=db,
-            email=email,
-            password=password,
-            auto_oauth2=auto_oauth2,
-            line_label=f"Zeile {i+1}",
-        )
-        if err:
-            errors.append(err)
-            continue
-
-        db.add(account)
-        created += 1
-        if got_oauth2:
-            oauth2_ok += 1
-
-    db.commit()
-    return {"created": created, "oauth2_tokens_fetched": oauth2_ok, "errors": errors}
+    upload_key = store_upload([data.lines.encode()])
+    return _enqueue_import(upload_key, "text", auto_oauth2)
 
 
 # ── Bulk operations ───────────────────────────────────────────────────────────
@@ -368,33 +264,79 @@ def bulk_toggle_accounts(ids: List[int], active: bool, db: Session = Depends(get
 
 
 @app.post("/accounts/bulk-oauth2", dependencies=[Depends(verify_token)])
-def bulk_fetch_oauth2_tokens(db: Session = Depends(get_db)):
+def bulk_fetch_oauth2_tokens():
     """
-    Fetch Outlook OAuth2 tokens for all Outlook accounts that still use
-    password auth and have a stored password.
-    Returns per-account results.
+    Start a background job that fetches OAuth2 tokens via ROPC for all Outlook
+    accounts that still use password auth. Poll GET /jobs/{job_id} for
+    progress and per-account results.
     """
-    accounts = db.query(WarmingAccount).filter(
-        WarmingAccount.provider == ProviderEnum.outlook,
-        WarmingAccount.auth_type == AuthTypeEnum.password,
-        WarmingAccount.password != None,
-    ).all()
-
-    results = []
-    for acc in accounts:
-        try:
-            tok = get_outlook_token_ropc(acc.email, acc.password)
-            acc.oauth2_access_token = tok["access_token"]
-            acc.oauth2_refresh_token = tok["refresh_token"]
-            acc.oauth2_token_expiry = tok["token_expiry"]
-            acc.auth_type = AuthTypeEnum.oauth2
-            acc.password = None
-            results.append({"email": acc.email, "status": "ok"})
-        except Exception as e:
-            results.append({"email": acc.email, "status": "error", "detail": str(e)})
+    from .tasks import enqueue_warming_task
 
-    db.commit()
-    return {"processed": len(results), "results": results}
+    job = enqueue_warming_task("bulk_fetch_oauth2_tokens", job_timeout=4 * 3600, result_ttl=24 * 3600)
+    return {"job_id": job.id, "status": job.get_status()}
+
+
+@app.post("/accounts/bulk-test", dependencies=[Depends(verify_token)])
+def bulk_test_accounts(
+    ids: Optional[List[int]] = None,
+    force: bool = False,
+    deactivate: bool = False,
+):
+    """
+    Start a background job that tests SMTP and IMAP login of many accounts
+    in parallel (default: all active accounts). Accounts that passed
+    recently are answered from the cached result unless force=true;
+    deactivate=true deactivates accounts that fail. Stream the per-account
+    results from GET /accounts/bulk-test/{job_id}/results; GET
+    /jobs/{job_id} has the progress counts.
+    """
+    from .tasks import enqueue_warming_task
+
+    job = enqueue_warming_task(
+        "bulk_connection_test", ids, force, deactivate, job_timeout=4 * 3600, result_ttl=24 * 3600,
+    )
+    return {"job_id": job.id, "status": job.get_status()}
+
+
+@app.get("/accounts/bulk-test/{job_id}/results", dependencies=[Depends(verify_token)])
+def stream_bulk_test_results(job_id: str, offset: int = 0):
+    """
+    Per-account results of a bulk test job as NDJSON, one line per account
+    as its checks complete; the response ends when the job has ended.
+    offset skips results already received, e.g. to resume after a disconnect.
+    """
+    from rq.exceptions import NoSuchJobError
+    from rq.job import Job
+
+    from .connection_tests import read_results
+    from .tasks import redis_conn
+
+    try:
+        job = Job.fetch(job_id, connection=redis_conn)
+    except NoSuchJobError:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    def lines():
+        sent = max(0, offset)
+        while True:
+            # Status first: results are published before the job ends
+            ended = job.get_status(refresh=True) in ("finished", "failed", "stopped", "canceled")
+            batch = read_results(job_id, sent)
+            for result in batch:
+                yield json.dumps(result) + "\n"
+            sent += len(batch)
+            if ended and not batch:
+                return
+            if not batch:
+                time.sleep(1)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/accounts/health", response_model=List[AccountHealthOut], dependencies=[Depends(verify_token)])
+def list_account_health(db: Session = Depends(get_db)):
+    """Latest connection test result of every tested account."""
+    return db.query(AccountHealth).all()
 
 
 @app.post("/accounts/{account_id}/fetch-oauth2", dependencies=[Depends(verify_token)])
@@ -409,12 +351,9 @@ def fetch_single_oauth2_token(account_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="No password stored for this account")
 
     tok = get_outlook_token_ropc(account.email, account.password)
-    account.oauth2_access_token = tok["access_token"]
-    account.oauth2_refresh_token = tok["refresh_token"]
-    account.oauth2_token_expiry = tok["token_expiry"]
-    account.auth_type = AuthTypeEnum.oauth2
-    account.password = None
+    apply_outlook_tokens(account, tok)
     db.commit()
+    invalidate_token(account.email)
     return {"status": "ok", "email": account.email}
 
 
@@ -453,7 +392,40 @@ def test_account_connection(account_id: int, db: Session = Depends(get_db)):
     account = db.get(WarmingAccount, account_id)
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
-    return test_connection(account)
+    results = test_connection(account)
+    record_test(account, results)
+    db.commit()
+    return results
+
+
+# ── Background jobs ───────────────────────────────────────────────────────────
+
+@app.get("/jobs/{job_id}", dependencies=[Depends(verify_token)])
+def get_job(job_id: str):
+    """Status, progress and result of a background job (bulk OAuth2, imports, connection tests)."""
+    from rq.exceptions import NoSuchJobError
+    from rq.job import Job
+
+    from .tasks import redis_conn
+
+    try:
+        job = Job.fetch(job_id, connection=redis_conn)
+    except NoSuchJobError:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    job_status = job.get_status()
+    error = None
+    if job_status == "failed":
+        latest = job.latest_result()
+        if latest and latest.exc_string:
+            error = latest.exc_string.strip().splitlines()[-1]
+    return {
+        "job_id": job.id,
+        "status": job_status,
+        "progress": job.meta.get("progress"),
+        "result": job.return_value() if job_status == "finished" else None,
+        "error": error,
+    }
 
 
 # ── Campaigns ─────────────────────────────────────────────────────────────────
@@ -527,7 +499,7 @@ def stop_campaign(campaign_id: int, db: Session = Depends(get_db)):
 @app.post("/campaigns/{campaign_id}/run-now", dependencies=[Depends(verify_token)])
 def run_campaign_now(campaign_id: int, db: Session = Depends(get_db)):
     """Manually trigger today's warming run for a campaign."""
-    from .tasks import enqueue_warming_task
+    from .tasks import TaskSpec, enqueue_many_tasks
     from .warming_engine import calculate_emails_today, get_warming_pairs
 
     campaign = db.get(WarmingCampaign, campaign_id)
@@ -537,20 +509,13 @@ def run_campaign_now(campaign_id: int, db: Session = Depends(get_db)):
     count = calculate_emails_today(campaign)
     pairs = get_warming_pairs(db, campaign, count)
 
-    enqueued = 0
     import random
-    for account, domain_email in pairs:
-        delay_seconds = random.randint(0, 30 * 60)
-        enqueue_warming_task(
-            "send_warming_email",
-            account.id,
-            domain_email.id,
-            campaign_id,
-            delay_seconds=delay_seconds,
-        )
-        enqueued += 1
+    result = enqueue_many_tasks(
+        TaskSpec("send_warming_email", (account_id, domain_email_id, campaign_id), random.randint(0, 30 * 60))
+        for account_id, domain_email_id in pairs
+    )
 
-    return {"enqueued": enqueued, "emails_planned": count}
+    return {"enqueued": result["jobs"], "emails_planned": count}
 
 
 # ── Logs ──────────────────────────────────────────────────────────────────────
@@ -618,6 +583,14 @@ def get_dashboard_stats(db: Session = Depends(get_db)):
     )
 
 
+@app.get("/stats/http", dependencies=[Depends(verify_token)])
+def get_http_stats():
+    """Outbound HTTP calls (OAuth2 token endpoints) per host, summed over API and worker processes."""
+    from .http_client import cluster_stats
+
+    return cluster_stats()
+
+
 @app.get("/dashboard/daily-stats", response_model=List[DailyStatPoint], dependencies=[Depends(verify_token)])
 def get_daily_stats(days: int = 14, db: Session = Depends(get_db)):
     """Return per-day email statistics for the last N days."""
@@ -652,15 +625,36 @@ def get_daily_stats(days: int = 14, db: Session = Depends(get_db)):
 # ── Reputation ────────────────────────────────────────────────────────────────
 
 @app.get("/domains/{domain_id}/reputation", response_model=DomainReputation, dependencies=[Depends(verify_token)])
-def get_domain_reputation(domain_id: int, db: Session = Depends(get_db)):
-    """Run free DNS-based reputation check on a domain."""
+def get_domain_reputation(domain_id: int, refresh: bool = False, db: Session = Depends(get_db)):
+    """Run free DNS-based reputation check on a domain (refresh=true bypasses the DNS cache)."""
     domain = db.get(Domain, domain_id)
     if not domain:
         raise HTTPException(status_code=404, detail="Domain not found")
-    return check_domain_reputation(domain.name)
+    return check_domain_reputation(domain.name, refresh=refresh)
 
 
 @app.get("/reputation/check", response_model=DomainReputation, dependencies=[Depends(verify_token)])
-def check_reputation_by_name(domain: str):
+def check_reputation_by_name(domain: str, refresh: bool = False):
     """Check reputation for any domain name (query param)."""
-    return check_domain_reputation(domain)
+    return check_domain_reputation(domain, refresh=refresh)
+
+
+@app.get("/reputation/latest", response_model=List[ReputationLatest], dependencies=[Depends(verify_token)])
+def get_latest_reputation(kind: Optional[str] = None, db: Session = Depends(get_db)):
+    """Latest scheduled scan result per domain / sending host, with changes since the previous scan."""
+    return latest_snapshots(db, kind)
+
+
+@app.get("/reputation/history", response_model=List[ReputationSnapshotOut], dependencies=[Depends(verify_token)])
+def get_reputation_history(target: str, days: int = 30, kind: Optional[str] = None, db: Session = Depends(get_db)):
+    """Score and blacklist history of one domain or host from the scheduled scans."""
+    return snapshot_history(db, target, days, kind)
+
+
+@app.post("/reputation/scan", dependencies=[Depends(verify_token)])
+def start_reputation_scan(include_hosts: Optional[bool] = None):
+    """Start a fleet reputation scan now. Poll GET /jobs/{job_id} for the summary."""
+    from .tasks import enqueue_warming_task
+
+    job = enqueue_warming_task("scan_reputation", include_hosts)
+    return {"job_id": job.id, "status": job.get_status()}
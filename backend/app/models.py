@@ -2,13 +2,16 @@ import enum
 from datetime import datetime
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     Column,
     DateTime,
     Enum,
     Float,
     ForeignKey,
+    Index,
     Integer,
+    JSON,
     String,
     Text,
 )
@@ -52,6 +55,9 @@ class Domain(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     emails = relationship("DomainEmail", back_populates="domain", cascade="all, delete-orphan")
+    reputation_snapshots = relationship(
+        "ReputationSnapshot", back_populates="domain", cascade="all, delete-orphan"
+    )
 
 
 class DomainEmail(Base):
@@ -70,6 +76,9 @@ class DomainEmail(Base):
 
     domain = relationship("Domain", back_populates="emails")
     logs = relationship("WarmingLog", back_populates="domain_email", cascade="all, delete-orphan")
+    mailbox_cursor = relationship(
+        "MailboxCursor", back_populates="domain_email", uselist=False, cascade="all, delete-orphan"
+    )
 
 
 class WarmingAccount(Base):
@@ -98,6 +107,12 @@ class WarmingAccount(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     logs = relationship("WarmingLog", back_populates="warming_account", cascade="all, delete-orphan")
+    mailbox_cursor = relationship(
+        "MailboxCursor", back_populates="warming_account", uselist=False, cascade="all, delete-orphan"
+    )
+    health = relationship(
+        "AccountHealth", back_populates="warming_account", uselist=False, cascade="all, delete-orphan"
+    )
 
 
 class WarmingCampaign(Base):
@@ -137,3 +152,68 @@ class WarmingLog(Base):
     campaign = relationship("WarmingCampaign", back_populates="logs")
     warming_account = relationship("WarmingAccount", back_populates="logs")
     domain_email = relationship("DomainEmail", back_populates="logs")
+
+
+class MailboxCursor(Base):
+    """
+    Incremental IMAP sync position for one inbox: either a DomainEmail or a
+    WarmingAccount. last_uid is only meaningful for the stored uidvalidity.
+    """
+
+    __tablename__ = "mailbox_cursors"
+
+    id = Column(Integer, primary_key=True, index=True)
+    domain_email_id = Column(
+        Integer, ForeignKey("domain_emails.id", ondelete="CASCADE"), unique=True, nullable=True
+    )
+    warming_account_id = Column(
+        Integer, ForeignKey("warming_accounts.id", ondelete="CASCADE"), unique=True, nullable=True
+    )
+    uidvalidity = Column(BigInteger, nullable=True)
+    last_uid = Column(BigInteger, default=0)
+    highest_modseq = Column(BigInteger, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    domain_email = relationship("DomainEmail", back_populates="mailbox_cursor")
+    warming_account = relationship("WarmingAccount", back_populates="mailbox_cursor")
+
+
+class AccountHealth(Base):
+    """Latest SMTP/IMAP login test of a warming account (see connection_tests)."""
+
+    __tablename__ = "account_health"
+
+    id = Column(Integer, primary_key=True, index=True)
+    warming_account_id = Column(
+        Integer, ForeignKey("warming_accounts.id", ondelete="CASCADE"), unique=True, nullable=False
+    )
+    smtp_ok = Column(Boolean, default=False)
+    imap_ok = Column(Boolean, default=False)
+    smtp_error = Column(Text, nullable=True)
+    imap_error = Column(Text, nullable=True)
+    tested_at = Column(DateTime, default=datetime.utcnow)
+
+    warming_account = relationship("WarmingAccount", back_populates="health")
+
+
+class ReputationSnapshot(Base):
+    """
+    One scheduled reputation scan result (see reputation_monitor) of a
+    domain (kind "domain") or a sending host of its mailboxes (kind "host").
+    """
+
+    __tablename__ = "reputation_snapshots"
+    __table_args__ = (Index("ix_reputation_snapshots_target", "kind", "target", "scanned_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    target = Column(String, nullable=False)
+    domain_id = Column(Integer, ForeignKey("domains.id", ondelete="CASCADE"), nullable=True, index=True)
+    ip = Column(String, nullable=True)
+    score = Column(Integer, nullable=False)
+    score_label = Column(String, nullable=False)
+    listed = Column(JSON, default=list)  # names of the DNSBLs listing the IP
+    report = Column(JSON, nullable=True)  # DomainReputation dict, or host blacklist report
+    scanned_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    domain = relationship("Domain", back_populates="reputation_snapshots")
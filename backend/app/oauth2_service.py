@@ -14,10 +14,15 @@ Firstmail: Standard SMTP/IMAP with username+password. No OAuth2 needed.
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
-import requests
+from . import http_client
+from .models import AuthTypeEnum
+
+# Parallel ROPC requests for bulk token fetches (imports, /accounts/bulk-oauth2)
+OAUTH2_BULK_CONCURRENCY = int(os.environ.get("OAUTH2_BULK_CONCURRENCY", "16"))
 
 # ── Outlook / Microsoft ───────────────────────────────────────────────────────
 
@@ -69,7 +74,7 @@ def get_outlook_token_ropc(
     tenant = _get_ms_tenant(email)
     url = MICROSOFT_TOKEN_URL_TEMPLATE.format(tenant=tenant)
 
-    resp = requests.post(url, data={
+    resp = http_client.post(url, data={
         "grant_type": "password",
         "client_id": client_id,
         "username": email,
@@ -90,13 +95,45 @@ def get_outlook_token_ropc(
     }
 
 
+def fetch_outlook_tokens(
+    credentials: Iterable[tuple],
+    concurrency: int = OAUTH2_BULK_CONCURRENCY,
+    client_id: Optional[str] = None,
+) -> Iterator[tuple]:
+    """
+    Run ROPC for many accounts in parallel over the shared keep-alive session.
+    credentials: (key, email, password) tuples.
+    Yields (key, tokens, error) as requests complete; exactly one of tokens
+    (see get_outlook_token_ropc) and error (message) is set.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {
+            pool.submit(get_outlook_token_ropc, email, password, client_id): key
+            for key, email, password in credentials
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, str(e)
+
+
+def apply_outlook_tokens(account, tok: dict) -> None:
+    """Switch account to OAuth2 with tokens from ROPC and drop the password."""
+    account.oauth2_access_token = tok["access_token"]
+    account.oauth2_refresh_token = tok["refresh_token"]
+    account.oauth2_token_expiry = tok["token_expiry"]
+    account.auth_type = AuthTypeEnum.oauth2
+    account.password = None
+
+
 def refresh_outlook_token(refresh_token: str, client_id: Optional[str] = None) -> dict:
     """Refresh an existing Outlook access token."""
     client_id = client_id or os.environ.get("OUTLOOK_CLIENT_ID", "")
     if not client_id:
         raise ValueError("OUTLOOK_CLIENT_ID not set")
 
-    resp = requests.post(
+    resp = http_client.post(
         MICROSOFT_TOKEN_URL_TEMPLATE.format(tenant="common"),
         data={
             "grant_type": "refresh_token",
@@ -0,0 +1,221 @@
+"""
+Redis-backed rate limiter and concurrency governor for provider connections.
+
+Every SMTP/IMAP conversation takes a slot first. A slot needs one token from
+the bucket of each provider host and account involved, and a free lease in
+the account's concurrency semaphore; all of it is checked and taken
+atomically in a Lua script, so the limits hold across all worker processes
+and nodes. Callers that don't get a slot receive RateLimited with a retry
+hint and are expected to reschedule instead of waiting (see
+tasks._take_slot).
+
+The concurrency of a host limit bounds its connections in use instead:
+a pooled session leases one (connection_lease) while it is borrowed and
+returns it to the pool without (email_service.SessionPool), an async
+session for as long as it is open, and an IDLE listener session for its
+lifetime, renewed by the listener's heartbeat.
+
+Environment (rates per minute, 0 = unlimited):
+  RATE_LIMIT_HOST            "rate/burst/concurrency" per provider host (default 60/20/20)
+  RATE_LIMIT_ACCOUNT         "rate/burst/concurrency" per mailbox (default 6/2/1)
+  RATE_LIMIT_HOST_OVERRIDES  "host=rate/burst/concurrency,..." e.g.
+                             "smtp-mail.outlook.com=30/10/10,imap.gmail.com=120/30/30"
+  RATE_LIMIT_LEASE_TTL       seconds before a lease of a crashed worker expires
+  RATE_LIMIT_ENABLED         set to 0 to switch the limiter off
+"""
+
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import redis
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_HOST = os.environ.get("RATE_LIMIT_HOST", "60/20/20")
+RATE_LIMIT_ACCOUNT = os.environ.get("RATE_LIMIT_ACCOUNT", "6/2/1")
+RATE_LIMIT_HOST_OVERRIDES = os.environ.get("RATE_LIMIT_HOST_OVERRIDES", "")
+RATE_LIMIT_LEASE_TTL = int(os.environ.get("RATE_LIMIT_LEASE_TTL", "600"))
+# Retry hint when only a concurrency limit is exhausted (leases end unpredictably)
+RATE_LIMIT_BUSY_RETRY = float(os.environ.get("RATE_LIMIT_BUSY_RETRY", "30"))
+
+KEY_PREFIX = "warming:rl"
+
+redis_conn = redis.from_url(REDIS_URL)
+
+
+class Limit(NamedTuple):
+    rate: float  # tokens per minute
+    burst: int
+    concurrency: int
+
+
+class Lease(NamedTuple):
+    lease_id: str
+    keys: tuple
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Provider rate limit reached, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def _parse_limit(spec: str) -> Limit:
+    rate, burst, concurrency = (spec.split("/") + ["0", "0", "0"])[:3]
+    return Limit(float(rate or 0), int(burst or 0), int(concurrency or 0))
+
+
+HOST_LIMIT = _parse_limit(RATE_LIMIT_HOST)
+ACCOUNT_LIMIT = _parse_limit(RATE_LIMIT_ACCOUNT)
+HOST_OVERRIDES = {
+    host.strip().lower(): _parse_limit(spec)
+    for host, _, spec in (item.partition("=") for item in RATE_LIMIT_HOST_OVERRIDES.split(",") if item.strip())
+}
+
+
+# KEYS: per limiter a bucket hash and a lease zset
+# ARGV: now, lease id, lease ttl, busy retry, then per limiter rate/s, burst, concurrency
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local n = #KEYS / 2
+local wait = 0
+local tokens = {}
+for i = 1, n do
+    local rate = tonumber(ARGV[2 + i * 3])
+    local burst = tonumber(ARGV[3 + i * 3])
+    local concurrency = tonumber(ARGV[4 + i * 3])
+    if rate > 0 then
+        local bucket = redis.call('HMGET', KEYS[i * 2 - 1], 'tokens', 'ts')
+        local level = tonumber(bucket[1]) or burst
+        local ts = tonumber(bucket[2]) or now
+        level = math.min(burst, level + math.max(0, now - ts) * rate)
+        tokens[i] = level
+        if level < 1 then
+            wait = math.max(wait, (1 - level) / rate)
+        end
+    end
+    if concurrency > 0 then
+        redis.call('ZREMRANGEBYSCORE', KEYS[i * 2], '-inf', now)
+        if redis.call('ZCARD', KEYS[i * 2]) >= concurrency then
+            wait = math.max(wait, tonumber(ARGV[4]))
+        end
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i = 1, n do
+    local rate = tonumber(ARGV[2 + i * 3])
+    local burst = tonumber(ARGV[3 + i * 3])
+    local concurrency = tonumber(ARGV[4 + i * 3])
+    if rate > 0 then
+        redis.call('HSET', KEYS[i * 2 - 1], 'tokens', tokens[i] - 1, 'ts', now)
+        redis.call('EXPIRE', KEYS[i * 2 - 1], math.ceil(burst / rate) + 60)
+    end
+    if concurrency > 0 then
+        redis.call('ZADD', KEYS[i * 2], now + tonumber(ARGV[3]), ARGV[2])
+        redis.call('EXPIRE', KEYS[i * 2], tonumber(ARGV[3]) + 60)
+    end
+end
+return '0'
+"""
+
+_acquire = redis_conn.register_script(_ACQUIRE_SCRIPT)
+
+
+def _host_limit(host: str) -> Limit:
+    return HOST_OVERRIDES.get(host, HOST_LIMIT)
+
+
+def _limiters(hosts, accounts) -> list[tuple[str, Limit]]:
+    limiters = {}
+    for host in hosts:
+        if host:
+            host = host.lower()
+            # Host concurrency is held per connection (connection_lease)
+            limiters[f"host:{host}"] = _host_limit(host)._replace(concurrency=0)
+    for account in accounts:
+        if account:
+            limiters[f"account:{account.lower()}"] = ACCOUNT_LIMIT
+    return sorted(limiters.items())
+
+
+def _take(limiters: list[tuple[str, Limit]]) -> Lease:
+    lease = Lease(uuid.uuid4().hex, ())
+    if not RATE_LIMIT_ENABLED or not limiters:
+        return lease
+
+    keys, args = [], [time.time(), lease.lease_id, RATE_LIMIT_LEASE_TTL, RATE_LIMIT_BUSY_RETRY]
+    for name, limit in limiters:
+        keys += [f"{KEY_PREFIX}:bucket:{name}", f"{KEY_PREFIX}:leases:{name}"]
+        args += [limit.rate / 60.0, limit.burst or 1, limit.concurrency]
+
+    retry_after = float(_acquire(keys=keys, args=args))
+    if retry_after > 0:
+        raise RateLimited(retry_after)
+    return Lease(lease.lease_id, tuple(keys[1::2]))
+
+
+def acquire(hosts=(), accounts=()) -> Lease:
+    """
+    Take one token from every host and account limiter and a concurrency
+    lease from every account limiter, all or nothing. Raises RateLimited if
+    any of them is exhausted.
+    """
+    return _take(_limiters(hosts, accounts))
+
+
+def connection_lease(host: str) -> Lease:
+    """
+    Lease one open connection to host against its concurrency limit; hold it
+    until the connection is closed and renew it while it stays open longer
+    than RATE_LIMIT_LEASE_TTL. Raises RateLimited if the host is at its limit.
+    """
+    if not host:
+        return Lease(uuid.uuid4().hex, ())
+    host = host.lower()
+    return _take([(f"host:{host}", Limit(0, 0, _host_limit(host).concurrency))])
+
+
+def renew(lease: Lease) -> None:
+    """Extend the leases of a long-lived holder by RATE_LIMIT_LEASE_TTL."""
+    if not lease.keys:
+        return
+    expires = time.time() + RATE_LIMIT_LEASE_TTL
+    pipe = redis_conn.pipeline()
+    for key in lease.keys:
+        pipe.zadd(key, {lease.lease_id: expires}, xx=True)
+    pipe.execute()
+
+
+def release(lease: Lease) -> None:
+    """Return the concurrency leases taken by acquire (tokens are not refunded)."""
+    if not lease.keys:
+        return
+    pipe = redis_conn.pipeline()
+    for key in lease.keys:
+        pipe.zrem(key, lease.lease_id)
+    pipe.execute()
+
+
+@contextmanager
+def slot(hosts=(), accounts=()):
+    """acquire/release as a context manager. Raises RateLimited if no slot is free."""
+    lease = acquire(hosts, accounts)
+    try:
+        yield lease
+    finally:
+        release(lease)
+
+
+def smtp_limits(mailbox) -> tuple[list[str], list[str]]:
+    """(hosts, accounts) to pass to acquire for an SMTP conversation of mailbox."""
+    return [mailbox.smtp_host], [mailbox.email]
+
+
+def imap_limits(mailbox) -> tuple[list[str], list[str]]:
+    """(hosts, accounts) for an IMAP check that may be answered over SMTP."""
+    return [mailbox.imap_host, mailbox.smtp_host], [mailbox.email]
@@ -0,0 +1,150 @@
+"""
+Time-wheel release scheduler for delayed tasks.
+
+Delayed tasks (tasks.enqueue_warming_task / enqueue_many_tasks with a
+delay) are not written to RQ's scheduled registry as full job hashes. Each
+is stored as a compact JSON payload in the sorted set of the minute it is
+due, scored by its due timestamp; the minutes holding payloads are indexed
+in a small sorted set of their own.
+
+release_due, run every RELEASE_INTERVAL seconds by app.scheduler, reads
+only the buckets up to the current minute and turns the payloads that are
+due into queued RQ jobs. Payloads for the asyncio worker (schedule_async,
+used by tasks._enqueue_async) take the same path and are pushed to its
+ready list instead. Per batch, the new jobs and the removal of their
+payloads are written in one WATCHed MULTI/EXEC, so a payload is released
+exactly once even if several schedulers run, and drained buckets disappear:
+Redis holds the pending payloads only, whatever the day's volume.
+
+Redis layout:
+  warming:wheel:minutes     sorted set of minute numbers with pending payloads
+  warming:wheel:<minute>    sorted set of payloads scored by due timestamp
+
+Environment:
+  RELEASE_INTERVAL   seconds between release runs (scheduler)
+  RELEASE_BATCH      payloads released per transaction
+"""
+
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Optional
+
+import redis
+from redis.exceptions import WatchError
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+RELEASE_INTERVAL = int(os.environ.get("RELEASE_INTERVAL", "5"))
+RELEASE_BATCH = int(os.environ.get("RELEASE_BATCH", "1000"))
+
+KEY_PREFIX = "warming:wheel"
+MINUTES_KEY = f"{KEY_PREFIX}:minutes"
+
+logger = logging.getLogger(__name__)
+
+redis_conn = redis.from_url(REDIS_URL)
+
+
+def _bucket_key(minute: int) -> str:
+    return f"{KEY_PREFIX}:{minute}"
+
+
+def _add(payload: dict, due: float, pipeline=None) -> None:
+    minute = int(due // 60)
+    pipe = pipeline if pipeline is not None else redis_conn.pipeline()
+    pipe.zadd(_bucket_key(minute), {json.dumps(payload, separators=(",", ":")): due})
+    pipe.zadd(MINUTES_KEY, {minute: minute})
+    if pipeline is None:
+        pipe.execute()
+
+
+def schedule(task_name: str, args, due: float, job_timeout: Optional[int] = None, pipeline=None) -> None:
+    """Store a task due at the given timestamp in its minute's bucket."""
+    payload = {"id": uuid.uuid4().hex[:16], "task": task_name, "args": list(args)}
+    if job_timeout:
+        payload["timeout"] = job_timeout
+    _add(payload, due, pipeline)
+
+
+def schedule_async(payload: dict, due: float, pipeline=None) -> None:
+    """
+    Store an async worker payload ({"id", "task", "args", ...}) due at the
+    given timestamp; it is pushed to tasks.ASYNC_READY_KEY on release.
+    pipeline may also be a redis.asyncio pipeline (commands are only queued).
+    """
+    _add({**payload, "async": 1}, due, pipeline)
+
+
+def _split(members: list[bytes]) -> tuple[list, list[str]]:
+    """RQ EnqueueData and async worker payloads for members; unreadable ones are logged and dropped."""
+    from rq import Queue
+
+    from .tasks import ASYNC_TASKS, _task_func
+
+    jobs, async_payloads = [], []
+    for member in members:
+        try:
+            payload = json.loads(member)
+            if payload.pop("async", None):
+                if payload["task"] not in ASYNC_TASKS:
+                    raise KeyError(payload["task"])
+                async_payloads.append(json.dumps(payload))
+                continue
+            func = _task_func(payload["task"])
+        except (ValueError, KeyError) as e:
+            logger.error(f"Dropping scheduled payload {member[:200]!r}: {e}")
+            continue
+        jobs.append(Queue.prepare_data(func, tuple(payload["args"]), timeout=payload.get("timeout")))
+    return jobs, async_payloads
+
+
+def _release_batch(minute: int, now: float) -> tuple[int, float, bool]:
+    """
+    Release up to RELEASE_BATCH due payloads of one bucket.
+    Returns (released, seconds the oldest was late, bucket has more due).
+    """
+    from .tasks import ASYNC_READY_KEY, q
+
+    key = _bucket_key(minute)
+    with redis_conn.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                due = pipe.zrangebyscore(key, "-inf", now, start=0, num=RELEASE_BATCH, withscores=True)
+                drained = len(due) == pipe.zcard(key)
+                members = [member for member, _ in due]
+
+                pipe.multi()
+                jobs, async_payloads = _split(members)
+                if jobs:
+                    q.enqueue_many(jobs, pipeline=pipe)
+                if async_payloads:
+                    pipe.rpush(ASYNC_READY_KEY, *async_payloads)
+                if members:
+                    pipe.zrem(key, *members)
+                if drained:
+                    pipe.zrem(MINUTES_KEY, minute)
+                pipe.execute()
+            except WatchError:
+                # A payload was added to or released from this bucket meanwhile
+                continue
+            late = now - due[0][1] if due else 0.0
+            return len(jobs) + len(async_payloads), late, len(due) == RELEASE_BATCH and not drained
+
+
+def release_due(now: Optional[float] = None) -> dict:
+    """Enqueue every payload due by now. Returns {"released", "minutes", "max_late_seconds"}."""
+    now = time.time() if now is None else now
+    summary = {"released": 0, "minutes": 0, "max_late_seconds": 0.0}
+
+    for minute in redis_conn.zrangebyscore(MINUTES_KEY, "-inf", now // 60):
+        summary["minutes"] += 1
+        more = True
+        while more:
+            released, late, more = _release_batch(int(minute), now)
+            summary["released"] += released
+            summary["max_late_seconds"] = max(summary["max_late_seconds"], round(late, 1))
+    return summary
+
@@ -0,0 +1,152 @@
+"""
+Cursor-based message lookup for the polling inbox checks.
+
+check_domain_inbox and check_warming_account_inbox each look for one
+message by its Message-ID. Instead of searching the mailbox for every
+check, locate_message syncs the mailbox from its MailboxCursor
+(email_service.sync_mailbox, which only fetches UID n+1:*) and indexes every
+arrival by Message-ID in Redis, one key per message with its own TTL. The
+checks for the other messages of that sync then find theirs in the index
+without an IMAP search; a check claims its entry with GETDEL, so two
+checks never both take the same arrival.
+The IDLE listener indexes its arrivals the same way, and the asyncio
+worker uses the same index and cursor (locate_message_async).
+
+A message the cursor has passed but the index no longer holds (expired, or
+never indexed) is located with find_message as a last resort.
+
+Environment:
+  REPLY_INDEX_TTL   seconds an indexed arrival is kept, counted from its indexing
+"""
+
+import asyncio
+import json
+import os
+from typing import Optional
+
+import redis
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+REPLY_INDEX_TTL = int(os.environ.get("REPLY_INDEX_TTL", str(2 * 24 * 3600)))
+
+KEY_PREFIX = "warming:arrivals"
+
+redis_conn = redis.from_url(REDIS_URL)
+
+
+def _entry_key(kind: str, owner_id: int, message_id: str) -> str:
+    return f"{KEY_PREFIX}:{kind}:{owner_id}:{message_id.strip()}"
+
+
+def _kind(owner) -> str:
+    from .models import DomainEmail
+
+    return "domain" if isinstance(owner, DomainEmail) else "warming"
+
+
+def index_arrivals(kind: str, owner_id: int, uidvalidity, messages: list[dict]) -> None:
+    """
+    Remember messages (header dicts from fetch_headers) of a mailbox by
+    Message-ID. Every entry expires REPLY_INDEX_TTL after it was indexed,
+    so arrivals no check claims (any non-warming mail) don't pile up.
+    """
+    messages = [msg for msg in messages if msg.get("message_id")]
+    if not messages:
+        return
+    pipe = redis_conn.pipeline(transaction=False)
+    for msg in messages:
+        pipe.set(
+            _entry_key(kind, owner_id, msg["message_id"]),
+            json.dumps({**msg, "uidvalidity": uidvalidity}),
+            ex=REPLY_INDEX_TTL,
+        )
+    pipe.execute()
+
+
+def is_indexed(kind: str, owner_id: int, message_id: str) -> bool:
+    """True if message_id arrived in the mailbox and no check has claimed it yet."""
+    return bool(redis_conn.exists(_entry_key(kind, owner_id, message_id)))
+
+
+def _take(kind: str, owner_id: int, message_id: str, uidvalidity) -> Optional[dict]:
+    """Claim an indexed arrival; of concurrent checks for it only one gets it."""
+    raw = redis_conn.getdel(_entry_key(kind, owner_id, message_id))
+    if raw is None:
+        return None
+    msg = json.loads(raw)
+    # UIDs from an earlier UIDVALIDITY point at other messages now
+    return msg if msg.pop("uidvalidity", None) == uidvalidity else None
+
+
+def locate_message(db, owner, message_id: str, imap) -> Optional[dict]:
+    """
+    Find the message with message_id in owner's INBOX (owner: DomainEmail or
+    WarmingAccount) over the borrowed session imap. Advances and commits the
+    mailbox cursor. Returns a message dict or None.
+    """
+    from .email_service import find_message, sync_mailbox
+    from .warming_engine import get_mailbox_cursor
+
+    kind = _kind(owner)
+    cursor = get_mailbox_cursor(db, owner)
+    if cursor.uidvalidity is not None:
+        found = _take(kind, owner.id, message_id, cursor.uidvalidity)
+        if found:
+            return found
+
+    arrivals = sync_mailbox(owner, cursor, imap=imap)
+    db.commit()
+    index_arrivals(kind, owner.id, cursor.uidvalidity, arrivals)
+    found = _take(kind, owner.id, message_id, cursor.uidvalidity)
+    if found:
+        return found
+    return find_message(owner, "Message-ID", message_id, imap=imap)
+
+
+# ── asyncio worker ───────────────────────────────────────────────────────────
+
+def _load_cursor(owner):
+    """The owner's MailboxCursor, detached so the event loop can advance it."""
+    from .database import SessionLocal
+    from .warming_engine import get_mailbox_cursor
+
+    db = SessionLocal()
+    try:
+        cursor = get_mailbox_cursor(db, owner)
+        db.commit()
+        db.refresh(cursor)
+        db.expunge(cursor)
+        return cursor
+    finally:
+        db.close()
+
+
+def _store_cursor(cursor) -> None:
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        db.merge(cursor)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def locate_message_async(owner, message_id: str, imap) -> Optional[dict]:
+    """locate_message for the asyncio worker, over an AsyncImapClient session."""
+    from .async_email_service import find_message, sync_mailbox
+
+    kind = _kind(owner)
+    cursor = await asyncio.to_thread(_load_cursor, owner)
+    if cursor.uidvalidity is not None:
+        found = await asyncio.to_thread(_take, kind, owner.id, message_id, cursor.uidvalidity)
+        if found:
+            return found
+
+    arrivals = await sync_mailbox(owner, cursor, imap=imap)
+    await asyncio.to_thread(_store_cursor, cursor)
+    await asyncio.to_thread(index_arrivals, kind, owner.id, cursor.uidvalidity, arrivals)
+    found = await asyncio.to_thread(_take, kind, owner.id, message_id, cursor.uidvalidity)
+    if found:
+        return found
+    return await find_message(owner, "Message-ID", message_id, imap=imap)
@@ -0,0 +1,145 @@
+"""
+Scheduled fleet-wide reputation scans with persisted history.
+
+scan_fleet checks every Domain, and with REPUTATION_SCAN_HOSTS=1 also the
+SMTP hosts of their mailboxes, in a single reputation_service.scan_reputation
+run: targets that share an IP are checked against each DNSBL zone once.
+Every result is stored as a ReputationSnapshot, so the API can serve the
+latest state and score trends (latest_snapshots, snapshot_history) without
+DNS in the request path.
+
+Environment:
+  REPUTATION_SCAN_INTERVAL      hours between scheduled scans (scheduler)
+  REPUTATION_SCAN_HOSTS         1 = also scan the DomainEmail SMTP hosts
+  REPUTATION_SCAN_CONCURRENCY   DNS queries in flight during a scan
+  REPUTATION_HISTORY_DAYS       days of snapshots kept
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .models import Domain, DomainEmail, ReputationSnapshot
+from .reputation_service import DNSBL_ZONES, scan_reputation
+
+REPUTATION_SCAN_HOSTS = os.environ.get("REPUTATION_SCAN_HOSTS", "0") == "1"
+REPUTATION_SCAN_CONCURRENCY = int(os.environ.get("REPUTATION_SCAN_CONCURRENCY", "32"))
+REPUTATION_HISTORY_DAYS = int(os.environ.get("REPUTATION_HISTORY_DAYS", "90"))
+
+
+def _snapshot(kind: str, target: str, report: dict, ip: Optional[str], now: datetime, domain_id=None):
+    return ReputationSnapshot(
+        kind=kind,
+        target=target,
+        domain_id=domain_id,
+        ip=ip,
+        score=report["score"],
+        score_label=report["score_label"],
+        listed=[bl["name"] for bl in report["blacklists"] if bl["listed"]],
+        report=report,
+        scanned_at=now,
+    )
+
+
+def scan_fleet(db: Session, include_hosts: bool = REPUTATION_SCAN_HOSTS, refresh: bool = False) -> dict:
+    """Scan all domains (and sending hosts) and store one snapshot per target."""
+    started = time.monotonic()
+    domains = db.query(Domain.id, Domain.name).all()
+    hosts = []
+    if include_hosts:
+        hosts = sorted({host.lower() for (host,) in db.query(DomainEmail.smtp_host).distinct() if host})
+
+    result = scan_reputation(
+        [name for _, name in domains], hosts, refresh=refresh, concurrency=REPUTATION_SCAN_CONCURRENCY
+    )
+
+    now = datetime.utcnow()
+    snapshots = [
+        _snapshot("domain", name, result["domains"][name], result["ips"][name], now, domain_id)
+        for domain_id, name in domains
+    ] + [
+        _snapshot("host", host, result["hosts"][host], result["ips"][host], now)
+        for host in hosts
+    ]
+    db.add_all(snapshots)
+    pruned = db.query(ReputationSnapshot).filter(
+        ReputationSnapshot.scanned_at < now - timedelta(days=REPUTATION_HISTORY_DAYS)
+    ).delete(synchronize_session=False)
+    db.commit()
+
+    ips = {ip for ip in result["ips"].values() if ip}
+    return {
+        "domains": len(domains),
+        "hosts": len(hosts),
+        "ips": len(ips),
+        "dnsbl_queries": len(ips) * len(DNSBL_ZONES),
+        "listed": {s.target: s.listed for s in snapshots if s.listed},
+        "pruned": pruned,
+        "seconds": round(time.monotonic() - started, 1),
+    }
+
+
+def latest_snapshots(db: Session, kind: Optional[str] = None) -> list[dict]:
+    """
+    The latest snapshot of every target with its change since the previous
+    one: previous_score and the blacklists it was newly_listed on / delisted from.
+    """
+    ranked = db.query(
+        ReputationSnapshot.id.label("id"),
+        func.row_number().over(
+            partition_by=(ReputationSnapshot.kind, ReputationSnapshot.target),
+            order_by=(ReputationSnapshot.scanned_at.desc(), ReputationSnapshot.id.desc()),
+        ).label("rank"),
+    )
+    if kind:
+        ranked = ranked.filter(ReputationSnapshot.kind == kind)
+    ranked = ranked.subquery()
+
+    rows = (
+        db.query(ReputationSnapshot, ranked.c.rank)
+        .join(ranked, ranked.c.id == ReputationSnapshot.id)
+        .filter(ranked.c.rank <= 2)
+        .order_by(ReputationSnapshot.kind, ReputationSnapshot.target, ranked.c.rank)
+        .all()
+    )
+
+    result = []
+    for snapshot, rank in rows:
+        if rank == 1:
+            result.append({
+                "id": snapshot.id,
+                "kind": snapshot.kind,
+                "target": snapshot.target,
+                "domain_id": snapshot.domain_id,
+                "ip": snapshot.ip,
+                "score": snapshot.score,
+                "score_label": snapshot.score_label,
+                "listed": snapshot.listed or [],
+                "scanned_at": snapshot.scanned_at,
+                "report": snapshot.report,
+                "previous_score": None,
+                "newly_listed": [],
+                "delisted": [],
+            })
+        else:
+            latest = result[-1]
+            previous = set(snapshot.listed or [])
+            latest["previous_score"] = snapshot.score
+            latest["newly_listed"] = [name for name in latest["listed"] if name not in previous]
+            latest["delisted"] = sorted(previous - set(latest["listed"]))
+    return result
+
+
+def snapshot_history(db: Session, target: str, days: int = 30, kind: Optional[str] = None) -> list:
+    """Snapshots of one target from the last days, oldest first."""
+    query = db.query(ReputationSnapshot).filter(
+        ReputationSnapshot.target == target,
+        ReputationSnapshot.scanned_at >= datetime.utcnow() - timedelta(days=days),
+    )
+    if kind:
+        query = query.filter(ReputationSnapshot.kind == kind)
+    return query.order_by(ReputationSnapshot.scanned_at, ReputationSnapshot.id).all()
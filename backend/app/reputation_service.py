@@ -6,63 +6,199 @@ No API keys required. Uses:
   - DKIM (TXT record default._domainkey)
   - DMARC (TXT record _dmarc)
   - DNSBL blacklist checks (Spamhaus, SpamCop, Barracuda, SORBS, etc.)
+
+Answers are cached in Redis for their record TTL (negative answers for the
+zone's SOA minimum), so repeated checks don't query the resolvers and
+blacklists again; check_domain_reputation(refresh=True) bypasses the cache.
 """
 
 import ipaddress
-import socket
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional
 
+import redis
+
 try:
+    import dns.rdatatype
     import dns.resolver
     HAS_DNSPYTHON = True
 except ImportError:
     HAS_DNSPYTHON = False
 
+# Per-query timeouts (seconds); all lookups of a check run in parallel
+DNS_TIMEOUT = float(os.environ.get("DNS_TIMEOUT", "5"))
+DNSBL_TIMEOUT = float(os.environ.get("DNSBL_TIMEOUT", "3"))
+DNS_CONCURRENCY = int(os.environ.get("DNS_CONCURRENCY", "16"))
 
-# ── DNS helpers ───────────────────────────────────────────────────────────────
+# Answers are cached for their record TTL, clamped to these bounds (seconds).
+# NXDOMAIN / no-answer results use the zone's SOA negative TTL.
+DNS_CACHE_ENABLED = os.environ.get("DNS_CACHE_ENABLED", "1") == "1"
+DNS_CACHE_MIN_TTL = int(os.environ.get("DNS_CACHE_MIN_TTL", "60"))
+DNS_CACHE_MAX_TTL = int(os.environ.get("DNS_CACHE_MAX_TTL", "86400"))
+DNS_NEGATIVE_TTL = int(os.environ.get("DNS_NEGATIVE_TTL", "300"))
+DNS_CACHE_LOCAL_SIZE = int(os.environ.get("DNS_CACHE_LOCAL_SIZE", "10000"))
 
-def _txt_lookup(name: str) -> Optional[str]:
-    """Return first TXT record value or None."""
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+CACHE_KEY_PREFIX = "warming:dns"
+
+redis_conn = redis.from_url(REDIS_URL, decode_responses=True)
+
+
+# ── DNS cache ─────────────────────────────────────────────────────────────────
+# Two levels: a small per-process dict in front of Redis, which API and worker
+# processes share. Lookups that failed (timeout, SERVFAIL) are never cached.
+
+_local_lock = threading.Lock()
+_local: "OrderedDict[str, tuple[float, list[str]]]" = OrderedDict()
+
+
+def _cache_key(rdtype: str, name: str) -> str:
+    return f"{CACHE_KEY_PREFIX}:{rdtype}:{name.lower().rstrip('.')}"
+
+
+def _cache_get(key: str) -> Optional[list[str]]:
+    with _local_lock:
+        entry = _local.get(key)
+        if entry and entry[0] > time.time():
+            return entry[1]
     try:
-        if HAS_DNSPYTHON:
-            answers = dns.resolver.resolve(name, "TXT", lifetime=5)
-            for rdata in answers:
-                return "".join(s.decode() for s in rdata.strings)
-        else:
-            import subprocess
-            result = subprocess.run(
-                ["dig", "+short", "TXT", name],
-                capture_output=True, text=True, timeout=5
-            )
-            out = result.stdout.strip().strip('"')
-            return out if out else None
-    except Exception:
+        pipe = redis_conn.pipeline()
+        pipe.get(key)
+        pipe.ttl(key)
+        raw, ttl = pipe.execute()
+    except redis.exceptions.RedisError:
+        return None
+    if raw is None:
         return None
+    answers = json.loads(raw)
+    _local_put(key, answers, ttl)
+    return answers
+
 
+def _local_put(key: str, answers: list[str], ttl: int) -> None:
+    if ttl <= 0:
+        return
+    with _local_lock:
+        _local[key] = (time.time() + ttl, answers)
+        _local.move_to_end(key)
+        while len(_local) > DNS_CACHE_LOCAL_SIZE:
+            _local.popitem(last=False)
 
-def _mx_lookup(domain: str) -> Optional[str]:
+
+def _cache_put(key: str, answers: list[str], ttl: int) -> None:
+    ttl = min(max(ttl, DNS_CACHE_MIN_TTL), DNS_CACHE_MAX_TTL)
+    _local_put(key, answers, ttl)
+    try:
+        redis_conn.set(key, json.dumps(answers), ex=ttl)
+    except redis.exceptions.RedisError:
+        pass
+
+
+def _negative_ttl(response) -> int:
+    """Negative-caching TTL from the SOA in a response's authority section (RFC 2308)."""
+    for rrset in getattr(response, "authority", None) or []:
+        if rrset.rdtype == dns.rdatatype.SOA:
+            return min(rrset.ttl, rrset[0].minimum)
+    return DNS_NEGATIVE_TTL
+
+
+def _resolve(rdtype: str, name: str, timeout: float) -> tuple[list[str], int]:
+    """
+    Query name and return (answers as text, ttl). No records (NXDOMAIN, no
+    answer) gives an empty list; failed lookups raise.
+    """
+    if not HAS_DNSPYTHON:
+        answers = _dig(rdtype, name, timeout)
+        return answers, DNS_NEGATIVE_TTL if not answers else DNS_CACHE_MIN_TTL
     try:
-        if HAS_DNSPYTHON:
-            answers = dns.resolver.resolve(domain, "MX", lifetime=5)
-            mx = sorted(answers, key=lambda r: r.preference)[0]
-            return str(mx.exchange).rstrip(".")
-        else:
-            import subprocess
-            result = subprocess.run(
-                ["dig", "+short", "MX", domain],
-                capture_output=True, text=True, timeout=5
-            )
-            out = result.stdout.strip()
-            return out if out else None
+        answer = dns.resolver.resolve(name, rdtype, lifetime=timeout)
+    except dns.resolver.NXDOMAIN as e:
+        return [], _negative_ttl(next(iter(e.responses().values()), None))
+    except dns.resolver.NoAnswer as e:
+        return [], _negative_ttl(e.response())
+    if rdtype == "TXT":
+        answers = ["".join(s.decode() for s in rdata.strings) for rdata in answer]
+    else:
+        answers = [rdata.to_text() for rdata in answer]
+    return answers, answer.rrset.ttl
+
+
+def _query(rdtype: str, name: str, timeout: float = DNS_TIMEOUT, refresh: bool = False) -> Optional[list[str]]:
+    """
+    Cached lookup: answers as text (empty = no such records), or None if the
+    lookup failed. refresh=True skips the cache and stores the fresh answer.
+    """
+    key = _cache_key(rdtype, name)
+    if DNS_CACHE_ENABLED and not refresh:
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached
+    try:
+        answers, ttl = _resolve(rdtype, name, timeout)
     except Exception:
         return None
+    if DNS_CACHE_ENABLED:
+        _cache_put(key, answers, ttl)
+    return answers
 
 
-def _a_lookup(name: str) -> Optional[str]:
+def clear_dns_cache() -> None:
+    """Drop all cached DNS answers (this process and Redis)."""
+    with _local_lock:
+        _local.clear()
     try:
-        return socket.gethostbyname(name)
-    except Exception:
+        keys = list(redis_conn.scan_iter(f"{CACHE_KEY_PREFIX}:*", count=1000))
+        if keys:
+            redis_conn.delete(*keys)
+    except redis.exceptions.RedisError:
+        pass
+
+
+# ── DNS helpers ───────────────────────────────────────────────────────────────
+
+def _dig(rdtype: str, name: str, timeout: float) -> list[str]:
+    """Fallback without dnspython: `dig +short`, one answer per line."""
+    result = subprocess.run(
+        ["dig", "+short", f"+time={max(1, int(timeout))}", "+tries=1", rdtype, name],
+        capture_output=True, text=True, timeout=timeout + 1
+    )
+    lines = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+    if rdtype == "TXT":
+        return [line.strip('"') for line in lines]
+    if rdtype == "A":
+        # CNAME targets are listed before the addresses
+        return [line for line in lines if line[:1].isdigit()]
+    return lines
+
+
+def _txt_lookup(name: str, refresh: bool = False) -> Optional[str]:
+    """Return first TXT record value or None."""
+    answers = _query("TXT", name, refresh=refresh)
+    return answers[0] if answers else None
+
+
+def _mx_lookup(domain: str, refresh: bool = False) -> Optional[str]:
+    answers = _query("MX", domain, refresh=refresh)
+    if not answers:
+        return None
+    try:
+        _, exchange = min(
+            (int(pref), exchange) for pref, exchange in (answer.split() for answer in answers)
+        )
+    except ValueError:
         return None
+    return exchange.rstrip(".")
+
+
+def _a_lookup(name: str, timeout: float = DNS_TIMEOUT, refresh: bool = False) -> Optional[str]:
+    answers = _query("A", name, timeout, refresh)
+    return answers[0] if answers else None
 
 
 # ── DNSBL check ───────────────────────────────────────────────────────────────
@@ -80,44 +216,109 @@ DNSBL_ZONES = [
 ]
 
 
-def _check_ip_in_dnsbl(ip: str, dnsbl_zone: str) -> bool:
-    """Check if IP is listed in a DNSBL zone."""
-    try:
-        reversed_ip = ".".join(reversed(ip.split(".")))
-        query = f"{reversed_ip}.{dnsbl_zone}"
-        socket.setdefaulttimeout(3)
-        socket.gethostbyname(query)
-        return True  # If it resolves, IP is listed
-    except socket.gaierror:
-        return False  # NXDOMAIN = not listed
-    except Exception:
-        return False
+def _check_ip_in_dnsbl(ip: str, dnsbl_zone: str, refresh: bool = False) -> bool:
+    """Check if IP is listed in a DNSBL zone (NXDOMAIN or timeout = not listed)."""
+    reversed_ip = ".".join(reversed(ip.split(".")))
+    query = f"{reversed_ip}.{dnsbl_zone}"
+    # If it resolves, IP is listed
+    return _a_lookup(query, timeout=DNSBL_TIMEOUT, refresh=refresh) is not None
 
 
-def _resolve_domain_to_ip(domain: str) -> Optional[str]:
-    try:
-        return socket.gethostbyname(domain)
-    except Exception:
-        return None
+def _resolve_domain_to_ip(domain: str, refresh: bool = False) -> Optional[str]:
+    return _a_lookup(domain, refresh=refresh)
 
 
-# ── Main reputation check ─────────────────────────────────────────────────────
+# ── Lookups ───────────────────────────────────────────────────────────────────
+
+def _txt_names(domain: str) -> tuple[str, ...]:
+    return (domain, f"_spf.{domain}", f"default._domainkey.{domain}", f"_dmarc.{domain}")
+
+
+class _Lookups:
+    """Raw answers of one lookup run: MX/TXT per domain, IP per name, DNSBL hits per IP."""
+
+    def __init__(self):
+        self.mx: dict[str, Optional[str]] = {}
+        self.txt: dict[str, Optional[str]] = {}
+        self.ips: dict[str, Optional[str]] = {}
+        self.listed: dict[str, dict[str, bool]] = {}
 
-def check_domain_reputation(domain: str) -> dict:
+
+def _run_lookups(domains, hosts=(), refresh: bool = False, concurrency: int = DNS_CONCURRENCY) -> _Lookups:
     """
-    Comprehensive domain reputation check.
-    Returns dict compatible with DomainReputation schema.
+    Resolve the records of domains and the IPs of domains and hosts, and
+    check every distinct IP against each DNSBL zone once. All queries run
+    concurrently; an IP's DNSBL queries start as soon as it is resolved, so
+    the run takes about as long as its slowest chain of queries.
     """
+    result = _Lookups()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        ip_futures = {pool.submit(_resolve_domain_to_ip, name, refresh): name for name in {*domains, *hosts}}
+        mx_futures = {domain: pool.submit(_mx_lookup, domain, refresh) for domain in domains}
+        txt_futures = {
+            name: pool.submit(_txt_lookup, name, refresh)
+            for domain in domains for name in _txt_names(domain)
+        }
+
+        dnsbl_futures: dict[str, dict] = {}
+        for future in as_completed(ip_futures):
+            ip = result.ips[ip_futures[future]] = future.result()
+            if ip and ip not in dnsbl_futures:
+                dnsbl_futures[ip] = {
+                    bl_name: pool.submit(_check_ip_in_dnsbl, ip, bl_zone, refresh)
+                    for bl_name, bl_zone in DNSBL_ZONES
+                }
+
+        result.mx = {domain: future.result() for domain, future in mx_futures.items()}
+        result.txt = {name: future.result() for name, future in txt_futures.items()}
+        result.listed = {
+            ip: {bl_name: future.result() for bl_name, future in futures.items()}
+            for ip, futures in dnsbl_futures.items()
+        }
+    return result
+
+
+# ── Reports ───────────────────────────────────────────────────────────────────
+
+def _blacklist_results(ip: Optional[str], listed_in: dict[str, bool]) -> list[dict]:
+    blacklists = []
+    if ip:
+        for bl_name, _ in DNSBL_ZONES:
+            listed = listed_in[bl_name]
+            blacklists.append({
+                "name": bl_name,
+                "listed": listed,
+                "detail": f"IP {ip} gelistet" if listed else None,
+            })
+    else:
+        for bl_name, _ in DNSBL_ZONES:
+            blacklists.append({
+                "name": bl_name,
+                "listed": False,
+                "detail": "IP nicht auflösbar",
+            })
+    return blacklists
+
+
+def _score_label(score: int) -> str:
+    if score >= 80:
+        return "Gut"
+    elif score >= 50:
+        return "Mittel"
+    return "Schlecht"
+
+
+def _domain_report(domain: str, lookups: _Lookups) -> dict:
     # 1. MX Record
-    mx_value = _mx_lookup(domain)
+    mx_value = lookups.mx[domain]
     mx = {"record": "MX", "found": bool(mx_value), "value": mx_value}
 
     # 2. SPF
-    spf_value = _txt_lookup(domain)
+    spf_value = lookups.txt[domain]
     if spf_value and "v=spf1" in spf_value:
         spf = {"record": "SPF", "found": True, "value": spf_value[:100]}
     else:
-        spf_value2 = _txt_lookup(f"_spf.{domain}")
+        spf_value2 = lookups.txt[f"_spf.{domain}"]
         spf = {
             "record": "SPF",
             "found": bool(spf_value2 and "v=spf1" in spf_value2),
@@ -125,7 +326,7 @@ def check_domain_reputation(domain: str) -> dict:
         }
 
     # 3. DKIM (check default selector)
-    dkim_value = _txt_lookup(f"default._domainkey.{domain}")
+    dkim_value = lookups.txt[f"default._domainkey.{domain}"]
     dkim = {
         "record": "DKIM",
         "found": bool(dkim_value and "v=DKIM1" in dkim_value),
@@ -133,32 +334,16 @@ def check_domain_reputation(domain: str) -> dict:
     }
 
     # 4. DMARC
-    dmarc_value = _txt_lookup(f"_dmarc.{domain}")
+    dmarc_value = lookups.txt[f"_dmarc.{domain}"]
     dmarc = {
         "record": "DMARC",
         "found": bool(dmarc_value and "v=DMARC1" in dmarc_value),
         "value": (dmarc_value or "")[:100] or None,
     }
 
-    # 5. DNSBL checks (resolve domain IP first)
-    domain_ip = _resolve_domain_to_ip(domain)
-    blacklists = []
-
-    if domain_ip:
-        for bl_name, bl_zone in DNSBL_ZONES:
-            listed = _check_ip_in_dnsbl(domain_ip, bl_zone)
-            blacklists.append({
-                "name": bl_name,
-                "listed": listed,
-                "detail": f"IP {domain_ip} gelistet" if listed else None,
-            })
-    else:
-        for bl_name, _ in DNSBL_ZONES:
-            blacklists.append({
-                "name": bl_name,
-                "listed": False,
-                "detail": "IP nicht auflösbar",
-            })
+    # 5. DNSBL checks (against the domain IP)
+    domain_ip = lookups.ips[domain]
+    blacklists = _blacklist_results(domain_ip, lookups.listed.get(domain_ip, {}))
 
     # 6. Score calculation
     score = 100
@@ -175,13 +360,6 @@ def check_domain_reputation(domain: str) -> dict:
     score -= listed_count * 10
     score = max(0, score)
 
-    if score >= 80:
-        score_label = "Gut"
-    elif score >= 50:
-        score_label = "Mittel"
-    else:
-        score_label = "Schlecht"
-
     return {
         "domain": domain,
         "mx": mx,
@@ -190,5 +368,44 @@ def check_domain_reputation(domain: str) -> dict:
         "dmarc": dmarc,
         "blacklists": blacklists,
         "score": score,
-        "score_label": score_label,
+        "score_label": _score_label(score),
+    }
+
+
+def _host_report(host: str, lookups: _Lookups) -> dict:
+    """Blacklist status of a sending host's IP (no DNS auth records)."""
+    ip = lookups.ips[host]
+    blacklists = _blacklist_results(ip, lookups.listed.get(ip, {}))
+    score = max(0, 100 - 10 * sum(1 for bl in blacklists if bl["listed"]))
+    return {
+        "host": host,
+        "blacklists": blacklists,
+        "score": score,
+        "score_label": _score_label(score),
+    }
+
+
+# ── Main reputation check ─────────────────────────────────────────────────────
+
+def check_domain_reputation(domain: str, refresh: bool = False) -> dict:
+    """
+    Comprehensive domain reputation check.
+    Returns dict compatible with DomainReputation schema.
+    Answers come from the DNS cache unless refresh=True.
+    """
+    return _domain_report(domain, _run_lookups([domain], refresh=refresh))
+
+
+def scan_reputation(domains, hosts=(), refresh: bool = False, concurrency: int = DNS_CONCURRENCY) -> dict:
+    """
+    Check many domains and sending hosts in one run, querying each distinct
+    IP against each DNSBL zone only once. Returns
+    {"domains": {name: report}, "hosts": {host: report}, "ips": {name: ip}}
+    with domain reports as from check_domain_reputation.
+    """
+    lookups = _run_lookups(domains, hosts, refresh, concurrency)
+    return {
+        "domains": {domain: _domain_report(domain, lookups) for domain in domains},
+        "hosts": {host: _host_report(host, lookups) for host in hosts},
+        "ips": lookups.ips,
     }
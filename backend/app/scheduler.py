@@ -1,5 +1,8 @@
 """
-APScheduler: Runs the daily warming scheduler at 08:00 UTC every day.
+APScheduler: Runs the daily warming scheduler at 08:00 UTC every day,
+refreshes expiring OAuth2 tokens every TOKEN_REFRESH_INTERVAL minutes,
+scans domain reputation every REPUTATION_SCAN_INTERVAL hours and releases
+due delayed tasks from the release wheel every RELEASE_INTERVAL seconds.
 Run with: python -m app.scheduler
 """
 
@@ -9,11 +12,15 @@ import time
 
 from apscheduler.schedulers.blocking import BlockingScheduler
 
+from .release_scheduler import RELEASE_INTERVAL, release_due
 from .tasks import enqueue_warming_task
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+TOKEN_REFRESH_INTERVAL = int(os.environ.get("TOKEN_REFRESH_INTERVAL", "5"))
+REPUTATION_SCAN_INTERVAL = int(os.environ.get("REPUTATION_SCAN_INTERVAL", "6"))
+
 scheduler = BlockingScheduler(timezone="UTC")
 
 
@@ -27,6 +34,35 @@ def daily_warming():
         logger.error(f"Failed to enqueue daily scheduler: {e}")
 
 
+@scheduler.scheduled_job("interval", minutes=TOKEN_REFRESH_INTERVAL, max_instances=1, coalesce=True)
+def refresh_tokens():
+    try:
+        enqueue_warming_task("refresh_oauth2_tokens")
+    except Exception as e:
+        logger.error(f"Failed to enqueue token refresh: {e}")
+
+
+@scheduler.scheduled_job("interval", hours=REPUTATION_SCAN_INTERVAL, max_instances=1, coalesce=True)
+def scan_reputation():
+    try:
+        enqueue_warming_task("scan_reputation")
+    except Exception as e:
+        logger.error(f"Failed to enqueue reputation scan: {e}")
+
+
+@scheduler.scheduled_job("interval", seconds=RELEASE_INTERVAL, max_instances=1, coalesce=True)
+def release_delayed_tasks():
+    try:
+        summary = release_due()
+        if summary["released"]:
+            logger.info(
+                f"Released {summary['released']} delayed tasks "
+                f"(up to {summary['max_late_seconds']}s late)"
+            )
+    except Exception as e:
+        logger.error(f"Failed to release delayed tasks: {e}")
+
+
 if __name__ == "__main__":
     logger.info("Starting APScheduler (daily warming at 08:00 UTC)...")
     scheduler.start()
@@ -69,6 +69,16 @@ class WarmingAccountOut(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class AccountHealthOut(BaseModel):
+    warming_account_id: int
+    smtp_ok: bool
+    imap_ok: bool
+    smtp_error: Optional[str] = None
+    imap_error: Optional[str] = None
+    tested_at: datetime
+    model_config = ConfigDict(from_attributes=True)
+
+
 
 
 class AccountTextImportRequest(BaseModel):
@@ -173,6 +183,26 @@ class DomainReputation(BaseModel):
     score_label: str  # "Gut", "Mittel", "Schlecht"
 
 
+class ReputationSnapshotOut(BaseModel):
+    id: int
+    kind: str  # "domain" or "host"
+    target: str
+    domain_id: Optional[int] = None
+    ip: Optional[str] = None
+    score: int
+    score_label: str
+    listed: List[str]
+    scanned_at: datetime
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ReputationLatest(ReputationSnapshotOut):
+    report: Optional[dict] = None
+    previous_score: Optional[int] = None
+    newly_listed: List[str] = []
+    delisted: List[str] = []
+
+
 # ── Auth ──────────────────────────────────────────────────────────────────────
 
 class LoginRequest(BaseModel):
@@ -3,9 +3,14 @@ RQ task definitions for domain warming.
 All tasks run in background workers.
 """
 
+import json
 import os
 import random
-from datetime import datetime
+import time
+import uuid
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Iterable, NamedTuple, Optional
 
 import redis
 from rq import Queue
@@ -15,33 +20,160 @@ REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
 redis_conn = redis.from_url(REDIS_URL)
 q = Queue(connection=redis_conn)
 
+# Conversation tasks can run on the asyncio worker instead (python -m app.async_worker)
+ASYNC_WORKER = os.environ.get("ASYNC_WORKER", "0") == "1"
+ASYNC_TASKS = {"send_warming_email", "check_domain_inbox", "check_warming_account_inbox"}
+ASYNC_READY_KEY = "warming:async:ready"
+# Delayed async payloads used to wait here; the async worker moves leftovers to the release wheel
+ASYNC_SCHEDULED_KEY = "warming:async:scheduled"
 
-def enqueue_warming_task(task_name: str, *args, delay_seconds: int = 0, **kwargs):
-    """Enqueue a warming task with optional delay."""
+
+# Jobs written per Redis pipeline by enqueue_many_tasks
+ENQUEUE_CHUNK = int(os.environ.get("ENQUEUE_CHUNK", "1000"))
+
+
+def _enqueue_async(task_name: str, args: tuple, delay_seconds: int, pipeline=None) -> None:
+    """Queue a payload for the async worker; delayed ones wait on the release wheel."""
+    payload = {"id": uuid.uuid4().hex, "task": task_name, "args": list(args)}
+    if delay_seconds > 0:
+        from .release_scheduler import schedule_async
+
+        schedule_async(payload, time.time() + delay_seconds, pipeline=pipeline)
+    else:
+        conn = pipeline if pipeline is not None else redis_conn
+        conn.rpush(ASYNC_READY_KEY, json.dumps(payload))
+
+
+def _task_func(task_name: str):
     func = {
         "send_warming_email": send_warming_email,
+        "send_warming_email_batch": send_warming_email_batch,
         "check_domain_inbox": check_domain_inbox,
         "check_warming_account_inbox": check_warming_account_inbox,
         "run_daily_scheduler": run_daily_scheduler_task,
+        "refresh_oauth2_tokens": refresh_oauth2_tokens_task,
+        "bulk_fetch_oauth2_tokens": bulk_fetch_oauth2_tokens_task,
+        "bulk_connection_test": bulk_connection_test_task,
+        "import_accounts": import_accounts_task,
+        "scan_reputation": scan_reputation_task,
     }.get(task_name)
 
     if func is None:
         raise ValueError(f"Unknown task: {task_name}")
+    return func
 
+
+def enqueue_warming_task(task_name: str, *args, delay_seconds: int = 0, **kwargs):
+    """
+    Enqueue a warming task with optional delay. Returns the RQ job, or None
+    if routed to the async worker or delayed on the release wheel
+    (release_scheduler).
+    """
+    if ASYNC_WORKER and task_name in ASYNC_TASKS and not kwargs:
+        _enqueue_async(task_name, args, delay_seconds)
+        return
+
+    func = _task_func(task_name)
     if delay_seconds > 0:
-        from datetime import timedelta
-        q.enqueue_in(timedelta(seconds=delay_seconds), func, *args, **kwargs)
-    else:
-        q.enqueue(func, *args, **kwargs)
+        if kwargs.keys() <= {"job_timeout"}:
+            from .release_scheduler import schedule
+
+            schedule(task_name, args, time.time() + delay_seconds, kwargs.get("job_timeout"))
+            return
+        return q.enqueue_in(timedelta(seconds=delay_seconds), func, *args, **kwargs)
+    return q.enqueue(func, *args, **kwargs)
+
+
+class TaskSpec(NamedTuple):
+    """One task for enqueue_many_tasks, as enqueue_warming_task would get it."""
+    task_name: str
+    args: tuple
+    delay_seconds: int = 0
+    job_timeout: Optional[int] = None
+
+
+def _write_chunk(chunk: list[TaskSpec], summary: dict) -> None:
+    from .release_scheduler import schedule
+
+    pipe = redis_conn.pipeline()
+    immediate = []
+    start = time.time()
+    for task in chunk:
+        if ASYNC_WORKER and task.task_name in ASYNC_TASKS and task.job_timeout is None:
+            _enqueue_async(task.task_name, task.args, task.delay_seconds, pipeline=pipe)
+            summary["async"] += 1
+        elif task.delay_seconds > 0:
+            _task_func(task.task_name)  # unknown names fail now, not at release
+            schedule(task.task_name, task.args, start + task.delay_seconds, task.job_timeout, pipeline=pipe)
+            summary["scheduled"] += 1
+        else:
+            immediate.append(Queue.prepare_data(_task_func(task.task_name), task.args, timeout=task.job_timeout))
+    if immediate:
+        q.enqueue_many(immediate, pipeline=pipe)
+    pipe.execute()
+    summary["jobs"] += len(chunk)
+    summary["chunks"] += 1
+
+
+def enqueue_many_tasks(tasks: Iterable[TaskSpec], chunk_size: int = ENQUEUE_CHUNK) -> dict:
+    """
+    Enqueue many tasks with one Redis round trip per chunk_size jobs: each
+    chunk's immediate jobs (Queue.enqueue_many) and delayed release wheel
+    entries (release_scheduler.schedule) are written through one pipeline.
+    Tasks routed to the async worker go through the same pipeline.
+    Returns {"jobs", "scheduled", "async", "chunks", "seconds", "jobs_per_sec"}.
+    """
+    started = time.perf_counter()
+    summary = {"jobs": 0, "scheduled": 0, "async": 0, "chunks": 0}
+    tasks = iter(tasks)
+    while chunk := list(islice(tasks, max(1, chunk_size))):
+        _write_chunk(chunk, summary)
+
+    elapsed = time.perf_counter() - started
+    summary["seconds"] = round(elapsed, 3)
+    summary["jobs_per_sec"] = round(summary["jobs"] / elapsed) if elapsed else None
+    return summary
+
+
+def _reschedule(task_name: str, args: tuple, error) -> None:
+    """Re-enqueue a task after a RateLimited error's retry hint plus jitter."""
+    enqueue_warming_task(task_name, *args, delay_seconds=int(error.retry_after) + random.randint(1, 30))
+
+
+def _take_slot(task_name: str, args: tuple, limits: tuple):
+    """
+    Take a provider slot (rate_limiter) for limits = (hosts, accounts).
+    If none is free, re-enqueue the task after the limiter's retry hint plus
+    jitter and return None, so the worker moves on instead of waiting.
+    """
+    from .rate_limiter import RateLimited, acquire
+
+    try:
+        return acquire(*limits)
+    except RateLimited as e:
+        _reschedule(task_name, args, e)
+        return None
+
+
+def _report_progress(**progress) -> None:
+    """Publish progress of the running job in job.meta (read by GET /jobs/{id})."""
+    from rq import get_current_job
+
+    job = get_current_job()
+    if job is not None:
+        job.meta["progress"] = progress
+        job.save_meta()
 
 
 # ── Task implementations ─────────────────────────────────────────────────────
 
 def send_warming_email(warming_account_id: int, domain_email_id: int, campaign_id: int):
     """Task: Send warming email from warming account to domain email."""
+    from .conversation import record_send_error, record_sent, schedule_domain_check
     from .database import SessionLocal
     from .email_service import send_random_warming_email
-    from .models import DomainEmail, LogStatusEnum, WarmingAccount, WarmingLog
+    from .models import DomainEmail, WarmingAccount
+    from .rate_limiter import RateLimited, release, smtp_limits
 
     db = SessionLocal()
     try:
@@ -51,65 +183,145 @@ def send_warming_email(warming_account_id: int, domain_email_id: int, campaign_i
         if not account or not domain_email:
             return {"error": "Account or domain email not found"}
 
-        subject, message_id = send_random_warming_email(account, domain_email.email)
-
-        log = WarmingLog(
-            campaign_id=campaign_id,
-            warming_account_id=warming_account_id,
-            domain_email_id=domain_email_id,
-            subject=subject,
-            message_id=message_id,
-            status=LogStatusEnum.sent,
-            sent_at=datetime.utcnow(),
-        )
-        db.add(log)
-        db.commit()
-        db.refresh(log)
-
-        # Schedule domain inbox check after 5–30 min
-        delay = random.randint(5 * 60, 30 * 60)
-        enqueue_warming_task(
-            "check_domain_inbox",
-            domain_email_id,
-            warming_account_id,
-            campaign_id,
-            log.id,
-            delay_seconds=delay,
+        lease = _take_slot(
+            "send_warming_email", (warming_account_id, domain_email_id, campaign_id), smtp_limits(account),
         )
+        if lease is None:
+            return {"status": "rescheduled"}
+        try:
+            subject, message_id = send_random_warming_email(account, domain_email.email)
+        finally:
+            release(lease)
 
-        return {"status": "sent", "log_id": log.id, "subject": subject}
+        log_id = record_sent(db, campaign_id, warming_account_id, domain_email_id, subject, message_id)
+        schedule_domain_check(domain_email_id, warming_account_id, campaign_id, log_id, message_id)
 
+        return {"status": "sent", "log_id": log_id, "subject": subject}
+
+    except RateLimited as e:
+        # No free connection to the provider (rate_limiter.connection_lease); nothing was sent
+        _reschedule("send_warming_email", (warming_account_id, domain_email_id, campaign_id), e)
+        return {"status": "rescheduled"}
     except Exception as e:
-        db.rollback()
-        # Log error
-        try:
-            error_log = WarmingLog(
-                campaign_id=campaign_id,
-                warming_account_id=warming_account_id,
-                domain_email_id=domain_email_id,
-                status=LogStatusEnum.error,
-                error_message=str(e),
-            )
-            db.add(error_log)
-            db.commit()
-        except Exception:
-            pass
+        record_send_error(db, campaign_id, warming_account_id, domain_email_id, str(e))
         raise
     finally:
         db.close()
 
 
+# Pause between messages of one batch, in seconds; capped below
+# SMTP_POOL_IDLE_TIMEOUT so the pooled session outlives it (_batch_pace)
+BATCH_PACE_MIN = int(os.environ.get("BATCH_PACE_MIN", "20"))
+BATCH_PACE_MAX = int(os.environ.get("BATCH_PACE_MAX", "90"))
+# A run paces for at most this long, then hands the rest of the batch on
+BATCH_RUN_SECONDS = int(os.environ.get("BATCH_RUN_SECONDS", "900"))
+BATCH_JOB_TIMEOUT = BATCH_RUN_SECONDS + 300
+
+
+def _batch_pace() -> int:
+    from .email_service import SMTP_POOL_IDLE_TIMEOUT
+
+    high = max(1, min(BATCH_PACE_MAX, int(SMTP_POOL_IDLE_TIMEOUT * 0.75)))
+    return random.randint(min(BATCH_PACE_MIN, high), high)
+
+
+def _continue_batch(warming_account_id: int, targets: list, delay_seconds: int) -> None:
+    enqueue_warming_task(
+        "send_warming_email_batch",
+        warming_account_id,
+        targets,
+        delay_seconds=delay_seconds,
+        job_timeout=BATCH_JOB_TIMEOUT,
+    )
+
+
+def send_warming_email_batch(warming_account_id: int, targets: list):
+    """
+    Task: Send the day's warming emails of one account over one SMTP
+    session. targets is a list of (domain_email_id, campaign_id). Messages
+    go out _batch_pace() seconds apart from this job, within the pool's idle
+    timeout, so the session opened for the first message carries the rest.
+    After BATCH_RUN_SECONDS the remainder is re-enqueued on the release
+    wheel, which bounds how long a batch holds the worker. Every message
+    gets its own log entry and inbox check, as in send_warming_email; a
+    failed message is logged and the batch carries on.
+    """
+    from .conversation import record_send_error, record_sent, schedule_domain_check
+    from .database import SessionLocal
+    from .email_service import send_random_warming_email
+    from .models import DomainEmail, WarmingAccount
+    from .rate_limiter import RateLimited, acquire, release, smtp_limits
+
+    db = SessionLocal()
+    try:
+        account = db.get(WarmingAccount, warming_account_id)
+        if not account:
+            return {"error": "Account not found"}
+
+        targets = [tuple(target) for target in targets]
+        deadline = time.monotonic() + BATCH_RUN_SECONDS
+        results = []
+        while targets:
+            domain_email_id, campaign_id = targets[0]
+            domain_email = db.get(DomainEmail, domain_email_id)
+            if domain_email is None:
+                targets.pop(0)
+                results.append({"domain_email_id": domain_email_id, "error": "Domain email not found"})
+                continue
+
+            try:
+                lease = acquire(*smtp_limits(account))
+                try:
+                    subject, message_id = send_random_warming_email(account, domain_email.email)
+                finally:
+                    release(lease)
+            except RateLimited as e:
+                # No slot or free connection; nothing was sent
+                _continue_batch(warming_account_id, targets, int(e.retry_after) + random.randint(1, 30))
+                return {"status": "rescheduled", "results": results, "remaining": len(targets)}
+            except Exception as e:
+                # Not retried: the message may have gone out
+                targets.pop(0)
+                record_send_error(db, campaign_id, warming_account_id, domain_email_id, str(e))
+                results.append({"domain_email_id": domain_email_id, "status": "error", "error": str(e)})
+            else:
+                targets.pop(0)
+                log_id = record_sent(db, campaign_id, warming_account_id, domain_email_id, subject, message_id)
+                schedule_domain_check(domain_email_id, warming_account_id, campaign_id, log_id, message_id)
+                results.append({"domain_email_id": domain_email_id, "status": "sent", "log_id": log_id})
+
+            if targets:
+                pace = _batch_pace()
+                if time.monotonic() + pace > deadline:
+                    _continue_batch(warming_account_id, targets, pace)
+                    break
+                time.sleep(pace)
+
+        return {"status": "continued" if targets else "done", "results": results, "remaining": len(targets)}
+    finally:
+        db.close()
+
+
 def check_domain_inbox(
     domain_email_id: int,
     warming_account_id: int,
     campaign_id: int,
     log_id: int,
+    attempt: int = 0,
 ):
-    """Task: Domain email checks inbox, marks as read, sends reply."""
+    """
+    Task: Domain email checks inbox, marks as read, sends reply. A check
+    that misses the message runs again later (conversation.retry_not_found);
+    attempt counts those runs.
+    """
+    from .conversation import record_check_error, record_replied, retry_not_found, schedule_warming_check
     from .database import SessionLocal
-    from .email_service import check_inbox_for_message, mark_as_read, reply_to_email
-    from .models import DomainEmail, LogStatusEnum, WarmingAccount, WarmingLog
+    from .email_service import imap_session, mark_as_read, reply_to_email
+    from .models import DomainEmail, WarmingAccount, WarmingLog
+    from .rate_limiter import RateLimited, imap_limits, release
+    from .reply_index import locate_message
 
+    args = (domain_email_id, warming_account_id, campaign_id, log_id)
     db = SessionLocal()
     try:
         domain_email = db.get(DomainEmail, domain_email_id)
@@ -118,23 +330,28 @@ def check_domain_inbox(
 
         if not domain_email or not account or not log:
             return {"error": "Not found"}
+        if not log.message_id:
+            return {"error": "Log has no message id", "log_id": log_id}
+        if log.replied_at:
+            # Already handled (e.g. dispatched by both poll and IDLE listener)
+            return {"status": "already_replied", "log_id": log_id}
+
+        lease = _take_slot("check_domain_inbox", args + (attempt,), imap_limits(domain_email))
+        if lease is None:
+            return {"status": "rescheduled", "log_id": log_id}
+        try:
+            # Locate exactly the message we sent, by its Message-ID, among
+            # the arrivals since the mailbox cursor
+            with imap_session(domain_email) as imap:
+                target = locate_message(db, domain_email, log.message_id, imap)
+                if target:
+                    mark_as_read(domain_email, target["uid"], imap=imap)
 
-        messages = check_inbox_for_message(domain_email, "UNSEEN")
-
-        # Find the matching message
-        target = None
-        for msg in messages:
-            if log.message_id and log.message_id in msg.get("message_id", ""):
-                target = msg
-                break
-        if not target and messages:
-            target = messages[-1]
+            if not target:
+                retried = retry_not_found("check_domain_inbox", args, attempt)
+                return {"status": "not_found", "log_id": log_id, "retried": retried}
 
-        if target:
-            mark_as_read(domain_email, target["uid"])
-            log.received_at = datetime.utcnow()
-            log.opened_at = datetime.utcnow()
-            log.status = LogStatusEnum.opened
+            opened_at = datetime.utcnow()
 
             # Send reply from domain email back to warming account
             reply_msg_id = reply_to_email(
@@ -143,37 +360,22 @@ def check_domain_inbox(
                 target["message_id"],
                 account.email,
             )
+        finally:
+            release(lease)
 
-            log.replied_at = datetime.utcnow()
-            log.status = LogStatusEnum.replied
-            db.commit()
-
-            # Schedule warming account inbox check after 10–60 min
-            delay = random.randint(10 * 60, 60 * 60)
-            enqueue_warming_task(
-                "check_warming_account_inbox",
-                warming_account_id,
-                domain_email_id,
-                campaign_id,
-                log_id,
-                reply_msg_id,
-                target["subject"],
-                delay_seconds=delay,
-            )
+        record_replied(db, log_id, opened_at)
+        schedule_warming_check(
+            warming_account_id, domain_email_id, campaign_id, log_id, reply_msg_id, target["subject"],
+        )
 
         return {"status": "replied", "log_id": log_id}
 
+    except RateLimited as e:
+        # No free connection to the provider (rate_limiter.connection_lease)
+        _reschedule("check_domain_inbox", args + (attempt,), e)
+        return {"status": "rescheduled", "log_id": log_id}
     except Exception as e:
-        db.rollback()
-        if log_id:
-            try:
-                log = db.get(WarmingLog, log_id)
-                if log:
-                    log.status = LogStatusEnum.error
-                    log.error_message = str(e)
-                    db.commit()
-            except Exception:
-                pass
+        record_check_error(db, log_id, str(e))
         raise
     finally:
         db.close()
@@ -186,12 +388,20 @@ def check_warming_account_inbox(
     log_id: int,
     expected_message_id: str,
     original_subject: str,
+    attempt: int = 0,
 ):
-    """Task: Warming account checks inbox, marks reply as read, sends reply back."""
+    """
+    Task: Warming account checks inbox, marks reply as read, sends reply back.
+    Runs again later if the reply is not found, as check_domain_inbox does.
+    """
+    from .conversation import record_check_error, record_completed, retry_not_found
     from .database import SessionLocal
-    from .email_service import check_inbox_for_message, mark_as_read, reply_to_email
-    from .models import DomainEmail, LogStatusEnum, WarmingAccount, WarmingLog
+    from .email_service import imap_session, mark_as_read, reply_to_email
+    from .models import DomainEmail, WarmingAccount, WarmingLog
+    from .rate_limiter import RateLimited, imap_limits, release
+    from .reply_index import locate_message
 
+    args = (warming_account_id, domain_email_id, campaign_id, log_id, expected_message_id, original_subject)
     db = SessionLocal()
     try:
         account = db.get(WarmingAccount, warming_account_id)
@@ -201,19 +411,19 @@ def check_warming_account_inbox(
         if not account or not domain_email or not log:
             return {"error": "Not found"}
 
-        messages = check_inbox_for_message(account, "UNSEEN")
-
-        target = None
-        for msg in messages:
-            if msg.get("in_reply_to") == expected_message_id or \
-               domain_email.email in msg.get("from", ""):
-                target = msg
-                break
-        if not target and messages:
-            target = messages[-1]
+        lease = _take_slot("check_warming_account_inbox", args + (attempt,), imap_limits(account))
+        if lease is None:
+            return {"status": "rescheduled", "log_id": log_id}
+        try:
+            # Locate the domain's reply by its own Message-ID (returned by reply_to_email)
+            with imap_session(account) as imap:
+                target = locate_message(db, account, expected_message_id, imap)
+                if target:
+                    mark_as_read(account, target["uid"], imap=imap)
 
-        if target:
-            mark_as_read(account, target["uid"])
+            if not target:
+                retried = retry_not_found("check_warming_account_inbox", args, attempt)
+                return {"status": "not_found", "log_id": log_id, "retried": retried}
 
             # Send another reply back to complete the conversation loop
             reply_to_email(
@@ -222,14 +432,18 @@ def check_warming_account_inbox(
                 target["message_id"],
                 domain_email.email,
             )
+        finally:
+            release(lease)
 
-            log.status = LogStatusEnum.replied
-            db.commit()
+        record_completed(db, log_id)
 
         return {"status": "completed", "log_id": log_id}
 
+    except RateLimited as e:
+        _reschedule("check_warming_account_inbox", args + (attempt,), e)
+        return {"status": "rescheduled", "log_id": log_id}
     except Exception as e:
-        db.rollback()
+        record_check_error(db, log_id, str(e))
         raise
     finally:
         db.close()
@@ -246,3 +460,140 @@ def run_daily_scheduler_task():
         return summary
     finally:
         db.close()
+
+
+# Refresh tokens expiring within this many minutes, this many at a time
+TOKEN_REFRESH_HORIZON = int(os.environ.get("TOKEN_REFRESH_HORIZON", "15"))
+TOKEN_REFRESH_CONCURRENCY = int(os.environ.get("TOKEN_REFRESH_CONCURRENCY", "8"))
+
+
+def refresh_oauth2_tokens_task():
+    """Task: Refresh OAuth2 tokens before they expire, off the send path."""
+    import logging
+    from datetime import timedelta
+
+    from .token_cache import refresh_expiring_tokens
+
+    summary = refresh_expiring_tokens(timedelta(minutes=TOKEN_REFRESH_HORIZON), TOKEN_REFRESH_CONCURRENCY)
+    for failure in summary["failed"]:
+        logging.getLogger(__name__).warning(f"OAuth2 refresh failed for {failure['email']}: {failure['detail']}")
+    return summary
+
+
+# Token writes are committed (and progress reported) every this many accounts
+OAUTH2_COMMIT_CHUNK = int(os.environ.get("OAUTH2_COMMIT_CHUNK", "100"))
+
+
+def bulk_fetch_oauth2_tokens_task():
+    """Task: Fetch Outlook OAuth2 tokens via ROPC for all Outlook password accounts."""
+    from .database import SessionLocal
+    from .models import AuthTypeEnum, ProviderEnum, WarmingAccount
+    from .oauth2_service import apply_outlook_tokens, fetch_outlook_tokens
+    from .token_cache import invalidate
+
+    db = SessionLocal()
+    try:
+        credentials = db.query(WarmingAccount.id, WarmingAccount.email, WarmingAccount.password).filter(
+            WarmingAccount.provider == ProviderEnum.outlook,
+            WarmingAccount.auth_type == AuthTypeEnum.password,
+            WarmingAccount.password != None,
+        ).all()
+        emails = {account_id: email for account_id, email, _ in credentials}
+
+        results = []
+        pending: dict[int, dict] = {}
+
+        def flush():
+            for account in db.query(WarmingAccount).filter(WarmingAccount.id.in_(pending)).all():
+                apply_outlook_tokens(account, pending[account.id])
+            db.commit()
+            for account_id in pending:
+                invalidate(emails[account_id])
+            pending.clear()
+            _report_progress(
+                total=len(credentials),
+                done=len(results),
+                ok=sum(1 for r in results if r["status"] == "ok"),
+            )
+
+        _report_progress(total=len(credentials), done=0, ok=0)
+        for account_id, tok, error in fetch_outlook_tokens(credentials):
+            if error:
+                results.append({"email": emails[account_id], "status": "error", "detail": error})
+            else:
+                pending[account_id] = tok
+                results.append({"email": emails[account_id], "status": "ok"})
+            if len(results) % OAUTH2_COMMIT_CHUNK == 0:
+                flush()
+        flush()
+
+        return {"processed": len(results), "results": results}
+    finally:
+        db.close()
+
+
+def bulk_connection_test_task(account_ids: Optional[list] = None, force: bool = False, deactivate: bool = False):
+    """
+    Task: SMTP/IMAP login test of many accounts (connection_tests), default
+    all active ones. Each account's result is published as it completes
+    (GET /accounts/bulk-test/{job_id}/results streams them); progress
+    (accounts done, ok, deactivated) is reported as results are committed.
+    """
+    from rq import get_current_job
+
+    from .connection_tests import publish_result, run_connection_tests
+
+    job = get_current_job()
+    results = []
+    for result in run_connection_tests(
+        account_ids, force=force, deactivate=deactivate, on_progress=lambda p: _report_progress(**p),
+    ):
+        if job is not None:
+            publish_result(job.id, result)
+        results.append(result)
+    return {
+        "tested": len(results),
+        "ok": sum(1 for r in results if r["smtp"] and r["imap"]),
+        "results": results,
+    }
+
+
+def import_accounts_task(upload_key: str, fmt: str, auto_oauth2: bool):
+    """
+    Task: Import accounts from an upload stored by account_import.store_upload.
+    fmt is "csv" or "text". Progress (rows processed, created, failed,
+    rows/s) is reported after every chunk.
+    """
+    from .account_import import delete_upload, import_accounts, iter_csv_rows, iter_text_rows, iter_upload_lines
+    from .database import SessionLocal
+
+    started = time.monotonic()
+
+    def on_progress(progress: dict) -> None:
+        elapsed = time.monotonic() - started
+        _report_progress(**progress, rows_per_sec=round(progress["processed"] / elapsed, 1) if elapsed else None)
+
+    db = SessionLocal()
+    try:
+        if fmt == "csv":
+            rows = iter_csv_rows(iter_upload_lines(upload_key, "utf-8-sig"))
+        else:
+            rows = iter_text_rows(iter_upload_lines(upload_key))
+        summary = import_accounts(db, rows, auto_oauth2, on_progress=on_progress)
+        summary["seconds"] = round(time.monotonic() - started, 1)
+        return summary
+    finally:
+        db.close()
+        delete_upload(upload_key)
+
+
+def scan_reputation_task(include_hosts: Optional[bool] = None):
+    """Task: Scan the reputation of all domains (and sending hosts) and store snapshots."""
+    from .database import SessionLocal
+    from .reputation_monitor import REPUTATION_SCAN_HOSTS, scan_fleet
+
+    db = SessionLocal()
+    try:
+        return scan_fleet(db, REPUTATION_SCAN_HOSTS if include_hosts is None else include_hosts)
+    finally:
+        db.close()
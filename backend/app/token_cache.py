@@ -0,0 +1,217 @@
+"""
+Fleet-wide OAuth2 access token cache.
+
+Access tokens live in Redis keyed by account email, so every worker process
+and node shares them. A refresh is single-flight: it runs under a per-account
+Redis lock, re-reads the refresh token from the database (the provider may
+have rotated it) and writes the result through to both Redis and the
+WarmingAccount row. Each account therefore hits the token endpoint at most
+once per expiry window, however many tasks need it at the same time.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import redis
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+# Lock is held for at most one token request (10–15s HTTP timeout)
+TOKEN_LOCK_TIMEOUT = int(os.environ.get("TOKEN_LOCK_TIMEOUT", "30"))
+TOKEN_LOCK_WAIT = int(os.environ.get("TOKEN_LOCK_WAIT", "20"))
+
+KEY_PREFIX = "warming:oauth2"
+
+redis_conn = redis.from_url(REDIS_URL, decode_responses=True)
+
+
+def _key(email: str) -> str:
+    return f"{KEY_PREFIX}:{email.lower()}"
+
+
+def _epoch(utc: datetime) -> float:
+    return (utc - datetime(1970, 1, 1)).total_seconds()
+
+
+def _apply(account, access_token: str, expiry: datetime, refresh_token: Optional[str]) -> None:
+    account.oauth2_access_token = access_token
+    account.oauth2_token_expiry = expiry
+    if refresh_token:
+        account.oauth2_refresh_token = refresh_token
+
+
+def _apply_response(account, data: dict) -> None:
+    _apply(
+        account,
+        data["access_token"],
+        datetime.utcnow() + timedelta(seconds=data.get("expires_in", 3600) - 60),
+        data.get("refresh_token"),
+    )
+
+
+def _load_cached(account) -> bool:
+    """Copy a still-valid cached token onto account. Returns False on a miss."""
+    data = redis_conn.hgetall(_key(account.email))
+    if not data or float(data.get("expiry", 0)) <= time.time():
+        return False
+    # Refresh tokens are not cached: the database row stays their only source
+    _apply(account, data["access_token"], datetime.utcfromtimestamp(float(data["expiry"])), None)
+    return True
+
+
+def _store(account) -> None:
+    expiry = _epoch(account.oauth2_token_expiry)
+    ttl = int(expiry - time.time())
+    if ttl <= 0:
+        return
+    key = _key(account.email)
+    pipe = redis_conn.pipeline()
+    pipe.hset(key, mapping={
+        "access_token": account.oauth2_access_token,
+        "expiry": expiry,
+    })
+    pipe.expire(key, ttl)
+    pipe.execute()
+
+
+def _refresh_through_db(
+    account,
+    refresh: Callable[[object], dict],
+    horizon: timedelta = timedelta(0),
+) -> bool:
+    """
+    Refresh using the freshest token state from the database and write the
+    result back to the WarmingAccount row (and onto account), unless the row
+    already holds a token valid beyond horizon. Returns True if refreshed.
+    """
+    from .database import SessionLocal
+    from .models import WarmingAccount
+
+    if not isinstance(account, WarmingAccount) or account.id is None:
+        _apply_response(account, refresh(account))
+        return True
+
+    db = SessionLocal()
+    try:
+        row = db.get(WarmingAccount, account.id)
+        if row is None:
+            _apply_response(account, refresh(account))
+            return True
+        if row.oauth2_token_expiry and row.oauth2_token_expiry > datetime.utcnow() + horizon:
+            # Refreshed elsewhere while the cache entry was missing
+            _apply(account, row.oauth2_access_token, row.oauth2_token_expiry, row.oauth2_refresh_token)
+            return False
+        _apply_response(row, refresh(row))
+        db.commit()
+        _apply(account, row.oauth2_access_token, row.oauth2_token_expiry, row.oauth2_refresh_token)
+        return True
+    finally:
+        db.close()
+
+
+def _release(lock) -> None:
+    try:
+        lock.release()
+    except redis.exceptions.LockError:
+        pass  # expired while the token endpoint was slow
+
+
+def get_shared_token(account, refresh: Callable[[object], dict]) -> str:
+    """
+    Return a valid access token for account from the shared cache, refreshing
+    it single-flight with refresh(account) -> token endpoint response if needed.
+    Updates account in place. Falls back to a plain refresh if Redis is down.
+    """
+    try:
+        if _load_cached(account):
+            return account.oauth2_access_token
+        lock = redis_conn.lock(f"{_key(account.email)}:lock", timeout=TOKEN_LOCK_TIMEOUT)
+        if not lock.acquire(blocking_timeout=TOKEN_LOCK_WAIT):
+            if _load_cached(account):
+                return account.oauth2_access_token
+            raise ValueError(f"Token refresh for {account.email} still in progress elsewhere")
+    except redis.exceptions.ConnectionError:
+        _refresh_through_db(account, refresh)
+        return account.oauth2_access_token
+
+    try:
+        # Another holder may have refreshed while we waited for the lock
+        if not _load_cached(account):
+            _refresh_through_db(account, refresh)
+            _store(account)
+        return account.oauth2_access_token
+    finally:
+        _release(lock)
+
+
+def refresh_ahead(account, refresh: Callable[[object], dict], horizon: timedelta) -> bool:
+    """
+    Refresh account's token under the shared lock if it expires within
+    horizon. Returns False if it was still fresh or another process holds
+    the lock (that process is refreshing it).
+    """
+    lock = redis_conn.lock(f"{_key(account.email)}:lock", timeout=TOKEN_LOCK_TIMEOUT)
+    if not lock.acquire(blocking_timeout=0):
+        return False
+    try:
+        if not _refresh_through_db(account, refresh, horizon):
+            return False
+        _store(account)
+        return True
+    finally:
+        _release(lock)
+
+
+def refresh_expiring_tokens(horizon: timedelta, concurrency: int) -> dict:
+    """
+    Refresh every active OAuth2 account whose token expires within horizon,
+    at most concurrency at a time. Accounts whose refresh fails (revoked or
+    expired refresh token, missing client id) are listed under "failed".
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from .database import SessionLocal
+    from .email_service import _refresh_oauth2_token
+    from .models import AuthTypeEnum, WarmingAccount
+
+    db = SessionLocal()
+    try:
+        accounts = (
+            db.query(WarmingAccount)
+            .filter(
+                WarmingAccount.active == True,
+                WarmingAccount.auth_type == AuthTypeEnum.oauth2,
+                (WarmingAccount.oauth2_token_expiry == None)
+                | (WarmingAccount.oauth2_token_expiry <= datetime.utcnow() + horizon),
+            )
+            .all()
+        )
+        for account in accounts:
+            db.expunge(account)
+    finally:
+        db.close()
+
+    def _refresh(account) -> dict:
+        try:
+            refreshed = refresh_ahead(account, _refresh_oauth2_token, horizon)
+            return {"email": account.email, "status": "refreshed" if refreshed else "skipped"}
+        except Exception as e:
+            return {"email": account.email, "status": "error", "detail": str(e)}
+
+    summary = {"checked": len(accounts), "refreshed": 0, "skipped": 0, "failed": []}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for result in pool.map(_refresh, accounts):
+            if result["status"] == "error":
+                summary["failed"].append(result)
+            else:
+                summary[result["status"]] += 1
+    return summary
+
+
+def invalidate(email: str) -> None:
+    """Drop the cached token, e.g. after a new ROPC login replaced it."""
+    try:
+        redis_conn.delete(_key(email))
+    except redis.exceptions.ConnectionError:
+        pass
@@ -3,20 +3,36 @@ Core domain warming logic.
 Calculates daily email volume and orchestrates warming tasks.
 """
 
+import heapq
+import os
 import random
+import time
 from datetime import datetime, timedelta
+from typing import NamedTuple
 
+from sqlalchemy import exists, func
 from sqlalchemy.orm import Session
 
 from .models import (
     CampaignStatusEnum,
     DomainEmail,
     LogStatusEnum,
+    MailboxCursor,
     WarmingAccount,
     WarmingCampaign,
     WarmingLog,
 )
 
+# Global daily send caps across all campaigns (0 = unlimited)
+ACCOUNT_DAILY_CAP = int(os.environ.get("ACCOUNT_DAILY_CAP", "20"))
+# "provider=n,..." e.g. "outlook=2000,gmail=1000"
+PROVIDER_DAILY_CAPS = {
+    provider.strip(): int(cap)
+    for provider, _, cap in (
+        item.partition("=") for item in os.environ.get("PROVIDER_DAILY_CAPS", "").split(",") if item.strip()
+    )
+}
+
 
 def calculate_emails_today(campaign: WarmingCampaign) -> int:
     """
@@ -41,45 +57,176 @@ def calculate_emails_today(campaign: WarmingCampaign) -> int:
     return max(1, count)
 
 
-def get_warming_pairs(db: Session, campaign: WarmingCampaign, count: int) -> list[tuple]:
+def get_warming_pairs(db: Session, campaign: WarmingCampaign, count: int) -> list[tuple[int, int]]:
     """
-    Select random (warming_account, domain_email) pairs for today's warming run.
-    Avoids pairs already used today.
+    Select random (warming_account_id, domain_email_id) pairs for today's
+    warming run. Avoids accounts already used today by this campaign.
+    Sampling happens in the database; only id columns of `count` rows are
+    loaded.
     """
+    if count <= 0:
+        return []
+
     today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
 
-    # Already used warming account IDs today for this campaign
-    used_ids = {
-        row.warming_account_id
-        for row in db.query(WarmingLog.warming_account_id)
-        .filter(
-            WarmingLog.campaign_id == campaign.id,
-            WarmingLog.created_at >= today_start,
-        )
-        .all()
-    }
+    # Each pair draws from a random sample as large as the pairs wanted
+    domain_email_ids = [row.id for row in db.query(DomainEmail.id).order_by(func.random()).limit(count)]
+    if not domain_email_ids:
+        return []
 
-    accounts = (
-        db.query(WarmingAccount)
-        .filter(WarmingAccount.active == True)
-        .all()
+    # Accounts already used today for this campaign (anti-join)
+    used_today = exists().where(
+        WarmingLog.warming_account_id == WarmingAccount.id,
+        WarmingLog.campaign_id == campaign.id,
+        WarmingLog.created_at >= today_start,
     )
-    domain_emails = db.query(DomainEmail).all()
-
-    if not accounts or not domain_emails:
-        return []
+    active = db.query(WarmingAccount.id).filter(WarmingAccount.active == True)
 
     # Prefer accounts not yet used today
-    available = [a for a in accounts if a.id not in used_ids] or accounts
-    random.shuffle(available)
+    account_ids = [
+        row.id for row in active.filter(~used_today).order_by(func.random()).limit(count)
+    ] or [
+        row.id for row in active.order_by(func.random()).limit(count)
+    ]
+
+    return [(account_id, random.choice(domain_email_ids)) for account_id in account_ids]
+
+
+# ── Daily plan ───────────────────────────────────────────────────────────────
 
-    pairs = []
-    for i in range(min(count, len(available))):
-        account = available[i % len(available)]
-        domain_email = random.choice(domain_emails)
-        pairs.append((account, domain_email))
+class PlanningState(NamedTuple):
+    """Today's demand and load, as plain ids and counts (see load_planning_state)."""
 
-    return pairs
+    demand: dict  # campaign id -> emails wanted today
+    accounts: list  # [(warming account id, provider)] of active accounts
+    account_load: dict  # warming account id -> emails sent today
+    provider_load: dict  # provider -> emails sent today
+    served: dict  # campaign id -> {warming account ids used today}
+    domain_email_ids: list
+    domain_email_load: dict  # domain email id -> emails received today
+
+
+class DailyPlan(NamedTuple):
+    sends: dict  # warming account id -> [(domain_email_id, campaign_id)]
+    shortfall: dict  # campaign id -> emails that could not be planned
+
+
+def load_planning_state(db: Session, demand: dict) -> PlanningState:
+    """Read today's per-account, per-provider and per-mailbox send counts (id columns only)."""
+    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    today = WarmingLog.created_at >= today_start
+
+    served: dict[int, set] = {campaign_id: set() for campaign_id in demand}
+    for campaign_id, account_id in (
+        db.query(WarmingLog.campaign_id, WarmingLog.warming_account_id)
+        .filter(today, WarmingLog.campaign_id.in_(list(demand)))
+        .distinct()
+    ):
+        served[campaign_id].add(account_id)
+
+    return PlanningState(
+        demand=demand,
+        accounts=[
+            (account_id, provider.value)
+            for account_id, provider in db.query(WarmingAccount.id, WarmingAccount.provider).filter(
+                WarmingAccount.active == True
+            )
+        ],
+        account_load=dict(
+            db.query(WarmingLog.warming_account_id, func.count(WarmingLog.id))
+            .filter(today)
+            .group_by(WarmingLog.warming_account_id)
+            .all()
+        ),
+        provider_load={
+            provider.value: n
+            for provider, n in db.query(WarmingAccount.provider, func.count(WarmingLog.id))
+            .join(WarmingLog, WarmingLog.warming_account_id == WarmingAccount.id)
+            .filter(today)
+            .group_by(WarmingAccount.provider)
+        },
+        served=served,
+        domain_email_ids=[row.id for row in db.query(DomainEmail.id)],
+        domain_email_load=dict(
+            db.query(WarmingLog.domain_email_id, func.count(WarmingLog.id))
+            .filter(today)
+            .group_by(WarmingLog.domain_email_id)
+            .all()
+        ),
+    )
+
+
+def plan_sends(state: PlanningState) -> DailyPlan:
+    """
+    Assign today's demand of all campaigns to warming accounts in one pass.
+
+    Accounts are filled level by level (water-filling): round k only gives a
+    send to accounts with at most k sends today, so load stays even. Within
+    a round campaigns take turns, each account serves a campaign at most
+    once a day, and ACCOUNT_DAILY_CAP / PROVIDER_DAILY_CAPS are respected.
+    Domain emails go to the least-loaded one. O(rounds x accounts), where
+    rounds is bounded by the account cap.
+    """
+    demand = {campaign_id: n for campaign_id, n in state.demand.items() if n > 0}
+    sends: dict[int, list[tuple[int, int]]] = {}
+    if not demand or not state.accounts or not state.domain_email_ids:
+        return DailyPlan(sends, demand)
+
+    account_load = dict(state.account_load)
+    provider_load = dict(state.provider_load)
+    served = {campaign_id: set(state.served.get(campaign_id, ())) for campaign_id in demand}
+
+    # Least-loaded domain email first, random among equals
+    domain_emails = [
+        (state.domain_email_load.get(de_id, 0), random.random(), de_id) for de_id in state.domain_email_ids
+    ]
+    heapq.heapify(domain_emails)
+
+    accounts = list(state.accounts)
+    random.shuffle(accounts)
+    accounts.sort(key=lambda a: account_load.get(a[0], 0))
+
+    remaining = sum(demand.values())
+    level = account_load.get(accounts[0][0], 0)
+    turn = 0
+    while remaining:
+        campaigns = [campaign_id for campaign_id in demand if demand[campaign_id]]
+        assigned = False
+        for account_id, provider in accounts:
+            load = account_load.get(account_id, 0)
+            if load > level or (ACCOUNT_DAILY_CAP and load >= ACCOUNT_DAILY_CAP):
+                continue
+            provider_cap = PROVIDER_DAILY_CAPS.get(provider)
+            if provider_cap and provider_load.get(provider, 0) >= provider_cap:
+                continue
+
+            for k in range(len(campaigns)):
+                campaign_id = campaigns[(turn + k) % len(campaigns)]
+                if demand[campaign_id] and account_id not in served[campaign_id]:
+                    break
+            else:
+                continue
+            turn = (turn + k + 1) % len(campaigns)
+
+            de_load, _, domain_email_id = heapq.heappop(domain_emails)
+            heapq.heappush(domain_emails, (de_load + 1, random.random(), domain_email_id))
+
+            sends.setdefault(account_id, []).append((domain_email_id, campaign_id))
+            served[campaign_id].add(account_id)
+            demand[campaign_id] -= 1
+            account_load[account_id] = load + 1
+            provider_load[provider] = provider_load.get(provider, 0) + 1
+            remaining -= 1
+            assigned = True
+            if not remaining:
+                break
+
+        # A round without assignments at the top level means nothing can take more
+        if not assigned and level >= max(account_load.get(a[0], 0) for a in accounts):
+            break
+        level += 1
+
+    return DailyPlan(sends, {campaign_id: n for campaign_id, n in demand.items() if n})
 
 
 def create_log_entry(
@@ -106,13 +253,33 @@ def create_log_entry(
     return log
 
 
+def get_mailbox_cursor(db: Session, owner) -> MailboxCursor:
+    """Return the IMAP sync cursor for a DomainEmail or WarmingAccount, creating it if needed."""
+    if isinstance(owner, DomainEmail):
+        column = MailboxCursor.domain_email_id
+    else:
+        column = MailboxCursor.warming_account_id
+
+    cursor = db.query(MailboxCursor).filter(column == owner.id).first()
+    if cursor is None:
+        cursor = MailboxCursor(last_uid=0)
+        if isinstance(owner, DomainEmail):
+            cursor.domain_email_id = owner.id
+        else:
+            cursor.warming_account_id = owner.id
+        db.add(cursor)
+    return cursor
+
+
 def run_daily_scheduler(db: Session) -> dict:
     """
-    Main scheduler: runs once per day for each active campaign.
-    Enqueues email tasks for all pairs.
+    Main scheduler: runs once per day over all active campaigns.
+    Plans their sends together (plan_sends) and enqueues one task or batch
+    per warming account in bulk (tasks.enqueue_many_tasks).
     Returns summary.
     """
-    from .tasks import enqueue_warming_task
+    from .tasks import BATCH_JOB_TIMEOUT, TaskSpec, enqueue_many_tasks
+    from .warming_planner import HAS_NUMPY
 
     active_campaigns = (
         db.query(WarmingCampaign)
@@ -120,29 +287,47 @@ def run_daily_scheduler(db: Session) -> dict:
         .all()
     )
 
-    summary = {"campaigns_processed": 0, "tasks_enqueued": 0}
+    summary = {"campaigns_processed": 0, "tasks_enqueued": 0, "batches_enqueued": 0}
+    if HAS_NUMPY:
+        from .warming_planner import campaign_demand
 
-    for campaign in active_campaigns:
-        count = calculate_emails_today(campaign)
-        pairs = get_warming_pairs(db, campaign, count)
-
-        for account, domain_email in pairs:
-            # Spread sends over the day: random delay 0–8 hours
-            delay_seconds = random.randint(0, 8 * 3600)
-            enqueue_warming_task(
-                "send_warming_email",
-                account.id,
-                domain_email.id,
-                campaign.id,
-                delay_seconds=delay_seconds,
-            )
-            summary["tasks_enqueued"] += 1
+        demand = campaign_demand(active_campaigns)
+    else:
+        demand = {campaign.id: calculate_emails_today(campaign) for campaign in active_campaigns}
 
+    for campaign in active_campaigns:
         # Advance campaign day
         campaign.current_day += 1
         if campaign.current_day >= campaign.ramp_up_days:
             campaign.current_day = campaign.ramp_up_days
-        db.commit()
         summary["campaigns_processed"] += 1
+    db.commit()
+
+    # One matching pass for all campaigns, within the global daily caps
+    started = time.perf_counter()
+    if HAS_NUMPY:
+        from .warming_planner import plan_daily
+
+        plan = plan_daily(db, demand)
+    else:
+        plan = plan_sends(load_planning_state(db, demand))
+    summary["planning_ms"] = round((time.perf_counter() - started) * 1000)
+    summary["shortfall"] = plan.shortfall
+
+    jobs = []
+    for account_id, targets in plan.sends.items():
+        # Spread sends over the day: random delay 0–8 hours
+        delay_seconds = random.randint(0, 8 * 3600)
+        if len(targets) == 1:
+            domain_email_id, campaign_id = targets[0]
+            jobs.append(TaskSpec("send_warming_email", (account_id, domain_email_id, campaign_id), delay_seconds))
+        else:
+            # Today's messages from this account, paced apart over one SMTP session
+            jobs.append(TaskSpec(
+                "send_warming_email_batch", (account_id, targets), delay_seconds, BATCH_JOB_TIMEOUT,
+            ))
+            summary["batches_enqueued"] += 1
+        summary["tasks_enqueued"] += len(targets)
 
+    summary["enqueue"] = enqueue_many_tasks(jobs)
     return summary
@@ -0,0 +1,339 @@
+"""
+Vectorized planning core for the daily warming run.
+
+Active accounts, domain emails and today's send counts are loaded as
+compact NumPy arrays (int64 ids, int8 provider codes, int32 loads and
+last-used days) and the plan is computed with array operations:
+
+  1. Sends per account by water-filling: accounts are raised to a common
+     load level, least recently used first, within ACCOUNT_DAILY_CAP, one
+     send per campaign and PROVIDER_DAILY_CAPS.
+  2. Campaign demand is dealt over the accounts round by round, so an
+     account's sends go to distinct campaigns.
+  3. Domain emails are water-filled the same way and shuffled onto the sends.
+
+The few sends that would repeat an account's campaign of today are planned
+again by warming_engine.plan_sends on a small set of spare accounts. When
+nearly every account is at its cap, a send that would only fit by swapping
+two accounts' campaigns is reported as shortfall.
+Without NumPy (HAS_NUMPY False) warming_engine uses plan_sends throughout.
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .models import DomainEmail, ProviderEnum, WarmingAccount, WarmingLog
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# Sends in the last PLAN_LRU_DAYS days decide which accounts go first
+PLAN_LRU_DAYS = int(os.environ.get("PLAN_LRU_DAYS", "7"))
+
+PROVIDERS = [provider.value for provider in ProviderEnum]
+PROVIDER_CODES = {provider: code for code, provider in enumerate(PROVIDERS)}
+
+
+class PlanArrays(NamedTuple):
+    account_ids: "np.ndarray"  # int64, sorted
+    providers: "np.ndarray"  # int8 provider codes
+    account_load: "np.ndarray"  # int32 sends today
+    last_used: "np.ndarray"  # int32 day number of the last send (-1 = none recently)
+    provider_load: dict  # provider -> sends today
+    served_keys: "np.ndarray"  # int64 account_id * CAMPAIGN_KEY + campaign_id used today
+    domain_email_ids: "np.ndarray"  # int64
+    domain_email_load: "np.ndarray"  # int32 sends received today
+
+
+CAMPAIGN_KEY = 1 << 32
+
+
+# ── Ramp ─────────────────────────────────────────────────────────────────────
+
+def ramp_volumes(current_day, start_delay, ramp_up_days, start, maximum) -> "np.ndarray":
+    """warming_engine.calculate_emails_today for arrays of campaign attributes."""
+    day, delay, ramp, start, maximum = (
+        np.asarray(a, dtype=np.int64) for a in (current_day, start_delay, ramp_up_days, start, maximum)
+    )
+    effective = day - delay
+    ratio = effective / np.maximum(ramp, 1)
+    ramped = np.maximum(1, start + np.trunc((maximum - start) * ratio).astype(np.int64))
+    return np.where(day < delay, 0, np.where(effective >= ramp, maximum, ramped))
+
+
+def campaign_demand(campaigns) -> dict:
+    """Emails wanted today per campaign id."""
+    if not campaigns:
+        return {}
+    volumes = ramp_volumes(*(
+        [getattr(c, attr) for c in campaigns]
+        for attr in ("current_day", "start_delay_days", "ramp_up_days", "emails_per_day_start", "emails_per_day_max")
+    ))
+    return dict(zip([c.id for c in campaigns], volumes.tolist()))
+
+
+# ── Loading ──────────────────────────────────────────────────────────────────
+
+def _day_number(dt: datetime) -> int:
+    return (dt - datetime(1970, 1, 1)).days
+
+
+def _counts(ids: "np.ndarray", rows) -> "np.ndarray":
+    """Scatter (id, count) rows onto positions of the sorted ids array."""
+    result = np.zeros(len(ids), dtype=np.int32)
+    rows = [(row_id, n) for row_id, n in rows if row_id is not None]
+    if rows:
+        row_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        values = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+        pos = np.searchsorted(ids, row_ids)
+        found = (pos < len(ids)) & (ids[np.minimum(pos, len(ids) - 1)] == row_ids)
+        result[pos[found]] = values[found]
+    return result
+
+
+def load_plan_arrays(db: Session, campaign_ids) -> PlanArrays:
+    """Read accounts, domain emails and today's send counts into arrays (id columns only)."""
+    now = datetime.utcnow()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    today = WarmingLog.created_at >= today_start
+
+    rows = db.execute(
+        select(WarmingAccount.id, WarmingAccount.provider)
+        .where(WarmingAccount.active == True)
+        .order_by(WarmingAccount.id)
+    ).all()
+    account_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    providers = np.fromiter((PROVIDER_CODES[r[1].value] for r in rows), dtype=np.int8, count=len(rows))
+    del rows
+
+    account_load = _counts(account_ids, db.execute(
+        select(WarmingLog.warming_account_id, func.count(WarmingLog.id))
+        .where(today)
+        .group_by(WarmingLog.warming_account_id)
+    ))
+    last_used = np.full(len(account_ids), -1, dtype=np.int32)
+    recent = [
+        (account_id, _day_number(last))
+        for account_id, last in db.execute(
+            select(WarmingLog.warming_account_id, func.max(WarmingLog.created_at))
+            .where(WarmingLog.created_at >= today_start - timedelta(days=PLAN_LRU_DAYS))
+            .group_by(WarmingLog.warming_account_id)
+        )
+    ]
+    if recent:
+        days = _counts(account_ids, recent)
+        last_used = np.where(days > 0, days, last_used).astype(np.int32)
+
+    provider_load = {
+        provider.value: n
+        for provider, n in db.execute(
+            select(WarmingAccount.provider, func.count(WarmingLog.id))
+            .join(WarmingLog, WarmingLog.warming_account_id == WarmingAccount.id)
+            .where(today)
+            .group_by(WarmingAccount.provider)
+        )
+    }
+
+    served = db.execute(
+        select(WarmingLog.warming_account_id, WarmingLog.campaign_id)
+        .where(today, WarmingLog.campaign_id.in_(list(campaign_ids)))
+        .distinct()
+    ).all()
+    served_keys = np.array([a * CAMPAIGN_KEY + c for a, c in served], dtype=np.int64)
+
+    domain_email_ids = np.array(
+        db.execute(select(DomainEmail.id).order_by(DomainEmail.id)).scalars().all(), dtype=np.int64
+    )
+    domain_email_load = _counts(domain_email_ids, db.execute(
+        select(WarmingLog.domain_email_id, func.count(WarmingLog.id))
+        .where(today)
+        .group_by(WarmingLog.domain_email_id)
+    ))
+
+    return PlanArrays(
+        account_ids, providers, account_load, last_used, provider_load,
+        served_keys, domain_email_ids, domain_email_load,
+    )
+
+
+# ── Planning ─────────────────────────────────────────────────────────────────
+
+def _fill(load: "np.ndarray", capacity: "np.ndarray", demand: int, order: "np.ndarray") -> "np.ndarray":
+    """
+    Water-filling: how many of demand units each slot takes (at most its
+    capacity) so that the least-loaded slots are raised to a common level.
+    Ties on the last level go to the slots first in order.
+    """
+    if demand <= 0 or not len(load):
+        return np.zeros(len(load), dtype=np.int32)
+    if demand >= capacity.sum():
+        return capacity.copy()
+
+    # Smallest level whose fill covers demand
+    lo, hi = int(load.min()), int((load + capacity).max())
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if np.clip(mid - load, 0, capacity).sum() >= demand:
+            hi = mid
+        else:
+            lo = mid + 1
+
+    counts = np.clip(lo - 1 - load, 0, capacity)
+    step = (load + counts == lo - 1) & (counts < capacity)
+    counts[order[step[order]][: demand - int(counts.sum())]] += 1
+    return counts
+
+
+def plan_arrays(state: PlanArrays, demand: dict):
+    """Plan today's sends from loaded arrays. Returns a warming_engine.DailyPlan."""
+    from .warming_engine import ACCOUNT_DAILY_CAP, PROVIDER_DAILY_CAPS, DailyPlan
+
+    demand = {campaign_id: int(n) for campaign_id, n in demand.items() if n > 0}
+    n = len(state.account_ids)
+    if not demand or not n or not len(state.domain_email_ids):
+        return DailyPlan({}, demand)
+
+    rng = np.random.default_rng()
+    load = state.account_load
+
+    # Each account sends at most once per campaign and up to the daily cap
+    capacity = np.full(n, len(demand), dtype=np.int32)
+    if ACCOUNT_DAILY_CAP:
+        capacity = np.minimum(capacity, np.maximum(ACCOUNT_DAILY_CAP - load, 0)).astype(np.int32)
+    # Within a load level: least recently used first, random among equals
+    shuffled = rng.permutation(n)
+    by_rank = shuffled[np.argsort(state.last_used[shuffled], kind="stable")]
+    del shuffled
+
+    campaign_ids = np.array(sorted(demand, key=lambda c: -demand[c]), dtype=np.int64)
+    wanted = np.minimum([demand[c] for c in campaign_ids.tolist()], int((capacity > 0).sum())).astype(np.int32)
+    sends = _fill(load, capacity, int(wanted.sum()), by_rank)
+
+    # Cap providers at their fair share, then spread the rest over the others
+    over = True
+    while over:
+        over = False
+        for provider, cap in PROVIDER_DAILY_CAPS.items():
+            if provider not in PROVIDER_CODES:
+                continue
+            mask = state.providers == PROVIDER_CODES[provider]
+            allowed = max(0, cap - state.provider_load.get(provider, 0))
+            if sends[mask].sum() > allowed:
+                capacity[mask] = _fill(load, np.where(mask, capacity, 0), allowed, by_rank)[mask]
+                over = True
+        if over:
+            sends = _fill(load, capacity, int(wanted.sum()), by_rank)
+
+    # Less supply than demand: campaigns are cut back evenly
+    supply = int(sends.sum())
+    if supply < wanted.sum():
+        wanted = _fill(np.zeros(len(wanted), dtype=np.int32), wanted, supply, np.arange(len(wanted)))
+
+    # Deal campaigns (largest first) over the sends round by round: round r
+    # holds every account with more than r sends, always in the same order,
+    # so consecutive units of a campaign land on different accounts
+    order = by_rank[sends[by_rank] > 0]
+    order = order[np.argsort(-sends[order], kind="stable")]
+    per_account = sends[order]
+    slot_rounds = np.arange(supply) - np.repeat(np.cumsum(per_account) - per_account, per_account)
+    slot_accounts = np.repeat(order, per_account)[np.argsort(slot_rounds, kind="stable")]
+    slot_campaigns = np.repeat(campaign_ids, wanted)
+
+    account_ids = state.account_ids[slot_accounts]
+    keys = account_ids * CAMPAIGN_KEY + slot_campaigns
+    _, first = np.unique(keys, return_index=True)
+    ok = np.zeros(supply, dtype=bool)
+    ok[first] = True
+    ok &= ~np.isin(keys, state.served_keys)
+
+    # Least-loaded domain emails, shuffled onto the sends
+    domain_email_counts = _fill(
+        state.domain_email_load,
+        np.full(len(state.domain_email_ids), supply, dtype=np.int32),
+        int(ok.sum()),
+        rng.permutation(len(state.domain_email_ids)),
+    )
+    domain_emails = np.repeat(state.domain_email_ids, domain_email_counts)
+    rng.shuffle(domain_emails)
+
+    # Group the sends by account: one slice of (domain_email_id, campaign_id) each
+    kept = np.flatnonzero(ok)
+    kept = kept[np.argsort(slot_accounts[kept], kind="stable")]
+    targets = list(zip(domain_emails.tolist(), slot_campaigns[kept].tolist()))
+    kept_accounts = slot_accounts[kept]
+    starts = np.flatnonzero(np.r_[True, kept_accounts[1:] != kept_accounts[:-1]]) if len(kept) else kept
+    ends = np.append(starts[1:], len(kept))
+    plan: dict[int, list[tuple[int, int]]] = {
+        account_id: targets[start:end]
+        for account_id, start, end in zip(
+            state.account_ids[kept_accounts[starts]].tolist(), starts.tolist(), ends.tolist()
+        )
+    }
+
+    shortfall = {
+        campaign_id: demand[campaign_id] - planned
+        for campaign_id, planned in zip(campaign_ids.tolist(), wanted.tolist())
+        if demand[campaign_id] > planned
+    }
+    if not ok.all():
+        dropped_accounts = np.bincount(slot_accounts[~ok], minlength=n)
+        residual = _replan(
+            state, plan, slot_campaigns[~ok], capacity - sends + dropped_accounts,
+            load + sends - dropped_accounts, domain_email_counts, by_rank,
+        )
+        for account_id, targets in residual.sends.items():
+            plan.setdefault(account_id, []).extend(targets)
+        for campaign_id, missing in residual.shortfall.items():
+            shortfall[campaign_id] = shortfall.get(campaign_id, 0) + missing
+
+    return DailyPlan(plan, shortfall)
+
+
+def _replan(state: PlanArrays, plan: dict, campaigns: "np.ndarray", spare, load, domain_email_counts, by_rank):
+    """Plan dropped sends with warming_engine.plan_sends on the best spare accounts."""
+    from .warming_engine import PlanningState, plan_sends
+
+    ids, counts = np.unique(campaigns, return_counts=True)
+    demand = dict(zip(ids.tolist(), counts.tolist()))
+    # Least-loaded spare accounts in rank order
+    candidates = by_rank[spare[by_rank] > 0]
+    candidates = candidates[np.argsort(load[candidates], kind="stable")][: 4 * int(counts.sum()) + 1000]
+    candidate_ids = set(state.account_ids[candidates].tolist())
+
+    served = {campaign_id: set() for campaign_id in demand}
+    for key in state.served_keys.tolist():
+        account_id, campaign_id = divmod(key, CAMPAIGN_KEY)
+        if campaign_id in served and account_id in candidate_ids:
+            served[campaign_id].add(account_id)
+    for account_id in candidate_ids & plan.keys():
+        for _, campaign_id in plan[account_id]:
+            if campaign_id in served:
+                served[campaign_id].add(account_id)
+
+    provider_load = dict(state.provider_load)
+    for code, n in enumerate(np.bincount(state.providers, weights=load - state.account_load, minlength=len(PROVIDERS))):
+        provider_load[PROVIDERS[code]] = provider_load.get(PROVIDERS[code], 0) + int(n)
+
+    return plan_sends(PlanningState(
+        demand=demand,
+        accounts=[(int(state.account_ids[i]), PROVIDERS[state.providers[i]]) for i in candidates],
+        account_load={int(state.account_ids[i]): int(load[i]) for i in candidates},
+        provider_load=provider_load,
+        served=served,
+        domain_email_ids=state.domain_email_ids.tolist(),
+        domain_email_load=dict(zip(
+            state.domain_email_ids.tolist(), (state.domain_email_load + domain_email_counts).tolist()
+        )),
+    ))
+
+
+def plan_daily(db: Session, demand: dict):
+    """Load today's state and plan all campaigns' sends (warming_engine.DailyPlan)."""
+    return plan_arrays(load_plan_arrays(db, demand.keys()), demand)
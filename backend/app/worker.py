@@ -1,17 +1,29 @@
 """
 RQ Worker entry point.
 Run with: python -m app.worker
+
+Jobs run in the worker process itself (SimpleWorker) so that the pooled
+SMTP and IMAP sessions in email_service survive from one job to the next. Set
+WORKER_FORK=1 to fall back to RQ's fork-per-job worker.
 """
 
+import atexit
 import os
 
 import redis
-from rq import Worker, Queue
+from rq import SimpleWorker, Worker, Queue
 
 REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+WORKER_FORK = os.environ.get("WORKER_FORK", "0") == "1"
 conn = redis.from_url(REDIS_URL)
 
 if __name__ == "__main__":
+    from .email_service import imap_pool, smtp_pool
+
+    atexit.register(smtp_pool.close_all)
+    atexit.register(imap_pool.close_all)
+
     queues = [Queue(connection=conn)]
-    worker = Worker(queues, connection=conn)
+    worker_cls = Worker if WORKER_FORK else SimpleWorker
+    worker = worker_cls(queues, connection=conn)
     worker.work()
@@ -33,6 +33,30 @@ const authColors: Record<string, string> = {
   password: "text-gray-400",
 };
 
+interface JobProgress {
+  total?: number;
+  done?: number;
+  ok?: number;
+  processed?: number;
+  created?: number;
+  failed?: number;
+  rows_per_sec?: number;
+}
+
+// Poll GET /jobs/{id} until the background job finishes; returns its result
+async function pollJob(jobId: string, onProgress: (p: JobProgress) => void): Promise<any> {
+  while (true) {
+    await new Promise((resolve) => setTimeout(resolve, 1500));
+    const res = await fetch(`${API}/jobs/${jobId}`, { headers: authHeader() });
+    const job = await res.json();
+    if (job.progress) onProgress(job.progress);
+    if (job.status === "finished") return job.result;
+    if (job.status === "failed" || job.status === "stopped" || job.status === "canceled" || !res.ok) {
+      throw new Error(job.error || job.detail || "Job fehlgeschlagen");
+    }
+  }
+}
+
 function Badge({ label, count, color }: { label: string; count: number; color: string }) {
   return (
     <div className="bg-gray-900 border border-gray-800 rounded-lg px-4 py-3 text-center">
@@ -52,10 +76,14 @@ export default function AccountsPage() {
   const [pasteInput, setPasteInput] = useState("");
   const [autoOAuth2, setAutoOAuth2] = useState(true);
   const [importResult, setImportResult] = useState<any>(null);
+  const [importProgress, setImportProgress] = useState<JobProgress | null>(null);
   const [bulkOAuth2Running, setBulkOAuth2Running] = useState(false);
   const [bulkOAuth2Result, setBulkOAuth2Result] = useState<any>(null);
+  const [bulkOAuth2Progress, setBulkOAuth2Progress] = useState<JobProgress | null>(null);
   const [testingId, setTestingId] = useState<number | null>(null);
   const [testResult, setTestResult] = useState<Record<number, any>>({});
+  const [bulkTesting, setBulkTesting] = useState(false);
+  const [bulkTestProgress, setBulkTestProgress] = useState<JobProgress | null>(null);
   const [showAddForm, setShowAddForm] = useState(false);
   const [newAcc, setNewAcc] = useState({ email: "", password: "", provider: "outlook" });
   const [addError, setAddError] = useState("");
@@ -85,10 +113,14 @@ export default function AccountsPage() {
       const res = await fetch(`${API}/accounts/import?auto_oauth2=${autoOAuth2}`, {
         method: "POST", headers: authHeader(), body: formData,
       });
-      setImportResult(await res.json());
-      fetchAccounts();
+      const { job_id } = await res.json();
+      setImportResult(await pollJob(job_id, setImportProgress));
+    } catch (e: any) {
+      setImportResult({ created: 0, errors: [e.message] });
     } finally {
       setCsvImporting(false);
+      setImportProgress(null);
+      fetchAccounts();
       if (fileRef.current) fileRef.current.value = "";
     }
   };
@@ -105,22 +137,33 @@ export default function AccountsPage() {
         headers: { ...authHeader(), "Content-Type": "application/json" },
         body: JSON.stringify({ lines: pasteInput }),
       });
-      setImportResult(await res.json());
+      const { job_id } = await res.json();
       setPasteInput("");
-      fetchAccounts();
+      setImportResult(await pollJob(job_id, setImportProgress));
+    } catch (e: any) {
+      setImportResult({ created: 0, errors: [e.message] });
     } finally {
       setTxtImporting(false);
+      setImportProgress(null);
+      fetchAccounts();
     }
   };
 
   const runBulkOAuth2 = async () => {
     setBulkOAuth2Running(true);
     setBulkOAuth2Result(null);
+    setBulkOAuth2Progress(null);
     try {
       const res = await fetch(`${API}/accounts/bulk-oauth2`, { method: "POST", headers: authHeader() });
-      setBulkOAuth2Result(await res.json());
+      const { job_id } = await res.json();
+      setBulkOAuth2Result(await pollJob(job_id, setBulkOAuth2Progress));
+    } catch (e: any) {
+      setBulkOAuth2Result({ processed: 0, results: [], error: e.message });
+    } finally {
+      setBulkOAuth2Running(false);
+      setBulkOAuth2Progress(null);
       fetchAccounts();
-    } finally { setBulkOAuth2Running(false); }
+    }
   };
 
   const toggleSelect = (id: number) => {
@@ -152,6 +195,48 @@ export default function AccountsPage() {
     fetchAccounts();
   };
 
+  // Runs POST /accounts/bulk-test as a background job and streams its NDJSON results into testResult
+  const bulkTest = async (deactivate: boolean) => {
+    setBulkTesting(true);
+    setBulkTestProgress(null);
+    const total = selected.size;
+    try {
+      const res = await fetch(`${API}/accounts/bulk-test?deactivate=${deactivate}`, {
+        method: "POST",
+        headers: { ...authHeader(), "Content-Type": "application/json" },
+        body: JSON.stringify(Array.from(selected)),
+      });
+      const { job_id } = await res.json();
+      const stream = await fetch(`${API}/accounts/bulk-test/${job_id}/results`, { headers: authHeader() });
+      const reader = stream.body!.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let done = 0;
+      while (true) {
+        const chunk = await reader.read();
+        if (chunk.done) break;
+        buffer += decoder.decode(chunk.value, { stream: true });
+        const lines = buffer.split("\n");
+        buffer = lines.pop() || "";
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const r = JSON.parse(line);
+          setTestResult((p) => ({ ...p, [r.id]: r }));
+          done += 1;
+        }
+        setBulkTestProgress({ done, total });
+      }
+      const job = await (await fetch(`${API}/jobs/${job_id}`, { headers: authHeader() })).json();
+      if (job.status === "failed") throw new Error(job.error || "Job fehlgeschlagen");
+    } catch (e: any) {
+      alert(`Verbindungstest fehlgeschlagen: ${e.message}`);
+    } finally {
+      setBulkTesting(false);
+      setBulkTestProgress(null);
+      if (deactivate) fetchAccounts();
+    }
+  };
+
   const testConnection = async (id: number) => {
     setTestingId(id);
     try {
@@ -260,13 +345,23 @@ export default function AccountsPage() {
       </div>
 
 
+      {/* Import progress */}
+      {importProgress && (
+        <div className="mb-4 p-3 rounded-lg border border-blue-800 bg-blue-900/20 text-sm flex gap-5">
+          <span className="text-gray-300">{importProgress.processed} Zeilen verarbeitet</span>
+          <span className="text-green-400">{importProgress.created} importiert</span>
+          {!!importProgress.failed && <span className="text-red-400">{importProgress.failed} Fehler</span>}
+          {importProgress.rows_per_sec && <span className="text-gray-500">{importProgress.rows_per_sec} Zeilen/s</span>}
+        </div>
+      )}
+
       {/* Import result */}
       {importResult && (
         <div className={`mb-4 p-4 rounded-lg border text-sm ${importResult.errors?.length > 0 ? "bg-yellow-900/20 border-yellow-700" : "bg-green-900/20 border-green-700"}`}>
           <div className="flex gap-5 mb-1">
             <span className="text-green-400 font-bold">{importResult.created} importiert</span>
             {importResult.oauth2_tokens_fetched > 0 && <span className="text-blue-400">{importResult.oauth2_tokens_fetched}x OAuth2</span>}
-            {importResult.errors?.length > 0 && <span className="text-red-400">{importResult.errors.length} Fehler</span>}
+            {importResult.errors?.length > 0 && <span className="text-red-400">{importResult.failed ?? importResult.errors.length} Fehler</span>}
           </div>
           {importResult.errors?.slice(0, 5).map((e: string, i: number) => <p key={i} className="text-red-400 text-xs">{e}</p>)}
         </div>
@@ -314,13 +409,16 @@ export default function AccountsPage() {
         </div>
         <button onClick={runBulkOAuth2} disabled={bulkOAuth2Running}
           className="bg-blue-600 hover:bg-blue-700 disabled:opacity-50 text-white text-sm px-4 py-2 rounded flex-shrink-0">
-          {bulkOAuth2Running ? "Läuft..." : "Batch starten"}
+          {bulkOAuth2Running
+            ? bulkOAuth2Progress ? `${bulkOAuth2Progress.done}/${bulkOAuth2Progress.total}` : "Läuft..."
+            : "Batch starten"}
         </button>
       </div>
 
       {bulkOAuth2Result && (
         <div className="mb-4 bg-gray-900 border border-gray-800 rounded-lg p-3 text-xs">
           <p className="font-medium mb-2 text-gray-300">{bulkOAuth2Result.processed} verarbeitet:</p>
+          {bulkOAuth2Result.error && <p className="text-red-400 mb-2">{bulkOAuth2Result.error}</p>}
           <div className="grid grid-cols-2 gap-1 max-h-40 overflow-y-auto">
             {bulkOAuth2Result.results?.map((r: any, i: number) => (
               <div key={i} className={`flex items-center gap-2 ${r.status === "ok" ? "text-green-400" : "text-red-400"}`}>
@@ -350,6 +448,12 @@ export default function AccountsPage() {
           <span className="text-sm text-blue-300 font-medium">{selected.size} ausgewählt</span>
           <button onClick={() => bulkToggle(true)} className="text-xs bg-green-700 hover:bg-green-600 text-white px-3 py-1 rounded">Aktivieren</button>
           <button onClick={() => bulkToggle(false)} className="text-xs bg-yellow-700 hover:bg-yellow-600 text-white px-3 py-1 rounded">Deaktivieren</button>
+          <button onClick={() => bulkTest(false)} disabled={bulkTesting} className="text-xs bg-blue-700 hover:bg-blue-600 disabled:opacity-50 text-white px-3 py-1 rounded">
+            {bulkTesting
+              ? bulkTestProgress ? `${bulkTestProgress.done}/${bulkTestProgress.total}` : "Teste..."
+              : "Verbindung testen"}
+          </button>
+          <button onClick={() => bulkTest(true)} disabled={bulkTesting} className="text-xs bg-blue-900 hover:bg-blue-800 disabled:opacity-50 text-white px-3 py-1 rounded">Testen + Fehler deaktivieren</button>
           <button onClick={bulkDelete} className="text-xs bg-red-800 hover:bg-red-700 text-white px-3 py-1 rounded">Löschen</button>
           <button onClick={() => setSelected(new Set())} className="text-xs text-gray-400 hover:text-gray-200 ml-auto">Auswahl aufheben</button>
         </div>
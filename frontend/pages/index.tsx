@@ -53,6 +53,16 @@ interface DomainRep {
   score_label: string;
 }
 
+interface RepSnapshot {
+  domain_id: number | null;
+  score: number;
+  previous_score: number | null;
+  newly_listed: string[];
+  delisted: string[];
+  scanned_at: string;
+  report: DomainRep | null;
+}
+
 interface Domain {
   id: number;
   name: string;
@@ -216,6 +226,7 @@ export default function Dashboard() {
   const [daily, setDaily] = useState<DailyPoint[]>([]);
   const [domains, setDomains] = useState<Domain[]>([]);
   const [reps, setReps] = useState<Record<number, DomainRep>>({});
+  const [snapshots, setSnapshots] = useState<Record<number, RepSnapshot>>({});
   const [loadingRep, setLoadingRep] = useState<number | null>(null);
   const [loading, setLoading] = useState(true);
 
@@ -228,24 +239,27 @@ export default function Dashboard() {
 
   const fetchAll = async () => {
     try {
-      const [sRes, dRes, domRes] = await Promise.all([
+      const [sRes, dRes, domRes, snapRes] = await Promise.all([
         fetch(`${API}/dashboard/stats`, { headers: authHeader() }),
         fetch(`${API}/dashboard/daily-stats?days=14`, { headers: authHeader() }),
         fetch(`${API}/domains`, { headers: authHeader() }),
+        fetch(`${API}/reputation/latest?kind=domain`, { headers: authHeader() }),
       ]);
       if (sRes.status === 401) { router.push("/login"); return; }
       setStats(await sRes.json());
       setDaily(await dRes.json());
       setDomains(await domRes.json());
+      const latest: RepSnapshot[] = await snapRes.json();
+      setSnapshots(Object.fromEntries(latest.map((snap) => [snap.domain_id, snap])));
     } finally {
       setLoading(false);
     }
   };
 
-  const checkReputation = async (domain: Domain) => {
+  const checkReputation = async (domain: Domain, refresh = false) => {
     setLoadingRep(domain.id);
     try {
-      const res = await fetch(`${API}/domains/${domain.id}/reputation`, { headers: authHeader() });
+      const res = await fetch(`${API}/domains/${domain.id}/reputation${refresh ? "?refresh=true" : ""}`, { headers: authHeader() });
       const data = await res.json();
       setReps((prev) => ({ ...prev, [domain.id]: data }));
     } finally {
@@ -343,7 +357,9 @@ export default function Dashboard() {
         ) : (
           <div className="space-y-4">
             {domains.map((domain) => {
-              const rep = reps[domain.id];
+              const snap = snapshots[domain.id];
+              // Live check result, otherwise the last scheduled scan
+              const rep = reps[domain.id] || snap?.report;
               return (
                 <div key={domain.id} className="border border-gray-800 rounded-lg p-4">
                   <div className="flex items-center justify-between mb-3">
@@ -352,7 +368,7 @@ export default function Dashboard() {
                       {rep && <ScoreGauge score={rep.score} label={rep.score_label} />}
                     </div>
                     <button
-                      onClick={() => checkReputation(domain)}
+                      onClick={() => checkReputation(domain, !!reps[domain.id])}
                       disabled={loadingRep === domain.id}
                       className="text-xs bg-blue-700 hover:bg-blue-600 disabled:opacity-50 text-white px-3 py-1.5 rounded transition-colors"
                     >
@@ -360,6 +376,23 @@ export default function Dashboard() {
                     </button>
                   </div>
 
+                  {snap && (
+                    <div className="flex flex-wrap items-center gap-2 text-xs text-gray-500 mb-3">
+                      <span>Letzter Scan: {new Date(snap.scanned_at).toLocaleString("de-DE")}</span>
+                      {snap.previous_score !== null && snap.previous_score !== snap.score && (
+                        <span className={snap.score > snap.previous_score ? "text-green-400" : "text-red-400"}>
+                          Score {snap.previous_score} → {snap.score}
+                        </span>
+                      )}
+                      {snap.newly_listed.length > 0 && (
+                        <span className="text-red-400">Neu gelistet: {snap.newly_listed.join(", ")}</span>
+                      )}
+                      {snap.delisted.length > 0 && (
+                        <span className="text-green-400">Entfernt: {snap.delisted.join(", ")}</span>
+                      )}
+                    </div>
+                  )}
+
                   {rep && (
                     <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
                       {/* DNS records */}